@@ -10,203 +10,976 @@ Description:
 家庭物品管理应用后端服务
 功能：读取CSV数据，提供物品展示接口
 """
-from flask import Flask, render_template, abort, request, jsonify
-import pandas as pd
+from flask import Blueprint, Flask, Response, before_render_template, current_app, g, has_request_context, make_response, render_template, abort, request, jsonify, send_from_directory, stream_with_context, template_rendered
+from functools import wraps
+from markupsafe import Markup
 import os
-from werkzeug.utils import secure_filename
-from utils.image_processor import compress_and_convert_to_webp, get_webp_path
-from utils.item_manager import ItemCategory
+import time
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import is_resource_modified
+from werkzeug.local import LocalProxy
+from utils.http_cache import FragmentCache, asset_version, compress_response, data_etag, last_modified
+from utils.image_processor import webp_outputs_exist, VARIANT_WIDTHS
+from utils import metrics
+from utils.image_jobs import ImageJobQueue
+from utils.image_watcher import ImageWatcher
+from utils.image_store import STORE_TYPE, get_store_dir, image_url, is_stored_name, original_image_url, resolve_image
+from utils.tenants import BUILTIN_CATEGORIES, collection_item_types
+from utils.uploads import UploadError, UploadStore
+from utils.warmup import WarmUp
+# 依赖 pandas 的数据模块（item_manager、search_index、stats_service、rollups、bulk_io）
+# 在创建收藏（tenants.Tenant）和用到的路由中导入，导入 app 时不加载
 
-app = Flask(__name__)
+# 列表页首屏及分页接口默认每页数量，接口单页上限
+LIST_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
 
-# 创建物品类别实例
-figures_category = ItemCategory('figures', app)
-clothing_category = ItemCategory('clothing', app)
-goods_category = ItemCategory('goods', app)
+# 哈希命名的图片内容不会变化，允许浏览器永久缓存
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# 表单中除图片外其他字段允许的大小
+FORM_FIELDS_MAX_SIZE = 1024 * 1024
+
+# 增量同步单次返回的最大物品数，超过时由客户端重新加载
+MAX_SYNC_ITEMS = 200
+
+# conditional 的参数，表示页面依赖当前收藏的全部类别
+ALL_CATEGORIES = '*'
+
+bp = Blueprint('main', __name__)
+
+# 当前进程的服务实例，由 create_app 创建。
+# 每个 worker 进程各自调用 create_app，类别管理器、图片转换队列、搜索索引都不跨进程共享，
+# 进程间通过存储签名感知其他 worker 的写入，写入由文件锁串行化
+image_jobs = None
+image_watcher = None
+tenants = None  # 收藏注册表，见 utils.tenants
+fragment_cache = None  # 表格行等渲染片段
+upload_store = None  # 分块上传会话
+warm_up = None  # 启动预热进度
+
+# 不等待预热的端点：存活、就绪检查、Service Worker 脚本和静态文件
+WARM_UP_EXEMPT = ('main.healthz', 'main.readyz', 'main.service_worker', 'static')
+# 与收藏无关、不选择收藏的端点：以上端点、内容寻址图片和指标
+TENANT_EXEMPT = WARM_UP_EXEMPT + ('main.stored_image', 'main.metrics_endpoint')
+
+
+def current_tenant():
+    """
+    获取当前请求的收藏，请求之外（预热、图片目录检查）为默认收藏
+    
+    返回:
+        Tenant: 收藏
+    """
+    if has_request_context() and 'tenant' in g:
+        return g.tenant
+    return tenants.default
+
+# 当前收藏的类别管理器（物品类型 -> ItemCategory）和搜索索引，用法与字典、SearchIndex 相同
+category_map = LocalProxy(lambda: current_tenant().categories)
+search_index = LocalProxy(lambda: current_tenant().search_index)
+
+def create_app(config=None):
+    """
+    创建应用实例
+    
+    每个进程调用一次：gunicorn 中使用 'app:create_app()'，开发时直接运行 app.py。
+    配置可通过参数或 FLASK_ 前缀的环境变量传入，如 FLASK_IMAGE_WORKERS=2
+    
+    参数:
+        config (dict): 配置项，可选
+            IMAGE_WORKERS (int): 图片转换进程数，默认为CPU核数
+            IMAGE_PROFILE (str): 图片编码档案(fast/balanced/small/cutout)，默认照片使用 balanced，
+                透明图片使用 cutout
+            SCAN_IMAGES (bool): 是否监视图片目录并转换新增或被替换的图片，默认True
+            IMAGE_WATCH_INTERVAL (float): 图片目录检查间隔秒数，默认30，为0时只在启动时检查一次
+            METRICS_ENABLED (bool): 是否开启耗时埋点、Server-Timing 响应头和 /metrics，默认True
+            COMPRESS_RESPONSES (bool): 是否对页面和接口响应进行 gzip/brotli 压缩，默认True，
+                由反向代理压缩时可关闭
+            ASSET_VERSION (str): 模板版本，参与ETag计算，默认按模板目录的最新修改时间计算
+            MAX_IMAGE_UPLOAD (int): 单张图片的最大字节数，默认50MB
+            UPLOAD_CHUNK_MAX_SIZE (int): 分块上传时每块的最大字节数，默认8MB
+            UPLOAD_DIR (str): 未完成的分块上传所在目录，需与静态文件目录在同一文件系统，默认 data/uploads
+            WARM_UP (str): 启动预热方式，默认 background
+                background: 在后台线程中导入数据模块、创建类别管理器并预先加载数据缓存、搜索索引、
+                    价格统计和资产汇总，然后检查图片目录，create_app 立即返回；
+                    初始化完成前到达的请求最多等待 WARM_UP_TIMEOUT 秒，/readyz 在全部完成后返回200
+                sync: 在 create_app 中完成全部预热后返回
+                off: 在 create_app 中只创建服务实例，缓存在首次请求时构建
+            WARM_UP_TIMEOUT (float): 请求等待初始化的最长秒数，超时返回503，默认30
+            TENANT_ROOT (str): 托管的其他收藏所在目录，每个收藏为其下的 <收藏ID>/ 子目录，
+                包含 collection.json（名称和自定义类别，见 tenants.load_collection）和各类别数据，
+                可用 python -m utils.tenants create 创建；默认 data/collections
+            TENANT_HEADER (str): 指定收藏ID的请求头，默认 X-Collection，未提供时使用默认收藏（data/ 目录）。
+                请求头由反向代理按登录用户或域名设置，并丢弃客户端发送的同名请求头
+            TENANT_RESOLVER (callable): 自定义收藏选择，参数为 request，返回收藏ID，设置后不使用 TENANT_HEADER
+            TENANT_MEMORY_BUDGET (int): 默认收藏以外已加载收藏的估算内存上限（字节），默认256MB
+            MAX_LOADED_TENANTS (int): 默认收藏以外同时加载的收藏数上限，默认32
+            
+    返回:
+        Flask: 应用实例
+    """
+    global image_jobs, fragment_cache, upload_store, warm_up
+    
+    app = Flask(__name__)
+    app.config.update(IMAGE_WORKERS=None, IMAGE_PROFILE=None, SCAN_IMAGES=True, IMAGE_WATCH_INTERVAL=30,
+                      METRICS_ENABLED=True, COMPRESS_RESPONSES=True, ASSET_VERSION=None,
+                      MAX_IMAGE_UPLOAD=50 * 1024 * 1024, UPLOAD_CHUNK_MAX_SIZE=8 * 1024 * 1024,
+                      UPLOAD_DIR=os.path.join('data', 'uploads'), WARM_UP='background', WARM_UP_TIMEOUT=30,
+                      TENANT_ROOT=os.path.join('data', 'collections'), TENANT_HEADER='X-Collection',
+                      TENANT_RESOLVER=None, TENANT_MEMORY_BUDGET=256 * 1024 * 1024, MAX_LOADED_TENANTS=32)
+    app.config.from_prefixed_env()
+    if config:
+        app.config.update(config)
+    
+    # 关闭埋点时不注册请求钩子，埋点函数直接返回
+    metrics.configure(app.config['METRICS_ENABLED'])
+    if app.config['METRICS_ENABLED']:
+        app.before_request(start_request_timing)
+        app.after_request(add_server_timing)
+        before_render_template.connect(start_render_timing, app)
+        template_rendered.connect(end_render_timing, app)
+    if app.config['COMPRESS_RESPONSES']:
+        app.after_request(compress)
+    if not app.config['ASSET_VERSION']:
+        app.config['ASSET_VERSION'] = asset_version(os.path.join(app.root_path, app.template_folder))
+    
+    # 模板中生成 srcset 所需的宽度档位
+    app.jinja_env.globals['image_variant_widths'] = VARIANT_WIDTHS
+    app.jinja_env.globals['image_url'] = image_url
+    app.jinja_env.globals['original_image_url'] = original_image_url
+    app.jinja_env.globals['current_collection'] = current_tenant
+    
+    # 后台图片转换队列
+    image_jobs = ImageJobQueue(app.config['IMAGE_WORKERS'], app.config['IMAGE_PROFILE'])
+    fragment_cache = FragmentCache()
+    upload_store = UploadStore(app.config['UPLOAD_DIR'], app.static_folder, app.config['MAX_IMAGE_UPLOAD'])
+    
+    app.register_blueprint(bp)
+    app.before_request(wait_for_warm_up)
+    app.before_request(select_tenant)
+    app.after_request(vary_by_tenant)
+    app.teardown_request(trim_tenants)
+    
+    mode = app.config['WARM_UP']
+    if mode not in ('background', 'sync', 'off'):
+        raise ValueError(f"未知的预热方式: {mode}")
+    warm_up = WarmUp(lambda: init_services(app), warm_up_steps(app) if mode != 'off' else ())
+    if mode == 'background':
+        warm_up.start()
+    else:
+        warm_up.run()
+        # 不预热时图片目录检查不计入就绪，仍在 create_app 中执行
+        if mode == 'off' and app.config['SCAN_IMAGES']:
+            check_and_convert_images(app)
+    return app
+
+def init_services(app):
+    """
+    创建收藏注册表及默认收藏的类别实例和搜索索引
+    
+    数据相关模块依赖 pandas 和 numpy，导入耗时占进程启动的大部分，在这里才导入，
+    后台预热时不阻塞 create_app
+    
+    参数:
+        app (Flask): 应用实例
+    """
+    global tenants
+    from utils.tenants import TenantRegistry
+    
+    tenants = TenantRegistry(app.config['TENANT_ROOT'], app, image_jobs,
+                             memory_budget=int(app.config['TENANT_MEMORY_BUDGET']),
+                             max_tenants=int(app.config['MAX_LOADED_TENANTS']))
+
+def warm_up_steps(app):
+    """
+    预热步骤：预先构建首个请求需要的缓存
+    
+    参数:
+        app (Flask): 应用实例
+    
+    返回:
+        list: (步骤名, 无参数函数) 列表
+    """
+    def load_data():
+        for category in category_map.values():
+            category.load_data()
+    
+    def build_stats():
+        for category in category_map.values():
+            category.calculate_price_stats()
+            category.portfolio_rollup()
+    
+    steps = [
+        ('data', load_data),
+        ('search_index', lambda: search_index.warm()),
+        ('stats', build_stats)
+    ]
+    # 启动时检查一次图片目录并开始监视，多个 worker 中只有一个执行
+    if app.config['SCAN_IMAGES']:
+        steps.append(('images', lambda: check_and_convert_images(app)))
+    return steps
+
+def wait_for_warm_up():
+    """请求开始前等待服务初始化完成，超时或初始化失败时返回503"""
+    if request.endpoint in WARM_UP_EXEMPT or warm_up.wait(current_app.config['WARM_UP_TIMEOUT']):
+        return None
+    response = jsonify({'success': False, 'message': '服务正在启动，请稍后重试'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+def select_tenant():
+    """请求开始前按请求头或自定义规则选择收藏，收藏不存在时返回404"""
+    if request.endpoint in TENANT_EXEMPT:
+        return None
+    resolver = current_app.config['TENANT_RESOLVER']
+    tenant_id = resolver(request) if resolver else request.headers.get(current_app.config['TENANT_HEADER'])
+    try:
+        tenant = tenants.get(tenant_id)
+    except ValueError as e:
+        print(f"加载收藏失败: {str(e)}")
+        return jsonify({'success': False, 'message': '收藏配置无效'}), 500
+    if tenant is None:
+        return jsonify({'success': False, 'message': '收藏不存在'}), 404
+    g.tenant = tenant
+    return None
+
+def vary_by_tenant(response):
+    """按请求头选择收藏时，同一URL的响应随请求头变化，浏览器和代理缓存需区分"""
+    if 'tenant' in g and not current_app.config['TENANT_RESOLVER']:
+        response.vary.add(current_app.config['TENANT_HEADER'])
+    return response
+
+def trim_tenants(exc=None):
+    """请求结束后按收藏数上限和内存预算移出最久未使用的收藏"""
+    tenant = g.get('tenant')
+    if tenant is not None and tenant is not tenants.default:
+        tenants.trim()
+
+def start_request_timing():
+    """请求开始时记录时间，并开始收集各阶段耗时"""
+    g.request_started = time.perf_counter()
+    metrics.begin_request()
+
+def add_server_timing(response):
+    """请求结束时记录总耗时，并通过 Server-Timing 响应头返回各阶段耗时"""
+    spans = metrics.end_request()
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    metrics.observe('request_duration_seconds', total,
+                    endpoint=request.endpoint or 'none', method=request.method)
+    response.headers['Server-Timing'] = metrics.server_timing(spans, total)
+    return response
+
+def start_render_timing(sender, template, context, **extra):
+    """模板渲染开始，支持嵌套渲染"""
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+def end_render_timing(sender, template, context, **extra):
+    """模板渲染结束，按模板名记录耗时，如 render.figures.list"""
+    started = g.get('render_started')
+    if not started:
+        return
+    name = os.path.splitext(template.name or 'template')[0].replace('/', '.')
+    metrics.record_span(f'render.{name}', time.perf_counter() - started.pop())
+
+def compress(response):
+    """按 Accept-Encoding 压缩响应"""
+    return compress_response(response, request.accept_encodings)
+
+def conditional(item_types=None):
+    """
+    条件请求装饰器
+    
+    根据页面依赖的物品类别的存储签名生成 ETag 和 Last-Modified，
+    客户端缓存仍然有效时直接返回304，不加载数据也不渲染模板。
+    响应使用 no-cache，浏览器每次都会带上 If-None-Match 重新验证
+    
+    参数:
+        item_types (tuple): 页面依赖的物品类型，为None时使用路由参数 item_type，
+            为 ALL_CATEGORIES 时为当前收藏的全部类别；当前收藏没有其中的类别时返回404
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if item_types == ALL_CATEGORIES:
+                types = tuple(category_map)
+            else:
+                types = item_types or (kwargs.get('item_type'),)
+            if any(item_type not in category_map for item_type in types):
+                abort(404)
+            signatures = [category_map[item_type].storage.signature() for item_type in types]
+            # 不同收藏的同一URL是不同的资源
+            etag = data_etag(current_app.config['ASSET_VERSION'],
+                             f'{current_tenant().id}:{request.full_path}', signatures)
+            modified = last_modified(signatures)
+            
+            not_modified = not is_resource_modified(request.environ, etag=etag, last_modified=modified)
+            metrics.count_cache('http_conditional', not_modified)
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.last_modified = modified
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def category_template(item_type, name):
+    """
+    获取类别页面的模板，内置类别使用各自目录下的模板，自定义类别使用 collection/ 下的通用模板
+    
+    参数:
+        item_type (str): 物品类型
+        name (str): 页面名，如 'list'、'rows'、'detail'、'new'
+        
+    返回:
+        str: 模板路径
+    """
+    prefix = item_type if item_type in BUILTIN_CATEGORIES else 'collection'
+    return f'{prefix}/{name}.html'
+
+def render_category(item_type, name, **context):
+    """
+    渲染类别页面，通用模板通过 category_info 获取类别名称和图标
+    
+    参数:
+        item_type (str): 物品类型
+        name (str): 页面名，见 category_template
+        **context: 模板变量
+    """
+    return render_template(category_template(item_type, name), item_type=item_type,
+                           category_info=current_tenant().definitions[item_type], **context)
+
+def render_rows(item_type, signature, key, items):
+    """
+    渲染列表表格行，按数据版本缓存
+    
+    参数:
+        item_type (str): 物品类型
+        signature (tuple): 查询数据前获取的存储签名
+        key: 区分同一数据版本下不同查询的键
+        items (list): 物品数据视图
+        
+    返回:
+        Markup: 表格行HTML
+    """
+    html, hit = fragment_cache.get_or_render(
+        (current_tenant().id, item_type, signature, key),
+        lambda: render_category(item_type, 'rows', items=items)
+    )
+    metrics.count_cache('fragment', hit)
+    return Markup(html)
 
 def load_figures_data():
     """
     加载手办数据
     
     返回:
-        list: 手办数据字典列表，按购买日期倒序排列，无购买日期的按名称排列
+        RecordList: 手办数据视图列表，按购买日期倒序排列，无购买日期的按名称排列
     
     异常:
         FileNotFoundError: 当数据文件不存在时抛出
         pd.errors.EmptyDataError: 当数据文件为空时抛出
     """
-    return figures_category.load_data()
+    return category_map['figures'].load_data()
 
 def load_clothing_data():
     """
     加载衣服数据
     
     返回:
-        list: 衣服数据列表（字典形式），按购买日期倒序排列，无购买日期的按名称排列
+        RecordList: 衣服数据视图列表，按购买日期倒序排列，无购买日期的按名称排列
     
     异常:
         FileNotFoundError: 当数据文件不存在时抛出
         pd.errors.EmptyDataError: 当数据文件为空时抛出
     """
-    return clothing_category.load_data()
+    return category_map['clothing'].load_data()
 
 def load_goods_data():
     """
     加载好物数据
     
     返回:
-        list: 好物数据列表（字典形式），按购买日期倒序排列，无购买日期的按名称排列
+        RecordList: 好物数据视图列表，按购买日期倒序排列，无购买日期的按名称排列
     
     异常:
         FileNotFoundError: 当数据文件不存在时抛出
         pd.errors.EmptyDataError: 当数据文件为空时抛出
     """
-    return goods_category.load_data()
+    return category_map['goods'].load_data()
 
-def check_and_convert_images():
-    """检查并转换图片为WebP格式"""
-    for item_type in ['figures', 'clothing', 'goods']:
-        image_dir = os.path.join(app.static_folder, 'images', item_type)
-        if not os.path.exists(image_dir):
-            os.makedirs(image_dir, exist_ok=True)
-            continue
-            
-        for filename in os.listdir(image_dir):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                image_path = os.path.join(image_dir, filename)
-                # 检查是否已经有对应的WebP文件
-                webp_path = get_webp_path(image_path, item_type)
-                if not os.path.exists(webp_path):
-                    try:
-                        compress_and_convert_to_webp(image_path, item_type)
-                        print(f"转换图片: {filename} -> {os.path.basename(webp_path)}")
-                    except Exception as e:
-                        print(f"转换图片失败 {filename}: {str(e)}")
-
-@app.route('/')
+def check_and_convert_images(app):
+    """检查图片目录，将新增或被替换的图片提交到后台转换队列，并启动监视线程"""
+    global image_watcher
+    if not image_jobs.acquire_scan_lock(os.path.join('data', 'image_scan.lock')):
+        return
+    if image_watcher is not None:
+        image_watcher.stop()
+    # 每轮检查时重新列出全部收藏的类别，运行期间新建的收藏也会被监视
+    image_watcher = ImageWatcher(
+        image_jobs, app.static_folder,
+        lambda: collection_item_types(tenants.root, tenants.default.data_dir) + [STORE_TYPE]
+    )
+    submitted = image_watcher.poll(full=True)
+    if submitted:
+        print(f"提交图片转换任务: {submitted}个")
+    image_watcher.start(float(app.config['IMAGE_WATCH_INTERVAL']))
+
+@bp.route('/')
+@conditional(ALL_CATEGORIES)
 def home():
     """
     主页路由：展示物品统计概况
     
     返回:
-        渲染后的主页模板，包含物品统计数据
+        渲染后的主页模板，包含当前收藏各类别的物品数量
     """
-    # 自动检查并转换图片
-    check_and_convert_images()
-    
-    # 加载数据
-    figures = load_figures_data()
-    clothing = load_clothing_data()
-    goods = load_goods_data()
+    # 只需要数量，不读取任何物品字段
+    counts = {item_type: category.count_items() for item_type, category in category_map.items()}
 
     return render_template(
         'index.html',
-        total=len(figures) + len(clothing) + len(goods),
-        figures_count=len(figures),
-        clothing_count=len(clothing),
-        goods_count=len(goods)
+        total=sum(counts.values()),
+        counts=counts
     )
 
-@app.route('/figures')
+@bp.route('/figures')
+@conditional(('figures',))
 def show_figures():
-    """手办列表路由：展示所有手办数据和价格统计"""
-    figures_data = figures_category.load_data()
-    categories = figures_category.get_categories()
-    
-    # 使用ItemCategory类的calculate_price_stats方法计算价格统计信息
-    total_stats, category_stats = figures_category.calculate_price_stats()
-    
-    return render_template('figures/list.html', 
-                           figures=figures_data, 
-                           categories=categories,
-                           total_stats=total_stats,
-                           category_stats=category_stats)
+    """手办列表路由"""
+    return render_list('figures')
 
-@app.route('/clothing')
+@bp.route('/clothing')
+@conditional(('clothing',))
 def show_clothing():
-    """衣服列表路由：展示所有衣服数据"""
-    clothing_data = clothing_category.load_data()
-    categories = clothing_category.get_categories()
-    return render_template('clothing/list.html', clothing=clothing_data, categories=categories)
+    """衣服列表路由"""
+    return render_list('clothing')
 
-@app.route('/goods')
+@bp.route('/goods')
+@conditional(('goods',))
 def show_goods():
-    """好物列表路由：展示所有好物数据"""
-    goods_data = goods_category.load_data()
-    categories = goods_category.get_categories()
-    return render_template('goods/list.html', goods=goods_data, categories=categories)
+    """好物列表路由"""
+    return render_list('goods')
+
+@bp.route('/<item_type>')
+@conditional()
+def show_category(item_type):
+    """收藏中自定义类别的列表路由，使用通用模板"""
+    return render_list(item_type)
+
+def render_list(item_type):
+    """通用列表路由处理函数：展示第一页数据和价格统计，后续页面由前端通过列表接口加载"""
+    category = category_map[item_type]
+    signature = category.storage.signature()
+    page = category.query_items(limit=LIST_PAGE_SIZE)
+    
+    # 使用ItemCategory类的calculate_price_stats方法获取价格统计信息（增量维护）
+    total_stats, _ = category.calculate_price_stats()
+    
+    return render_category(item_type, 'list',
+                           rows_html=render_rows(item_type, signature, 'first', page['items']),
+                           next_cursor=page['next_cursor'],
+                           total=page['total'],
+                           data_version=category.storage.data_version(signature),
+                           categories=category.get_categories(),
+                           total_stats=total_stats)
+
+@bp.route('/api/<item_type>/items')
+@conditional()
+def api_list_items(item_type):
+    """
+    物品列表接口
+    @description: 基于缓存数据的分页、筛选、排序查询
+    @param: category 子类别筛选; sort 排序字段(前缀'-'表示倒序); cursor 分页游标;
+            limit 每页数量; fields 逗号分隔的返回字段; view=rows 时额外返回渲染好的表格行HTML
+    @return: {success, items, next_cursor, total[, html]}
+    """
+    from utils.item_manager import serialize_item
+    
+    if item_type not in category_map:
+        abort(404)
+    signature = category_map[item_type].storage.signature()
+    try:
+        limit = max(1, min(int(request.args.get('limit', LIST_PAGE_SIZE)), MAX_PAGE_SIZE))
+        page = category_map[item_type].query_items(
+            category=request.args.get('category'),
+            sort=request.args.get('sort'),
+            cursor=request.args.get('cursor'),
+            limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    fields = [field for field in request.args.get('fields', '').split(',') if field] or None
+    result = {
+        'success': True,
+        'items': [serialize_item(item, fields) for item in page['items']],
+        'next_cursor': page['next_cursor'],
+        'total': page['total']
+    }
+    if request.args.get('view') == 'rows':
+        key = (request.args.get('category'), request.args.get('sort'), request.args.get('cursor'), limit)
+        result['html'] = str(render_rows(item_type, signature, key, page['items']))
+    return jsonify(result)
+
+@bp.route('/api/<item_type>/changes')
+@conditional()
+def api_changes(item_type):
+    """
+    增量同步接口
+    @description: 返回客户端数据版本之后新增或修改的物品，Service Worker 缓存的列表页据此就地更新，
+                  不必重新下载整页
+    @param: since 客户端持有的数据版本（列表页 tbody 的 data-version 或上次返回的 version）;
+            fields 逗号分隔的返回字段; view=rows 时额外返回渲染好的表格行
+    @return: {success, version, full, items[, rows]}，full 为 true 时版本已失效或变化过多，
+             客户端应重新加载；rows 为物品ID -> 表格行HTML
+    """
+    from utils.item_manager import serialize_item
+    
+    if item_type not in category_map:
+        abort(404)
+    changes = category_map[item_type].changes_since(request.args.get('since'), MAX_SYNC_ITEMS)
+    fields = [field for field in request.args.get('fields', '').split(',') if field] or None
+    if fields and 'id' not in fields:
+        fields.insert(0, 'id')
+    items = [serialize_item(item, fields) for item in changes['items']]
+    result = {'success': True, 'version': changes['version'], 'full': changes['full'], 'items': items}
+    if request.args.get('view') == 'rows':
+        result['rows'] = {
+            str(entry['id']): render_category(item_type, 'rows', items=[item]).strip()
+            for entry, item in zip(items, changes['items'])
+        }
+    return jsonify(result)
 
-@app.route('/figures/<int:item_id>')
+@bp.route('/api/<item_type>/stats')
+@conditional()
+def api_price_stats(item_type):
+    """
+    价格统计接口
+    @description: 返回增量维护的价格统计，不会重新计算
+    @param: category 子类别，传入时额外返回该子类别的统计(stats)，为空字符串时返回整体统计
+    @return: {success, total, categories[, stats]}
+    """
+    from utils.stats_service import STAT_FIELDS, normalize_total_stats
+    
+    if item_type not in category_map:
+        abort(404)
+    total_stats, category_stats = category_map[item_type].calculate_price_stats()
+    result = {
+        'success': True,
+        'total': total_stats,
+        'categories': category_stats
+    }
+    if 'category' in request.args:
+        category = request.args.get('category')
+        if category:
+            result['stats'] = category_stats.get(category, dict.fromkeys(STAT_FIELDS, 0))
+        else:
+            result['stats'] = normalize_total_stats(total_stats)
+    return jsonify(result)
+
+def portfolio_summary():
+    """
+    汇总全部类别的资产汇总表
+
+    返回:
+        dict: 整体的 totals、monthly、channels，以及 categories（物品类型 -> 该类别的汇总）
+    """
+    from utils.rollups import combine, summarize
+    
+    tables = {item_type: category.portfolio_rollup() for item_type, category in category_map.items()}
+    summary = combine(tables.values())
+    summary['categories'] = {item_type: summarize(**table) for item_type, table in tables.items()}
+    return summary
+
+@bp.route('/dashboard')
+@conditional(ALL_CATEGORIES)
+def dashboard():
+    """资产分析页：按月支出与卖出、持有成本、已实现收益和购买渠道分布，数据来自增量维护的汇总表"""
+    return render_template('dashboard.html', summary=portfolio_summary())
+
+@bp.route('/api/dashboard')
+@conditional(ALL_CATEGORIES)
+def api_dashboard():
+    """
+    资产汇总接口
+    @description: 返回跨类别的汇总表，读取增量维护的汇总，不扫描物品数据
+    @return: {success, totals, monthly, channels, categories}
+    """
+    return jsonify({'success': True, **portfolio_summary()})
+
+@bp.route('/search')
+@conditional(ALL_CATEGORIES)
+def search():
+    """
+    搜索接口
+    @description: 按物品名称、备注、购买渠道全文搜索，支持中文及少量错字，按相关度排序
+    @param: q 查询文本; type 逗号分隔的物品类型，为空时搜索全部类型; cursor 分页游标;
+            limit 每页数量; fields 逗号分隔的返回字段
+    @return: {success, items, next_cursor, total}，items 中每项额外包含 item_type 和 score
+    """
+    from utils.item_manager import decode_cursor, encode_cursor, serialize_item
+    
+    item_types = [item_type for item_type in request.args.get('type', '').split(',') if item_type] or None
+    if item_types and any(item_type not in category_map for item_type in item_types):
+        return jsonify({'success': False, 'message': '无效的物品类型'}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', LIST_PAGE_SIZE)), MAX_PAGE_SIZE))
+        offset = decode_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    result = search_index.search(request.args.get('q', ''), item_types, offset, limit)
+    fields = [field for field in request.args.get('fields', '').split(',') if field] or None
+    items = []
+    for item_type, item_id, score in result['hits']:
+        item = category_map[item_type].get_item_by_id(item_id)
+        if item is None:
+            continue
+        entry = serialize_item(item, fields)
+        entry.update(item_type=item_type, score=score)
+        items.append(entry)
+    end = offset + len(result['hits'])
+    return jsonify({
+        'success': True,
+        'items': items,
+        'next_cursor': encode_cursor(end) if end < result['total'] else None,
+        'total': result['total']
+    })
+
+@bp.route('/api/<item_type>/import', methods=['POST'])
+def api_import_items(item_type):
+    """
+    批量导入接口
+    @description: 流式读取上传的CSV/JSONL文件，按批次写入，单行校验失败不影响其他行
+    @param: file 上传的文件，也可以直接以请求体发送; format 文件格式(csv/jsonl)，默认按文件扩展名判断
+    @return: {success, created, first_id, last_id, errors, error_count}
+    """
+    from utils.bulk_io import FORMATS, detect_format, import_items, iter_rows
+    
+    if item_type not in category_map:
+        abort(404)
+    upload = request.files.get('file')
+    fmt = request.args.get('format') or detect_format(upload.filename if upload else None)
+    if fmt not in FORMATS:
+        return jsonify({'success': False, 'message': f'不支持的格式: {fmt}'}), 400
+    stream = upload.stream if upload else request.stream
+    
+    try:
+        result = import_items(category_map[item_type], iter_rows(stream, fmt))
+    except (UnicodeDecodeError, ValueError) as e:
+        print(f"导入失败: {str(e)}")
+        return jsonify({'success': False, 'message': f'导入失败: {str(e)}'}), 400
+    return jsonify({'success': True, **result})
+
+@bp.route('/api/<item_type>/export')
+def api_export_items(item_type):
+    """
+    导出接口
+    @description: 按ID顺序分块流式输出，不在内存中拼接整个文件
+    @param: format 导出格式(csv/jsonl)，默认csv
+    """
+    from utils.bulk_io import FORMATS, export_items
+    
+    if item_type not in category_map:
+        abort(404)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({'success': False, 'message': f'不支持的格式: {fmt}'}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(export_items(category_map[item_type], fmt)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={item_type}.{fmt}'}
+    )
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """
+    指标接口
+    @description: Prometheus 文本格式，包含请求和各阶段耗时直方图、缓存命中率；只统计当前 worker 进程
+    """
+    if not metrics.is_enabled():
+        abort(404)
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/sw.js')
+def service_worker():
+    """
+    Service Worker 脚本
+    @description: 从根路径提供，作用域覆盖整个站点；不缓存，浏览器每次检查更新
+    """
+    response = send_from_directory(os.path.join(current_app.static_folder, 'js'), 'sw.js', max_age=0)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/healthz')
+def healthz():
+    """
+    存活检查接口
+    @description: 进程能处理请求即返回200，不等待预热
+    """
+    return jsonify({'success': True})
+
+@bp.route('/readyz')
+def readyz():
+    """
+    就绪检查接口
+    @description: 预热全部完成后返回200，之前返回503；负载均衡器据此决定是否向该 worker 转发请求
+    @return: {success, state, current, steps, elapsed}，state 见 WarmUp.status
+    """
+    status = warm_up.status()
+    ready = status['state'] == 'ready'
+    response = jsonify({'success': ready, **status})
+    response.headers['Cache-Control'] = 'no-store'
+    if not ready:
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+    return response
+
+@bp.route('/figures/<int:item_id>')
+@conditional(('figures',))
 def figures_detail(item_id):
     """手办详情路由"""
     return get_item_detail('figures', item_id)
 
-@app.route('/clothing/<int:item_id>')
+@bp.route('/clothing/<int:item_id>')
+@conditional(('clothing',))
 def clothing_detail(item_id):
     """衣服详情路由"""
     return get_item_detail('clothing', item_id)
 
-@app.route('/goods/<int:item_id>')
+@bp.route('/goods/<int:item_id>')
+@conditional(('goods',))
 def goods_detail(item_id):
     """好物详情路由"""
     return get_item_detail('goods', item_id)
 
-@app.route('/figures/new')
+@bp.route('/<item_type>/<int:item_id>')
+@conditional()
+def category_detail(item_type, item_id):
+    """自定义类别详情路由"""
+    return get_item_detail(item_type, item_id)
+
+@bp.route('/figures/new')
 def figures_new():
     """新建手办页面路由"""
-    return render_template('figures/new.html')
+    return render_new('figures')
 
-@app.route('/clothing/new')
+@bp.route('/clothing/new')
 def clothing_new():
     """新建衣服页面路由"""
-    return render_template('clothing/new.html')
+    return render_new('clothing')
 
-@app.route('/goods/new')
+@bp.route('/goods/new')
 def good_new():
     """新建好物页面路由"""
-    return render_template('goods/new.html')
+    return render_new('goods')
+
+@bp.route('/<item_type>/new')
+def category_new(item_type):
+    """自定义类别新建页面路由"""
+    return render_new(item_type)
+
+def render_new(item_type):
+    """通用新建页面处理函数，当前收藏没有该类别时返回404"""
+    if item_type not in category_map:
+        abort(404)
+    return render_category(item_type, 'new')
 
 def get_item_detail(item_type, item_id):
     """通用详情路由处理函数"""
-    category_map = {
-        'figures': figures_category,
-        'clothing': clothing_category,
-        'goods': goods_category
-    }
-    template_map = {
-        'figures': 'figures/detail.html',
-        'clothing': 'clothing/detail.html',
-        'goods': 'goods/detail.html'
-    }
+    from utils.item_manager import item_version
     
     category = category_map[item_type]
     item = category.get_item_by_id(item_id)
     if item is None:
         abort(404)
-    return render_template(template_map[item_type], item=item)
+    return render_category(item_type, 'detail', item=item, version=item_version(item))
+
+
+@bp.route('/image_status/<item_type>/<int:item_id>')
+def image_status(item_type, item_id):
+    """
+    图片转换状态接口
+    @description: 查询物品图片的WebP转换状态，供上传后轮询
+    @return: status 为 'none'(无图片) / 'pending' / 'done' / 'failed'
+    """
+    if item_type not in category_map:
+        abort(404)
+    item = category_map[item_type].get_item_by_id(item_id)
+    if item is None:
+        abort(404)
+
+    image = item.get('image')
+    if not image or not isinstance(image, str):
+        return jsonify({'success': True, 'status': 'none'})
+
+    image_path, output_type = resolve_image(current_app.static_folder, item_type, image)
+    url = image_url(item_type, image)
+    if webp_outputs_exist(image_path, output_type):
+        return jsonify({'success': True, 'status': 'done', 'url': url})
+
+    # 任务可能由其他worker提交，本进程查不到时按处理中返回
+    job = image_jobs.status(image_path)
+    if job and job['status'] == 'failed':
+        return jsonify({'success': True, 'status': 'failed', 'error': job['error']})
+    return jsonify({'success': True, 'status': 'pending', 'url': url})
+
+
+@bp.route('/images/<filename>')
+def stored_image(filename):
+    """
+    内容寻址图片路由
+    @description: 文件名即内容哈希，返回强ETag并允许浏览器永久缓存
+    """
+    if not is_stored_name(filename):
+        abort(404)
+    response = send_from_directory(get_store_dir(current_app.static_folder), filename,
+                                   max_age=IMMUTABLE_MAX_AGE, etag=False)
+    response.set_etag(filename)
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response.make_conditional(request)
+
+
+""" ========= 分块上传接口 ========= """
+@bp.route('/api/uploads', methods=['POST'])
+def api_create_upload():
+    """
+    创建分块上传会话
+    @description: 先声明文件名和大小，格式或大小不符时在传输数据前拒绝
+    @param: JSON {filename, size}
+    @return: {success, upload_id, size, offset, chunk_size}
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        session = upload_store.create(data.get('filename'), data.get('size'))
+    except UploadError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status
+    return jsonify({'success': True, 'chunk_size': current_app.config['UPLOAD_CHUNK_MAX_SIZE'],
+                    **session}), 201
+
+@bp.route('/api/uploads/<upload_id>', methods=['GET', 'PATCH', 'DELETE'])
+def api_upload(upload_id):
+    """
+    分块上传
+    @description: GET 查询已接收的字节数（续传前调用）；PATCH 以请求体发送一块数据，
+                  请求头 Upload-Offset 为该块的起始位置；DELETE 取消上传
+    @return: {success, upload_id, size, offset}，最后一块完成后额外返回 image（哈希文件名），
+             创建或更新物品时以 uploaded_image 字段提交
+    """
+    try:
+        if request.method == 'GET':
+            return jsonify({'success': True, **upload_store.status(upload_id)})
+        if request.method == 'DELETE':
+            upload_store.delete(upload_id)
+            return jsonify({'success': True, 'message': '已取消上传'})
+
+        # 超过分块上限时，读取请求体之前直接返回413
+        request.max_content_length = current_app.config['UPLOAD_CHUNK_MAX_SIZE']
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            raise UploadError('缺少有效的 Upload-Offset 请求头')
+        session = upload_store.append(upload_id, offset, request.stream, request.content_length)
+    except UploadError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status
+    except RequestEntityTooLarge:
+        return jsonify({'success': False, 'message': '分块过大'}), 413
+    return jsonify({'success': True, **session})
+
+
+def limit_form_upload():
+    """
+    限制表单提交的请求体大小，Content-Length 超出时读取表单前即拒绝
+    """
+    request.max_content_length = current_app.config['MAX_IMAGE_UPLOAD'] + FORM_FIELDS_MAX_SIZE
 
 
 """ ========= 更新属性接口 ========= """
-@app.route('/update_properties', methods=['POST'])
+def expected_version():
+    """
+    从 If-Match 请求头获取客户端编辑时的版本号
+    
+    返回:
+        int: 版本号，未提供或为 * 时返回None
+        
+    异常:
+        ValueError: 版本号无效或提供了多个版本号时抛出
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    tags = request.if_match.as_set(include_weak=True)
+    if len(tags) != 1:
+        raise ValueError('If-Match 只能包含一个版本号')
+    try:
+        return int(tags.pop())
+    except ValueError:
+        raise ValueError('无效的版本号') from None
+
+def versioned_response(result, version, status=200):
+    """
+    生成带版本号的JSON响应，ETag 为版本号，客户端下次更新时作为 If-Match 发送
+    """
+    response = jsonify({**result, 'version': version})
+    response.status_code = status
+    response.set_etag(str(version))
+    return response
+
+@bp.route('/api/<item_type>/items/<int:item_id>', methods=['PATCH'])
+def api_patch_item(item_type, item_id):
+    """
+    物品部分更新接口
+    @description: 只写入请求体中的字段；带 If-Match 时为条件更新，物品已被修改返回409和当前版本号
+    @param: JSON 对象，字段 -> 新值; If-Match 请求头为编辑时的版本号（物品数据中的 version）
+    @return: {success, message, version}，ETag 响应头为新版本号
+    """
+    from utils.item_manager import VersionConflict
+    
+    if item_type not in category_map:
+        abort(404)
+    fields = request.get_json(silent=True)
+    if not isinstance(fields, dict) or not fields:
+        return jsonify({'success': False, 'message': '请求体需为非空的JSON对象'}), 400
+    try:
+        success, message, version = category_map[item_type].update_item(
+            item_id, fields, expected_version=expected_version())
+    except VersionConflict as e:
+        return versioned_response({'success': False, 'message': str(e)}, e.current, 409)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if not success:
+        return jsonify({'success': False, 'message': message}), 400
+    return versioned_response({'success': True, 'message': message}, version)
+
+@bp.route('/update_properties', methods=['POST'])
 def update_properties():
     """
     更新属性接口
-    @description: 处理前端提交的属性更新请求
-    @param: 表单数据，包含属性数据和可能的图片文件
-    @return: 操作结果
+    @description: 处理前端提交的属性更新请求，只写入提交的字段；带 If-Match 时为条件更新，
+                  物品已被修改返回409和当前版本号
+    @param: 表单数据，包含需要修改的属性和可能的图片文件，或分块上传得到的 uploaded_image;
+            If-Match 请求头为编辑时的版本号
+    @return: {success, message, version}，ETag 响应头为新版本号
     """
+    from utils.item_manager import VersionConflict
+    
+    limit_form_upload()
     try:
         # 获取表单数据
         item_type = request.form.get('item_type')
         item_id = request.form.get('item_id')
         
         # 根据不同类型选择不同的类别管理器
-        category_map = {
-            'figures': figures_category,
-            'clothing': clothing_category,
-            'goods': goods_category
-        }
-        
         if item_type not in category_map:
             raise ValueError('无效的物品类型')
             
@@ -216,18 +989,24 @@ def update_properties():
         image_file = request.files.get('image') if 'image' in request.files else None
         
         # 更新物品属性
-        success, message = category.update_item(item_id, request.form, image_file)
+        success, message, version = category.update_item(item_id, request.form, image_file,
+                                                         request.form.get('uploaded_image'),
+                                                         expected_version())
         
         if success:
-            return jsonify({
+            return versioned_response({
                 'success': True,
                 'message': message
-            })
+            }, version)
         else:
             return jsonify({
                 'success': False,
                 'message': message
             }), 400
+    except RequestEntityTooLarge:
+        return jsonify({'success': False, 'message': '图片过大'}), 413
+    except VersionConflict as e:
+        return versioned_response({'success': False, 'message': str(e)}, e.current, 409)
     except Exception as e:
         print(f"更新失败: {str(e)}")
         return jsonify({
@@ -235,25 +1014,20 @@ def update_properties():
             'message': f'更新失败: {str(e)}'
         }), 400
 
-@app.route('/create_item', methods=['POST'])
+@bp.route('/create_item', methods=['POST'])
 def create_item():
     """
     创建新物品接口
     @description: 处理前端提交的新物品创建请求
-    @param: 表单数据，包含物品数据和可能的图片文件
+    @param: 表单数据，包含物品数据和可能的图片文件，或分块上传得到的 uploaded_image
     @return: 操作结果
     """
+    limit_form_upload()
     try:
         # 获取表单数据
         item_type = request.form.get('item_type')
         
         # 根据不同类型选择不同的类别管理器
-        category_map = {
-            'figures': figures_category,
-            'clothing': clothing_category,
-            'goods': goods_category
-        }
-        
         if item_type not in category_map:
             raise ValueError('无效的物品类型')
             
@@ -263,7 +1037,8 @@ def create_item():
         image_file = request.files.get('image') if 'image' in request.files else None
         
         # 创建新物品
-        success, message, new_id = category.create_item(request.form, image_file)
+        success, message, new_id = category.create_item(request.form, image_file,
+                                                        request.form.get('uploaded_image'))
         
         if success:
             return jsonify({
@@ -276,6 +1051,8 @@ def create_item():
                 'success': False,
                 'message': message
             }), 400
+    except RequestEntityTooLarge:
+        return jsonify({'success': False, 'message': '图片过大'}), 413
     except Exception as e:
         print(f"创建失败: {str(e)}")
         return jsonify({
@@ -286,4 +1063,5 @@ def create_item():
 
 """ ========== 主程序入口 ============ """
 if __name__ == '__main__':
-    app.run(debug=True, host="0.0.0.0", port=7334)  # 开发模式启动（生产环境需调整）
+    # 开发模式启动，生产环境使用: gunicorn -c gunicorn.conf.py
+    create_app().run(debug=True, host="0.0.0.0", port=7334)
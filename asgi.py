@@ -0,0 +1,15 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/asgi.py
+Description: ASGI 入口，如 uvicorn asgi:app --workers 4
+需要安装 asgiref；视图仍是同步函数，由 asgiref 放到线程池中执行
+'''
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import create_app
+
+app = WsgiToAsgi(create_app())
@@ -0,0 +1,131 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/benchmarks/bench_price_stats.py
+Description: 价格统计基准测试，对比逐行循环实现与向量化实现
+用法: python -m benchmarks.bench_price_stats [行数 ...]
+'''
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.stats_service import aggregate_price_stats
+
+
+def make_frame(rows, seed=0):
+    """
+    生成合成的物品数据
+
+    参数:
+        rows (int): 行数
+        seed (int): 随机种子
+
+    返回:
+        DataFrame: 与 data/<type>.csv 列结构一致的数据
+    """
+    rng = np.random.default_rng(seed)
+    sold_price = rng.integers(10, 2000, rows).astype(float)
+    sold_price[rng.random(rows) < 0.6] = np.nan
+    return pd.DataFrame({
+        'id': np.arange(1, rows + 1),
+        'name': [f'物品{i}' for i in range(rows)],
+        'category': rng.choice(['景品', '比例', '粘土', '可动', '盒蛋'], rows),
+        'purchase_price': rng.integers(10, 3000, rows).astype(float),
+        'shipping_fee': rng.choice([0.0, 8.0, 15.0], rows),
+        'sold_price': sold_price
+    })
+
+
+def legacy_price_stats(items_data, categories):
+    """
+    优化前的逐行实现，用于对比耗时和校验结果
+    """
+    total_stats = {
+        "total_purchase_price": 0,
+        "total_purchase_price_existing": 0,
+        "total_purchase_price_sold": 0,
+        "total_sold_price": 0,
+        "total_count": len(items_data),
+        "existing_count": 0,
+        "sold_count": 0
+    }
+    category_stats = {}
+    for category in categories:
+        category_stats[category] = {
+            'purchase_price': 0,
+            'purchase_price_existing': 0,
+            'purchase_price_sold': 0,
+            'sold_price': 0,
+            'count': 0,
+            "existing_count": 0,
+            'sold_count': 0
+        }
+    for item in items_data:
+        purchase_price = item.get('purchase_price', 0) or 0
+        shipping_fee = item.get('shipping_fee', 0) or 0
+        item_total_price = purchase_price + shipping_fee
+        total_stats['total_purchase_price'] += item_total_price
+        sold_price = item.get('sold_price', 0) or 0
+        if sold_price and sold_price == sold_price:
+            total_stats['total_purchase_price_sold'] += item_total_price
+            total_stats['total_sold_price'] += sold_price
+            total_stats['sold_count'] += 1
+        else:
+            total_stats['total_purchase_price_existing'] += item_total_price
+            total_stats['existing_count'] += 1
+        category = item.get('category', '')
+        if category in category_stats:
+            category_stats[category]['purchase_price'] += item_total_price
+            category_stats[category]['count'] += 1
+            if sold_price and sold_price == sold_price:
+                category_stats[category]['purchase_price_sold'] += item_total_price
+                category_stats[category]['sold_price'] += sold_price
+                category_stats[category]['sold_count'] += 1
+            else:
+                category_stats[category]['purchase_price_existing'] += item_total_price
+                category_stats[category]['existing_count'] += 1
+    return total_stats, category_stats
+
+
+def best_of(func, repeat=5):
+    """
+    多次运行取最短耗时（秒）
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='价格统计基准测试')
+    parser.add_argument('sizes', type=int, nargs='*', default=[10_000, 100_000], help='行数')
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>8} {'legacy(ms)':>12} {'vectorized(ms)':>15} {'speedup':>8}")
+    for rows in args.sizes:
+        df = make_frame(rows)
+        categories = sorted(df['category'].unique())
+
+        # 旧实现的耗时包含 to_dict('records')，与原先的 load_data 行为一致
+        legacy = best_of(lambda: legacy_price_stats(df.to_dict('records'), categories))
+        vectorized = best_of(lambda: aggregate_price_stats(df, categories))
+
+        expected = legacy_price_stats(df.to_dict('records'), categories)
+        actual = aggregate_price_stats(df, categories)
+        assert expected[0]['sold_count'] == actual[0]['sold_count']
+        assert abs(expected[0]['total_purchase_price'] - actual[0]['total_purchase_price']) < 1e-6
+        assert expected[1].keys() == actual[1].keys()
+
+        print(f"{rows:>8} {legacy * 1000:>12.2f} {vectorized * 1000:>15.2f} {legacy / vectorized:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/benchmarks/bench_suite.py
+Description: 基准测试套件，在临时目录中生成合成数据，测量读写、页面渲染、冷启动和图片转换耗时，结果输出为JSON
+用法:
+    python -m benchmarks.bench_suite [--sizes 1000 10000] [--output result.json]
+    python -m benchmarks.bench_suite --sizes 1000 --compare baseline.json
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from benchmarks.synthetic import write_dataset, write_sample_images
+
+# 默认测试的数据规模（每种物品类型的行数）
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+
+# 渲染测试访问的页面，{id} 替换为随机物品ID
+PAGES = (
+    '/',
+    '/figures',
+    '/clothing',
+    '/goods',
+    '/figures/{id}',
+    '/api/figures/items?sort=name',
+    '/api/figures/stats?category=景品',
+    '/search?q=初音未来'
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@contextmanager
+def working_directory(path):
+    """
+    临时切换工作目录，数据文件路径（data/<type>.csv）相对于工作目录
+    """
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def measure(func, repeat):
+    """
+    重复执行并记录每次耗时
+
+    参数:
+        func (callable): 被测函数
+        repeat (int): 次数
+
+    返回:
+        list: 每次耗时（秒）
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(benchmark, rows, samples):
+    """
+    汇总耗时样本
+
+    返回:
+        dict: benchmark、rows、runs、mean_ms、p50_ms、p95_ms、min_ms
+    """
+    ordered = sorted(samples)
+    return {
+        'benchmark': benchmark,
+        'rows': rows,
+        'runs': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 4),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 4),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        'min_ms': round(ordered[0] * 1000, 4)
+    }
+
+
+def write_ops(rows):
+    """
+    写入类测试的次数，数据量越大次数越少，避免单个规模耗时过长
+    """
+    return max(5, min(200, 2_000_000 // rows))
+
+
+def bench_category(rows, seed):
+    """
+    测试 ItemCategory 的读写方法，需在数据目录中调用
+
+    返回:
+        list: summarize 结果
+    """
+    from utils.item_manager import ItemCategory
+
+    rng = random.Random(seed)
+    results = []
+
+    def cold_load():
+        ItemCategory('figures').load_data()
+
+    results.append(summarize('load_data.cold', rows, measure(cold_load, 3)))
+
+    category = ItemCategory('figures')
+    category.load_data()
+    results.append(summarize('load_data.warm', rows, measure(category.load_data, 50)))
+
+    ids = [rng.randint(1, rows) for _ in range(1000)]
+    lookups = iter(ids)
+    results.append(summarize('get_item_by_id', rows,
+                             measure(lambda: category.get_item_by_id(next(lookups)), len(ids))))
+
+    def cold_stats():
+        ItemCategory('figures').calculate_price_stats()
+
+    results.append(summarize('calculate_price_stats.cold', rows, measure(cold_stats, 3)))
+    category.calculate_price_stats()
+    results.append(summarize('calculate_price_stats.warm', rows,
+                             measure(category.calculate_price_stats, 100)))
+
+    ops = write_ops(rows)
+
+    def update():
+        item_id = rng.randint(1, rows)
+        category.update_item(item_id, {'remark': f'基准测试 {item_id}', 'sold_price': '99'})
+
+    results.append(summarize('update_item', rows, measure(update, ops)))
+
+    counter = iter(range(ops))
+
+    def create():
+        category.create_item({'name': f'新物品 {next(counter)}', 'category': '景品',
+                              'purchase_price': '120', 'purchase_channel': '淘宝'})
+
+    results.append(summarize('create_item', rows, measure(create, ops)))
+    return results
+
+
+def bench_pages(rows, seed, repeat=20):
+    """
+    通过 Flask 测试客户端测试完整的页面和接口请求，需在数据目录中调用
+
+    返回:
+        list: summarize 结果
+    """
+    from app import create_app
+
+    rng = random.Random(seed)
+    # 不预热，首次请求仍包含数据解析
+    app = create_app({'SCAN_IMAGES': False, 'METRICS_ENABLED': False, 'IMAGE_WORKERS': 1, 'WARM_UP': 'off'})
+    client = app.test_client()
+    results = []
+
+    # 首次请求包含数据解析
+    results.append(summarize('page./figures.cold', rows, measure(lambda: client.get('/figures'), 1)))
+
+    for page in PAGES:
+        def request_page():
+            response = client.get(page.format(id=rng.randint(1, rows)))
+            assert response.status_code == 200, (page, response.status_code)
+        request_page()
+        results.append(summarize(f'page.{page.split("?")[0]}', rows, measure(request_page, repeat)))
+    return results
+
+
+# 启动测试在子进程中执行，输出各阶段耗时（秒）
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app({'SCAN_IMAGES': False, 'METRICS_ENABLED': False, 'IMAGE_WORKERS': 1})
+created = time.perf_counter()
+assert application.test_client().get('/').status_code == 200
+first_request = time.perf_counter()
+app.warm_up.ready.wait()
+ready = time.perf_counter()
+json.dump({'import_app': imported - started, 'create_app': created - imported,
+           'first_request': first_request - created, 'ready': ready - started}, sys.stdout)
+"""
+
+
+def bench_startup(rows, repeat=5):
+    """
+    测试冷启动：每次在新的 Python 进程中导入 app、调用 create_app，再记录首个请求和预热完成的耗时，
+    需在数据目录中调用
+
+    返回:
+        list: summarize 结果，startup.ready 为从导入开始到就绪的总耗时
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])))
+    samples = {}
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], env=env, capture_output=True,
+                                text=True, check=True).stdout
+        for name, seconds in json.loads(output).items():
+            samples.setdefault(name, []).append(seconds)
+    return [summarize(f'startup.{name}', rows, values) for name, values in samples.items()]
+
+
+def bench_images(root, count, seed):
+    """
+    测试 compress_and_convert_to_webp 的吞吐量
+
+    返回:
+        dict: summarize 结果，额外包含 images_per_second
+    """
+    from utils.image_processor import compress_and_convert_to_webp, get_output_paths
+
+    paths = write_sample_images(root, count, seed)['figures']
+    with working_directory(root):
+        def convert_all():
+            for path in paths:
+                for output in get_output_paths(path, 'figures'):
+                    if os.path.exists(output):
+                        os.remove(output)
+                compress_and_convert_to_webp(path, 'figures')
+
+        samples = measure(convert_all, 3)
+    result = summarize('compress_and_convert_to_webp', count, [sample / count for sample in samples])
+    result['images_per_second'] = round(count / min(samples), 3)
+    return result
+
+
+def environment():
+    """
+    记录运行环境，便于跨提交对比时确认条件一致
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    与基准结果对比，按 p50 计算耗时比例
+
+    参数:
+        results (dict): 本次结果
+        baseline (dict): 基准结果
+        threshold (float): 比例超过该值视为性能回退
+
+    返回:
+        bool: 是否存在回退
+    """
+    previous = {(item['benchmark'], item['rows']): item for item in baseline['results']}
+    regressed = False
+    print(f"{'benchmark':<36} {'rows':>9} {'base p50':>10} {'p50':>10} {'ratio':>7}", file=sys.stderr)
+    for item in results['results']:
+        base = previous.get((item['benchmark'], item['rows']))
+        if base is None or not base['p50_ms']:
+            continue
+        ratio = item['p50_ms'] / base['p50_ms']
+        flag = ' !' if ratio > threshold else ''
+        regressed = regressed or bool(flag)
+        print(f"{item['benchmark']:<36} {item['rows']:>9} {base['p50_ms']:>10.3f} "
+              f"{item['p50_ms']:>10.3f} {ratio:>6.2f}x{flag}", file=sys.stderr)
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='物品管理基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help='每种物品类型的行数')
+    parser.add_argument('--images', type=int, default=8, help='图片转换测试的图片数，0表示跳过')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='结果JSON路径，默认输出到标准输出')
+    parser.add_argument('--compare', help='基准结果JSON路径，对比后有回退时返回1')
+    parser.add_argument('--threshold', type=float, default=1.25, help='回退判定的耗时比例')
+    args = parser.parse_args(argv)
+
+    # 埋点会计入耗时，测试期间关闭
+    from utils import metrics
+    metrics.configure(False)
+
+    results = {'environment': environment(), 'results': []}
+    for rows in args.sizes:
+        root = tempfile.mkdtemp(prefix=f'bench_{rows}_')
+        try:
+            print(f'生成数据: {rows}行', file=sys.stderr)
+            write_dataset(root, rows, args.seed)
+            with working_directory(root):
+                # 页面测试只读，先于写入测试执行，保证各提交测得的数据一致
+                results['results'].extend(bench_pages(rows, args.seed))
+                results['results'].extend(bench_startup(rows))
+                results['results'].extend(bench_category(rows, args.seed))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if args.images:
+        root = tempfile.mkdtemp(prefix='bench_images_')
+        try:
+            results['results'].append(bench_images(root, args.images, args.seed))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
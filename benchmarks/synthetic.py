@@ -0,0 +1,158 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/benchmarks/synthetic.py
+Description: 生成合成的物品数据和示例图片，相同的行数和种子总是生成相同的内容
+用法: python -m benchmarks.synthetic <输出目录> [行数] [--images 数量]
+'''
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# 与 data/<type>.csv 一致的列
+COLUMNS = [
+    'id', 'name', 'main_category', 'category', 'purchase_price', 'shipping_fee',
+    'purchase_date', 'arrival_date', 'purchase_channel', 'condition', 'remark',
+    'sold_price', 'sold_date', 'image'
+]
+
+# 物品类型 -> (主类别, 子类别, 名称词表)
+ITEM_TYPES = {
+    'figures': ('手办', ['景品', '比例', '粘土', '可动', '盒蛋'],
+                ['初音未来', '绫波丽', '明日香', '蕾姆', '五条悟', 'Saber', '路飞', '炭治郎']),
+    'clothing': ('衣服', ['上衣', '裤子', '外套', '鞋子', '配饰'],
+                 ['卫衣', '衬衫', '牛仔裤', '羽绒服', '运动鞋', 'T恤', '针织衫', '风衣']),
+    'goods': ('好物', ['数码', '厨房', '文具', '家居', '收纳'],
+              ['键盘', '台灯', '保温杯', '钢笔', '收纳盒', '耳机', '咖啡机', '书架'])
+}
+
+CHANNELS = ['淘宝', '闲鱼', '京东', '拼多多', 'Amazon', '线下']
+CONDITIONS = ['全新', '九成新', '二手']
+
+
+def make_collection(item_type, rows, seed=0, image_names=()):
+    """
+    生成一个物品类别的合成数据
+
+    参数:
+        item_type (str): 物品类型，见 ITEM_TYPES
+        rows (int): 行数
+        seed (int): 随机种子
+        image_names (list): 可引用的示例图片文件名，约10%的物品带图片
+
+    返回:
+        DataFrame: 列与 COLUMNS 一致
+    """
+    main_category, categories, words = ITEM_TYPES[item_type]
+    rng = np.random.default_rng(seed)
+
+    purchase_days = rng.integers(0, 5 * 365, rows)
+    purchase_date = pd.Timestamp('2020-01-01') + pd.to_timedelta(purchase_days, unit='D')
+    arrival_date = purchase_date + pd.to_timedelta(rng.integers(1, 30, rows), unit='D')
+    sold = rng.random(rows) < 0.3
+
+    purchase_price = rng.integers(10, 3000, rows).astype(float)
+    sold_price = np.where(sold, np.round(purchase_price * rng.uniform(0.3, 1.5, rows)), np.nan)
+    sold_date = np.where(sold, (arrival_date + pd.to_timedelta(rng.integers(30, 365, rows), unit='D'))
+                         .strftime('%Y-%m-%d'), '')
+
+    names = [f'{words[w]} {i}号' for i, w in enumerate(rng.integers(0, len(words), rows), 1)]
+    remarks = np.where(rng.random(rows) < 0.2, '限定版', '')
+    images = [''] * rows
+    if len(image_names):
+        with_image = np.flatnonzero(rng.random(rows) < 0.1)
+        for pos, choice in zip(with_image, rng.integers(0, len(image_names), len(with_image))):
+            images[pos] = image_names[choice]
+
+    return pd.DataFrame({
+        'id': np.arange(1, rows + 1),
+        'name': names,
+        'main_category': main_category,
+        'category': rng.choice(categories, rows),
+        'purchase_price': purchase_price,
+        'shipping_fee': rng.choice([0.0, 8.0, 15.0], rows),
+        'purchase_date': purchase_date.strftime('%Y-%m-%d'),
+        'arrival_date': arrival_date.strftime('%Y-%m-%d'),
+        'purchase_channel': rng.choice(CHANNELS, rows),
+        'condition': rng.choice(CONDITIONS, rows),
+        'remark': remarks,
+        'sold_price': sold_price,
+        'sold_date': sold_date,
+        'image': images
+    }, columns=COLUMNS)
+
+
+def write_sample_images(root, count, seed=0, size=(2400, 1800)):
+    """
+    生成示例图片，每种物品类型各 count 张
+
+    图片为带噪声的渐变，编码耗时接近真实照片
+
+    参数:
+        root (str): 输出根目录，图片写入 <root>/static/images/<type>/
+        count (int): 每种类型的图片数
+        seed (int): 随机种子
+        size (tuple): 图片尺寸(宽,高)
+
+    返回:
+        dict: 物品类型 -> 图片路径列表
+    """
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    width, height = size
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    paths = {}
+    for item_type in ITEM_TYPES:
+        image_dir = os.path.join(root, 'static', 'images', item_type)
+        os.makedirs(image_dir, exist_ok=True)
+        paths[item_type] = []
+        for index in range(count):
+            tint = rng.uniform(0.3, 1.0, 3).astype(np.float32)
+            noise = rng.normal(0, 20, (height, width, 3)).astype(np.float32)
+            pixels = np.clip(gradient * tint + noise, 0, 255).astype(np.uint8)
+            path = os.path.join(image_dir, f'sample_{index}.jpg')
+            Image.fromarray(pixels).save(path, 'JPEG', quality=90)
+            paths[item_type].append(path)
+    return paths
+
+
+def write_dataset(root, rows, seed=0, images=0):
+    """
+    在 root 下生成 data/{figures,clothing,goods}.csv 及示例图片
+
+    参数:
+        root (str): 输出根目录
+        rows (int): 每种类型的行数
+        seed (int): 随机种子
+        images (int): 每种类型的示例图片数
+
+    返回:
+        dict: 物品类型 -> CSV路径
+    """
+    image_paths = write_sample_images(root, images, seed) if images else {}
+    os.makedirs(os.path.join(root, 'data'), exist_ok=True)
+    csv_paths = {}
+    for offset, item_type in enumerate(ITEM_TYPES):
+        image_names = [os.path.basename(path) for path in image_paths.get(item_type, [])]
+        df = make_collection(item_type, rows, seed + offset, image_names)
+        path = os.path.join(root, 'data', f'{item_type}.csv')
+        df.to_csv(path, index=False)
+        csv_paths[item_type] = path
+    return csv_paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='生成合成的物品数据')
+    parser.add_argument('root', help='输出根目录')
+    parser.add_argument('rows', nargs='?', type=int, default=10_000, help='每种类型的行数')
+    parser.add_argument('--images', type=int, default=0, help='每种类型的示例图片数')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for item_type, path in write_dataset(args.root, args.rows, args.seed, args.images).items():
+        print(f'{item_type}: {path}')
@@ -0,0 +1,32 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/gunicorn.conf.py
+Description: 生产环境 gunicorn 配置
+用法: gunicorn -c gunicorn.conf.py
+'''
+
+import multiprocessing
+import os
+
+wsgi_app = 'app:create_app()'
+bind = os.environ.get('BIND', '0.0.0.0:7334')
+
+# 每个 worker 进程持有完整的数据缓存和搜索索引，进程数不宜过多，并发主要由线程承担：
+# 上传、下载等I/O密集的请求在各自线程中进行，不会排在图片编码后面（编码在独立的进程池中执行）
+cpu_count = multiprocessing.cpu_count()
+workers = int(os.environ.get('WEB_CONCURRENCY', min(cpu_count, 4)))
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 8))
+
+# 各 worker 的图片转换进程池合计约等于CPU核数
+raw_env = [f'FLASK_IMAGE_WORKERS={max(1, cpu_count // workers)}']
+
+# 不预加载应用：每个 worker 在 fork 之后各自调用 create_app，避免在父进程中创建进程池和锁
+preload_app = False
+
+# 上传大图片时留出足够时间
+timeout = 120
+graceful_timeout = 30
@@ -39,6 +39,8 @@ class PropertyEditor {
         if (file && file.type.match('image.*')) {
             const reader = new FileReader();
             reader.onload = (e) => {
+                // srcset 优先级高于 src，预览本地图片时需移除
+                this.$previewImage.removeAttribute('srcset');
                 this.$previewImage.src = e.target.result;
             };
             reader.readAsDataURL(file);
@@ -55,6 +57,7 @@ class PropertyEditor {
             // 进入编辑模式
             this.originalValues = [...this.$inputs].map(input => input.value);
             this.originalImage = this.$previewImage.src;
+            this.originalSrcset = this.$previewImage.getAttribute('srcset');
             this.$view.style.display = 'none';
             this.$form.style.display = 'block';
             this.$toggleBtn.innerHTML = '<i class="bi bi-x-circle"></i> 取消';
@@ -77,6 +80,9 @@ class PropertyEditor {
         
         // 恢复原始图片
         this.$previewImage.src = this.originalImage;
+        if (this.originalSrcset) {
+            this.$previewImage.setAttribute('srcset', this.originalSrcset);
+        }
         
         // 清空文件输入
         if (this.$imageUpload) {
@@ -91,7 +97,7 @@ class PropertyEditor {
     }
 
     /**
-     * 收集表单数据
+     * 收集表单数据，只包含进入编辑模式后修改过的字段，未修改的字段不会覆盖其他人的修改
      * @returns {FormData} 表单数据对象
      */
     collectFormData() {
@@ -99,19 +105,41 @@ class PropertyEditor {
         formData.append('item_id', this.$form.dataset.itemId);
         formData.append('item_type', this.$form.dataset.itemType);
 
-        // 添加普通字段
-        this.$inputs.forEach(input => {
-            formData.append(input.id, input.value);
+        // 添加修改过的普通字段
+        this.$inputs.forEach((input, index) => {
+            if (input.value !== this.originalValues[index]) {
+                formData.append(input.id, input.value);
+            }
         });
 
-        // 添加图片文件（如果有）
-        if (this.$imageUpload && this.$imageUpload.files[0]) {
-            formData.append('image', this.$imageUpload.files[0]);
-        }
-
         return formData;
     }
 
+    /**
+     * 分块上传选择的图片，在提交按钮上显示进度
+     * @returns {Promise<string|null>} 上传后的哈希文件名，未选择图片时返回null
+     */
+    async uploadImage() {
+        const file = this.$imageUpload && this.$imageUpload.files[0];
+        if (!file) {
+            return null;
+        }
+        const $submitBtn = this.$form.querySelector('button[type="submit"]');
+        const label = $submitBtn.textContent;
+        $submitBtn.disabled = true;
+        const uploader = new ChunkedUploader({
+            onProgress: (loaded, total) => {
+                $submitBtn.textContent = `上传图片 ${Math.floor(loaded * 100 / total)}%`;
+            }
+        });
+        try {
+            return await uploader.upload(file);
+        } finally {
+            $submitBtn.disabled = false;
+            $submitBtn.textContent = label;
+        }
+    }
+
     /**
      * 处理表单提交
      * @param {Event} e 表单提交事件
@@ -121,8 +149,16 @@ class PropertyEditor {
         const formData = this.collectFormData();
         
         try {
+            // 图片先分块上传，表单只提交上传后的文件名
+            const uploadedImage = await this.uploadImage();
+            if (uploadedImage) {
+                formData.append('uploaded_image', uploadedImage);
+            }
+            
+            // 带上编辑时的版本号，期间物品被其他页面修改时服务端返回409
             const response = await fetch('/update_properties', {
                 method: 'POST',
+                headers: { 'If-Match': `"${this.$form.dataset.version}"` },
                 body: formData // 不设置Content-Type，让浏览器自动处理
             });
             
@@ -134,8 +170,22 @@ class PropertyEditor {
             }
             
             const result = await response.json();
+            if (response.status === 409) {
+                this.showErrorFeedback('该物品已在其他页面被修改，请刷新页面后重新编辑');
+                return;
+            }
+            if (result.queued) {
+                // 离线暂存，联网后由 Service Worker 提交，此时刷新只会显示缓存的旧页面
+                this.showSuccessFeedback(result.message);
+                this.toggleEdit();
+                return;
+            }
             if (result.success) {
                 this.showSuccessFeedback();
+                // 上传了新图片时，等待后台转换完成再刷新
+                if (formData.get('uploaded_image')) {
+                    await this.waitForImage();
+                }
                 location.reload(); // 刷新页面获取最新数据
             } else {
                 this.showErrorFeedback(result.message);
@@ -146,10 +196,33 @@ class PropertyEditor {
         }
     }
 
+    /**
+     * 轮询图片转换状态
+     * @param {number} maxAttempts 最大轮询次数（每秒一次）
+     */
+    async waitForImage(maxAttempts = 30) {
+        const { itemType, itemId } = this.$form.dataset;
+        for (let i = 0; i < maxAttempts; i++) {
+            try {
+                const response = await fetch(`/image_status/${itemType}/${itemId}`);
+                const result = await response.json();
+                if (result.status !== 'pending') {
+                    return result;
+                }
+            } catch (error) {
+                console.error('查询图片状态失败:', error);
+                return null;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+        return null;
+    }
+
     /**
      * 显示成功反馈
+     * @param {string} message 提示内容
      */
-    showSuccessFeedback() {
+    showSuccessFeedback(message = '数据已保存成功') {
         const toast = document.createElement('div');
         toast.className = 'position-fixed bottom-0 end-0 p-3';
         toast.innerHTML = `
@@ -159,7 +232,7 @@ class PropertyEditor {
                     <button type="button" class="btn-close btn-close-white" data-bs-dismiss="toast"></button>
                 </div>
                 <div class="toast-body">
-                    数据已保存成功
+                    ${message}
                 </div>
             </div>
         `;
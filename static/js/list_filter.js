@@ -1,12 +1,15 @@
 /**
  * @Author: Leili
  * @Date: 2025-05-28
- * @Description: 物品列表筛选功能
+ * @Description: 物品列表筛选与分页加载功能
  */
 
+// 每页加载数量
+const PAGE_SIZE = 50;
+
 /**
  * 列表筛选控制器
- * @description 管理物品列表页面的筛选功能
+ * @description 管理物品列表页面的筛选功能，首屏由服务端渲染，后续数据通过列表接口分页加载
  */
 class ListFilterController {
     /**
@@ -22,6 +25,14 @@ class ListFilterController {
         this.$filterStatusText = document.getElementById('filterStatusText');
         this.$tableBody = document.getElementById('itemsTableBody');
         this.$noDataMessage = document.getElementById('noDataMessage');
+        this.$sentinel = document.getElementById('loadMoreSentinel');
+        
+        // 分页状态：首屏数据由服务端渲染
+        this.nextCursor = this.$tableBody.dataset.nextCursor || null;
+        this.total = parseInt(this.$tableBody.dataset.total || '0', 10);
+        this.overallTotal = this.total;
+        this.loading = false;
+        this.requestSeq = 0;
         
         // 获取统计显示元素
         this.$categoryLabel = document.getElementById('categoryLabel');
@@ -56,6 +67,71 @@ class ListFilterController {
         
         // 显示全部按钮点击事件
         this.$showAllItems.addEventListener('click', () => this.resetFilter());
+        
+        // 滚动到底部时加载下一页
+        if (this.$sentinel && 'IntersectionObserver' in window) {
+            this.observer = new IntersectionObserver((entries) => {
+                if (entries.some(entry => entry.isIntersecting)) {
+                    this.loadMore();
+                }
+            }, { rootMargin: '400px' });
+            this.observer.observe(this.$sentinel);
+        }
+    }
+    
+    /**
+     * 请求一页数据
+     * @param {string} category 子类别筛选
+     * @param {string|null} cursor 分页游标
+     * @param {boolean} replace 是否替换现有表格行
+     */
+    async fetchPage(category, cursor, replace) {
+        const seq = ++this.requestSeq;
+        this.loading = true;
+        this.updateSentinel();
+        
+        const params = new URLSearchParams({ view: 'rows', fields: 'id', limit: PAGE_SIZE });
+        if (category) params.set('category', category);
+        if (cursor) params.set('cursor', cursor);
+        
+        try {
+            const response = await fetch(`/api/${this.pageType}/items?${params}`);
+            const result = await response.json();
+            // 筛选条件已变化，丢弃过期的响应
+            if (seq !== this.requestSeq) return;
+            if (!result.success) throw new Error(result.message);
+            
+            if (replace) {
+                this.$tableBody.innerHTML = result.html;
+            } else {
+                this.$tableBody.insertAdjacentHTML('beforeend', result.html);
+            }
+            this.nextCursor = result.next_cursor;
+            this.total = result.total;
+        } catch (error) {
+            console.error('加载列表数据失败:', error);
+        } finally {
+            if (seq === this.requestSeq) {
+                this.loading = false;
+                this.updateSentinel();
+            }
+        }
+    }
+    
+    /**
+     * 加载下一页
+     */
+    loadMore() {
+        if (this.loading || !this.nextCursor) return;
+        this.fetchPage(this.$categoryFilter.value, this.nextCursor, false);
+    }
+    
+    /**
+     * 更新分页哨兵显示状态
+     */
+    updateSentinel() {
+        if (!this.$sentinel) return;
+        this.$sentinel.classList.toggle('d-none', !this.nextCursor && !this.loading);
     }
     
     /**
@@ -73,16 +149,53 @@ class ListFilterController {
             // 应用筛选
             this.applyFilter();
         } else {
-            // 如果没有保存的筛选设置，显示全部数据的统计
-            this.updateStatsDisplay('');
+            // 如果没有保存的筛选设置，首屏已由服务端渲染全部数据的统计
+            this.updateSentinel();
+            // 页面可能来自 Service Worker 缓存，按数据版本增量同步
+            this.syncChanges();
         }
     }
     
+    /**
+     * 增量同步
+     * @description 只获取页面数据版本之后修改过的物品，已显示的行就地替换；
+     *              有新增物品、变化的物品未加载或版本已失效时重新加载第一页
+     */
+    async syncChanges() {
+        const version = this.$tableBody.dataset.version;
+        if (!version || !this.pageType) return;
+        
+        let result;
+        try {
+            const params = new URLSearchParams({ since: version, view: 'rows', fields: 'id' });
+            const response = await fetch(`/api/${this.pageType}/changes?${params}`);
+            result = await response.json();
+        } catch (error) {
+            // 离线时继续显示缓存的页面
+            return;
+        }
+        if (!result.success || result.version === version) return;
+        this.$tableBody.dataset.version = result.version;
+        
+        const rows = result.full ? null : result.items.map(
+            item => this.$tableBody.querySelector(`tr[data-href="/${this.pageType}/${item.id}"]`)
+        );
+        if (!rows || rows.some(row => !row)) {
+            await this.applyFilter();
+            return;
+        }
+        if (rows.length === 0) return;
+        rows.forEach((row, index) => {
+            row.outerHTML = result.rows[result.items[index].id];
+        });
+        this.updateStatsDisplay(this.$categoryFilter.value);
+    }
+    
     /**
      * 应用筛选
-     * @description 根据筛选条件过滤表格数据
+     * @description 根据筛选条件从服务端重新加载第一页数据
      */
-    applyFilter() {
+    async applyFilter() {
         const categoryValue = this.$categoryFilter.value;
         
         // 保存筛选设置到localStorage
@@ -90,50 +203,44 @@ class ListFilterController {
             localStorage.setItem(`${this.pageType}_category_filter`, categoryValue);
         }
         
-        // 获取所有行
-        const rows = this.$tableBody.querySelectorAll('tr');
+        // 更新统计信息显示
+        this.updateStatsDisplay(categoryValue);
         
-        // 筛选计数器
-        let visibleCount = 0;
-        
-        // 遍历所有行应用筛选
-        rows.forEach(row => {
-            const rowCategory = row.getAttribute('data-category');
-            
-            // 如果没有选择类别或类别匹配,则显示行
-            if (!categoryValue || rowCategory === categoryValue) {
-                row.classList.remove('d-none');
-                visibleCount++;
-            } else {
-                row.classList.add('d-none');
-            }
-        });
+        // 重新加载第一页
+        this.nextCursor = null;
+        await this.fetchPage(categoryValue, null, true);
         
         // 更新筛选状态显示
-        this.updateFilterStatus(categoryValue, visibleCount, rows.length);
+        this.updateFilterStatus(categoryValue, this.total, this.overallTotal);
         
         // 显示或隐藏无数据提示
-        if (visibleCount === 0) {
+        if (this.total === 0) {
             this.$noDataMessage.classList.remove('d-none');
         } else {
             this.$noDataMessage.classList.add('d-none');
         }
-        
-        // 更新统计信息显示
-        this.updateStatsDisplay(categoryValue);
     }
     
     /**
      * 更新统计信息显示
      * @param {string} category 当前筛选的类别
      */
-    updateStatsDisplay(category) {
+    async updateStatsDisplay(category) {
         // 如果统计元素不存在，则返回
-        if (!this.$existingPriceDisplay || typeof categoryStats === 'undefined') return;
+        if (!this.$existingPriceDisplay) return;
         
-        // 确定要显示的统计数据
-        const statsKey = category || 'all';
-        const stats = categoryStats[statsKey] || categoryStats['all'];
+        // 从统计接口获取当前类别的统计数据
+        let stats;
+        try {
+            const params = new URLSearchParams({ category: category || '' });
+            const response = await fetch(`/api/${this.pageType}/stats?${params}`);
+            const result = await response.json();
+            stats = result.stats;
+        } catch (error) {
+            console.error('加载统计数据失败:', error);
+        }
+        // 期间筛选条件已变化，或请求失败时不更新
+        if (!stats || (category || '') !== this.$categoryFilter.value) return;
         
         // 格式化价格显示
         const formatPrice = (price) => {
@@ -152,16 +259,16 @@ class ListFilterController {
         }
         
         // 更新持有物品统计
-        if (this.$existingPriceDisplay && stats.purchasePriceExisting !== undefined) {
-            this.$existingPriceDisplay.textContent = formatPrice(stats.purchasePriceExisting);
+        if (this.$existingPriceDisplay && stats.purchase_price_existing !== undefined) {
+            this.$existingPriceDisplay.textContent = formatPrice(stats.purchase_price_existing);
         }
-        if (this.$existingCountDisplay && stats.existingCount !== undefined) {
-            this.$existingCountDisplay.textContent = `(${stats.existingCount}件)`;
+        if (this.$existingCountDisplay && stats.existing_count !== undefined) {
+            this.$existingCountDisplay.textContent = `(${stats.existing_count}件)`;
         }
         
         // 计算并更新盈亏统计
-        if (this.$profitDisplay && stats.soldPrice !== undefined && stats.purchasePriceSold !== undefined) {
-            const profit = stats.soldPrice - stats.purchasePriceSold;
+        if (this.$profitDisplay && stats.sold_price !== undefined && stats.purchase_price_sold !== undefined) {
+            const profit = stats.sold_price - stats.purchase_price_sold;
             const profitText = (profit >= 0 ? '+' : '') + formatPrice(profit);
             this.$profitDisplay.textContent = profitText;
             
@@ -187,13 +294,13 @@ class ListFilterController {
             // 更新盈亏详情
             if (this.$profitDetail) {
                 this.$profitDetail.textContent = 
-                    formatPrice(stats.soldPrice) + ' - ' + formatPrice(stats.purchasePriceSold);
+                    formatPrice(stats.sold_price) + ' - ' + formatPrice(stats.purchase_price_sold);
             }
         }
         
         // 更新总投入统计
-        if (this.$totalPriceDisplay && stats.purchasePrice !== undefined) {
-            this.$totalPriceDisplay.textContent = formatPrice(stats.purchasePrice);
+        if (this.$totalPriceDisplay && stats.purchase_price !== undefined) {
+            this.$totalPriceDisplay.textContent = formatPrice(stats.purchase_price);
         }
         if (this.$totalCountDisplay && stats.count !== undefined) {
             this.$totalCountDisplay.textContent = `(${stats.count}件)`;
@@ -203,8 +310,8 @@ class ListFilterController {
     /**
      * 更新筛选状态显示
      * @param {string} category 当前筛选的类别
-     * @param {number} visibleCount 可见行数
-     * @param {number} totalCount 总行数
+     * @param {number} visibleCount 符合筛选条件的物品数
+     * @param {number} totalCount 物品总数
      */
     updateFilterStatus(category, visibleCount, totalCount) {
         if (category) {
@@ -230,7 +337,7 @@ class ListFilterController {
             localStorage.removeItem(`${this.pageType}_category_filter`);
         }
         
-        // 重新应用筛选(实际上是显示所有行)
+        // 重新应用筛选(实际上是加载全部数据)
         this.applyFilter();
     }
 }
@@ -94,14 +94,34 @@ class NewItemController {
             }
         });
 
-        // 添加图片文件（如果有）
-        if (this.$imageUpload && this.$imageUpload.files[0]) {
-            formData.append('image', this.$imageUpload.files[0]);
-        }
-
         return formData;
     }
 
+    /**
+     * 分块上传选择的图片，在提交按钮上显示进度
+     * @returns {Promise<string|null>} 上传后的哈希文件名，未选择图片时返回null
+     */
+    async uploadImage() {
+        const file = this.$imageUpload && this.$imageUpload.files[0];
+        if (!file) {
+            return null;
+        }
+        const $submitBtn = this.$form.querySelector('button[type="submit"]');
+        const label = $submitBtn.textContent;
+        $submitBtn.disabled = true;
+        const uploader = new ChunkedUploader({
+            onProgress: (loaded, total) => {
+                $submitBtn.textContent = `上传图片 ${Math.floor(loaded * 100 / total)}%`;
+            }
+        });
+        try {
+            return await uploader.upload(file);
+        } finally {
+            $submitBtn.disabled = false;
+            $submitBtn.textContent = label;
+        }
+    }
+
     /**
      * 处理表单提交
      * @param {Event} e 表单提交事件
@@ -117,6 +137,12 @@ class NewItemController {
         }
         
         try {
+            // 图片先分块上传，表单只提交上传后的文件名
+            const uploadedImage = await this.uploadImage();
+            if (uploadedImage) {
+                formData.append('uploaded_image', uploadedImage);
+            }
+            
             const response = await fetch('/create_item', {
                 method: 'POST',
                 body: formData // 不设置Content-Type，让浏览器自动处理
@@ -131,7 +157,8 @@ class NewItemController {
             const result = await response.json();
             
             if (result.success) {
-                alert('新建成功！');
+                // 离线时由 Service Worker 暂存，联网后自动提交
+                alert(result.queued ? result.message : '新建成功！');
                 // 根据物品类型跳转到对应列表页
                 const itemType = this.$form.dataset.itemType;
                 window.location.href = `/${itemType}`;
@@ -0,0 +1,53 @@
+/**
+ * @Author: Leili
+ * @Date: 2025-07-02
+ * @Description: 注册 Service Worker，联网后通知其重新提交离线时暂存的编辑，并显示提交结果
+ */
+
+(() => {
+    if (!('serviceWorker' in navigator)) {
+        return;
+    }
+    const assetVersion = document.currentScript.dataset.assetVersion || '';
+
+    /**
+     * 显示离线编辑的提交结果
+     * @param {string} text 提示内容
+     * @param {boolean} success 是否成功
+     */
+    const showNotice = (text, success) => {
+        const notice = document.createElement('div');
+        notice.className = `alert ${success ? 'alert-success' : 'alert-warning'} position-fixed bottom-0 end-0 m-3 shadow-sm`;
+        notice.style.zIndex = 1080;
+        notice.textContent = text;
+        document.body.appendChild(notice);
+        setTimeout(() => notice.remove(), 5000);
+    };
+
+    window.addEventListener('load', () => {
+        navigator.serviceWorker.register(`/sw.js?v=${encodeURIComponent(assetVersion)}`).catch(error => {
+            console.error('Service Worker 注册失败:', error);
+        });
+    });
+
+    // 不支持 Background Sync 的浏览器在重新联网时由页面通知
+    window.addEventListener('online', () => {
+        if (navigator.serviceWorker.controller) {
+            navigator.serviceWorker.controller.postMessage({ type: 'replay' });
+        }
+    });
+
+    navigator.serviceWorker.addEventListener('message', (event) => {
+        const data = event.data || {};
+        if (data.type !== 'replayed') {
+            return;
+        }
+        if (data.success) {
+            showNotice('离线时的修改已提交', true);
+        } else if (data.status === 409) {
+            showNotice('离线时修改的物品已被其他人修改，该修改未提交，请刷新后重新编辑', false);
+        } else {
+            showNotice(`离线时的修改提交失败: ${data.message || data.status}`, false);
+        }
+    });
+})();
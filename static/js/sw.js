@@ -0,0 +1,344 @@
+/**
+ * @Author: Leili
+ * @Date: 2025-07-02
+ * @Description: Service Worker：缓存应用外壳、图片和页面，离线时暂存编辑并在联网后重新提交
+ *
+ * 缓存策略：
+ *   - 应用外壳（/static 下的样式、脚本、图标及 CDN 资源）：先用缓存，后台更新
+ *   - 图片（WebP 及哈希命名的原图）：只用缓存，超出数量上限时删除最早缓存的
+ *   - 页面：先用缓存立即显示，后台按 ETag 重新验证；列表页加载后再通过增量同步接口就地更新
+ *   - 接口：优先网络，离线时使用缓存；增量同步、上传等接口不缓存
+ *   - 编辑和新建（/update_properties、/create_item）：离线时存入 IndexedDB，联网后按顺序重新提交，
+ *     请求带有编辑时的版本号，期间被其他人修改的物品返回409，不会覆盖
+ */
+
+const ASSET_VERSION = new URL(self.location).searchParams.get('v') || 'dev';
+const SHELL_CACHE = `shell-${ASSET_VERSION}`;
+const PAGE_CACHE = 'pages';
+const IMAGE_CACHE = 'images';
+const MAX_IMAGES = 500;
+
+// 安装时预先缓存的应用外壳
+const SHELL_URLS = [
+    '/static/css/main.css',
+    '/static/js/detail.js',
+    '/static/js/list_filter.js',
+    '/static/js/new_item.js',
+    '/static/js/pwa.js',
+    '/static/js/uploader.js',
+    '/static/manifest.json',
+    '/static/icon/物品管理.svg',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js',
+    'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css'
+];
+const CDN_HOSTS = ['cdn.jsdelivr.net', 'cdnjs.cloudflare.com', 'fonts.googleapis.com', 'fonts.gstatic.com'];
+
+// 离线时暂存的写请求
+const QUEUED_PATHS = ['/update_properties', '/create_item'];
+// 不经过缓存的路径前缀
+const NETWORK_ONLY = ['/api/uploads', '/image_status/', '/healthz', '/readyz', '/metrics', '/sw.js'];
+
+const DB_NAME = 'storage-management';
+const QUEUE_STORE = 'queued-requests';
+const SYNC_TAG = 'replay-queued-requests';
+
+self.addEventListener('install', (event) => {
+    event.waitUntil((async () => {
+        const cache = await caches.open(SHELL_CACHE);
+        // 单个资源失败（如 CDN 不可用）不影响安装
+        await Promise.allSettled(SHELL_URLS.map(url => cache.add(url)));
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names
+            .filter(name => name.startsWith('shell-') && name !== SHELL_CACHE)
+            .map(name => caches.delete(name)));
+        await self.clients.claim();
+        await replayQueue();
+    })());
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    const url = new URL(request.url);
+
+    if (request.method === 'POST' && url.origin === self.location.origin && QUEUED_PATHS.includes(url.pathname)) {
+        event.respondWith(sendOrQueue(request));
+        return;
+    }
+    if (request.method !== 'GET') {
+        return;
+    }
+    if (url.origin !== self.location.origin) {
+        if (CDN_HOSTS.includes(url.hostname)) {
+            event.respondWith(staleWhileRevalidate(request, SHELL_CACHE));
+        }
+        return;
+    }
+    if (NETWORK_ONLY.some(prefix => url.pathname.startsWith(prefix)) || url.pathname.endsWith('/changes')) {
+        return;
+    }
+    if (url.pathname.startsWith('/images/') || isConvertedImage(url.pathname)) {
+        event.respondWith(cacheFirst(request, IMAGE_CACHE));
+    } else if (url.pathname.startsWith('/static/')) {
+        event.respondWith(staleWhileRevalidate(request, SHELL_CACHE));
+    } else if (url.pathname.startsWith('/api/')) {
+        event.respondWith(networkFirst(request, PAGE_CACHE));
+    } else if (request.mode === 'navigate') {
+        event.respondWith(staleWhileRevalidate(request, PAGE_CACHE));
+    }
+});
+
+self.addEventListener('sync', (event) => {
+    if (event.tag === SYNC_TAG) {
+        event.waitUntil(replayQueue());
+    }
+});
+
+self.addEventListener('message', (event) => {
+    // 页面检测到重新联网时通知重新提交（不支持 Background Sync 的浏览器）
+    if (event.data && event.data.type === 'replay') {
+        event.waitUntil(replayQueue());
+    }
+});
+
+/**
+ * 是否为转换后的 WebP 图片，原图通过 /static/images 访问时不缓存
+ * @param {string} path 请求路径
+ * @returns {boolean}
+ */
+function isConvertedImage(path) {
+    return path.startsWith('/static/images/') && path.endsWith('.webp');
+}
+
+/**
+ * 响应是否可以缓存，跨域资源为不透明响应
+ * @param {Response} response 响应
+ * @returns {boolean}
+ */
+function cacheable(response) {
+    return response.ok || response.type === 'opaque';
+}
+
+/**
+ * 先用缓存，没有时请求网络并缓存，用于内容不变的图片
+ */
+async function cacheFirst(request, cacheName) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    if (cached) {
+        return cached;
+    }
+    const response = await fetch(request);
+    if (cacheable(response)) {
+        await cache.put(request, response.clone());
+        await trimCache(cache, MAX_IMAGES);
+    }
+    return response;
+}
+
+/**
+ * 有缓存时立即返回，同时在后台请求网络更新缓存；没有缓存时等待网络
+ */
+async function staleWhileRevalidate(request, cacheName) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    const update = fetch(request).then(async (response) => {
+        if (cacheable(response)) {
+            await cache.put(request, response.clone());
+        }
+        return response;
+    });
+    if (cached) {
+        update.catch(() => {});  // 离线时继续使用缓存
+        return cached;
+    }
+    return update;
+}
+
+/**
+ * 优先请求网络并更新缓存，离线时返回缓存
+ */
+async function networkFirst(request, cacheName) {
+    const cache = await caches.open(cacheName);
+    try {
+        const response = await fetch(request);
+        if (response.ok) {
+            await cache.put(request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        const cached = await cache.match(request);
+        if (cached) {
+            return cached;
+        }
+        throw error;
+    }
+}
+
+/**
+ * 删除最早缓存的条目，使缓存数量不超过上限
+ */
+async function trimCache(cache, maxEntries) {
+    const keys = await cache.keys();
+    for (const key of keys.slice(0, Math.max(0, keys.length - maxEntries))) {
+        await cache.delete(key);
+    }
+}
+
+/**
+ * 提交写请求，离线时暂存并返回202
+ * @param {Request} request 写请求
+ * @returns {Promise<Response>}
+ */
+async function sendOrQueue(request) {
+    const copy = request.clone();
+    try {
+        const response = await fetch(request);
+        if (response.ok) {
+            // 数据已变化，缓存的页面需要重新获取
+            await caches.delete(PAGE_CACHE);
+        }
+        return response;
+    } catch (error) {
+        await enqueue(copy);
+        return new Response(JSON.stringify({
+            success: true,
+            queued: true,
+            message: '当前处于离线状态，修改已暂存，联网后自动提交'
+        }), { status: 202, headers: { 'Content-Type': 'application/json' } });
+    }
+}
+
+/**
+ * 打开 IndexedDB
+ * @returns {Promise<IDBDatabase>}
+ */
+function openDatabase() {
+    return new Promise((resolve, reject) => {
+        const open = indexedDB.open(DB_NAME, 1);
+        open.onupgradeneeded = () => open.result.createObjectStore(QUEUE_STORE, { autoIncrement: true });
+        open.onsuccess = () => resolve(open.result);
+        open.onerror = () => reject(open.error);
+    });
+}
+
+/**
+ * 在对象仓库上执行一个操作
+ * @param {string} mode 'readonly' 或 'readwrite'
+ * @param {Function} operation 参数为对象仓库，返回 IDBRequest
+ * @returns {Promise<*>} 请求结果
+ */
+async function withStore(mode, operation) {
+    const db = await openDatabase();
+    try {
+        return await new Promise((resolve, reject) => {
+            const transaction = db.transaction(QUEUE_STORE, mode);
+            const request = operation(transaction.objectStore(QUEUE_STORE));
+            transaction.oncomplete = () => resolve(request.result);
+            transaction.onerror = () => reject(transaction.error);
+        });
+    } finally {
+        db.close();
+    }
+}
+
+/**
+ * 暂存写请求：表单字段（包括图片文件）和 If-Match 请求头
+ * @param {Request} request 写请求
+ */
+async function enqueue(request) {
+    const formData = await request.formData();
+    const headers = [];
+    const ifMatch = request.headers.get('If-Match');
+    if (ifMatch) {
+        headers.push(['If-Match', ifMatch]);
+    }
+    await withStore('readwrite', store => store.add({
+        url: request.url,
+        headers,
+        fields: [...formData.entries()],
+        queuedAt: Date.now()
+    }));
+    if (self.registration.sync) {
+        try {
+            await self.registration.sync.register(SYNC_TAG);
+        } catch (error) {
+            // 不支持或未授权 Background Sync 时，由页面在联网后通知
+        }
+    }
+}
+
+let replaying = null;
+
+/**
+ * 重新提交暂存的写请求，激活、Background Sync 和页面通知可能同时触发，同一时间只执行一次
+ * @returns {Promise<void>}
+ */
+function replayQueue() {
+    if (!replaying) {
+        replaying = replayQueued().finally(() => {
+            replaying = null;
+        });
+    }
+    return replaying;
+}
+
+/**
+ * 按暂存顺序重新提交写请求
+ * 网络错误或服务端错误时停止，保留剩余请求等待下次重试；
+ * 其他响应（成功、409 版本冲突、400 校验失败）都从队列中移除并通知页面
+ */
+async function replayQueued() {
+    const keys = await withStore('readonly', store => store.getAllKeys());
+    let replayed = false;
+    for (const key of keys) {
+        const entry = await withStore('readonly', store => store.get(key));
+        if (!entry) {
+            continue;
+        }
+        const body = new FormData();
+        entry.fields.forEach(([name, value]) => body.append(name, value));
+        let response;
+        try {
+            response = await fetch(entry.url, { method: 'POST', headers: entry.headers, body });
+        } catch (error) {
+            break;
+        }
+        if (response.status >= 500) {
+            break;
+        }
+        await withStore('readwrite', store => store.delete(key));
+        replayed = true;
+        let result = {};
+        try {
+            result = await response.json();
+        } catch (error) {
+            // 非JSON响应
+        }
+        await notifyClients({
+            type: 'replayed',
+            url: entry.url,
+            status: response.status,
+            success: response.ok && result.success !== false,
+            message: result.message || ''
+        });
+    }
+    if (replayed) {
+        await caches.delete(PAGE_CACHE);
+    }
+}
+
+/**
+ * 向所有打开的页面发送消息
+ * @param {Object} message 消息内容
+ */
+async function notifyClients(message) {
+    const clients = await self.clients.matchAll({ type: 'window' });
+    clients.forEach(client => client.postMessage(message));
+}
@@ -0,0 +1,131 @@
+/**
+ * @Author: Leili
+ * @Date: 2025-07-02
+ * @Description: 分块、可续传的图片上传
+ */
+
+/**
+ * 分块上传器
+ * @description 先创建上传会话，再按块发送文件；网络中断时查询服务端已接收的字节数后续传，
+ *              会话ID保存在 localStorage 中，刷新页面后重新选择同一文件也能续传
+ */
+class ChunkedUploader {
+    /**
+     * @param {Object} options 选项
+     * @param {number} options.chunkSize 每块字节数，不超过服务端返回的上限
+     * @param {number} options.maxRetries 单块连续失败的最大重试次数
+     * @param {Function} options.onProgress 进度回调，参数为 (已上传字节数, 总字节数)
+     */
+    constructor({ chunkSize = 1024 * 1024, maxRetries = 8, onProgress = null } = {}) {
+        this.chunkSize = chunkSize;
+        this.maxRetries = maxRetries;
+        this.onProgress = onProgress;
+    }
+
+    /**
+     * 上传文件
+     * @param {File} file 图片文件
+     * @returns {Promise<string>} 服务端保存的哈希文件名，创建或更新物品时作为 uploaded_image 提交
+     */
+    async upload(file) {
+        const storageKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        let session = await this.resumeSession(localStorage.getItem(storageKey));
+        if (!session) {
+            session = await this.request('/api/uploads', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ filename: file.name, size: file.size })
+            });
+            localStorage.setItem(storageKey, session.upload_id);
+        }
+        const chunkSize = Math.min(this.chunkSize, session.chunk_size || this.chunkSize);
+
+        let offset = session.offset;
+        let failures = 0;
+        while (true) {
+            this.reportProgress(offset, file.size);
+            try {
+                const end = Math.min(offset + chunkSize, file.size);
+                const result = await this.request(`/api/uploads/${session.upload_id}`, {
+                    method: 'PATCH',
+                    headers: {
+                        'Content-Type': 'application/offset+octet-stream',
+                        'Upload-Offset': String(offset)
+                    },
+                    body: file.slice(offset, end)
+                });
+                failures = 0;
+                offset = result.offset;
+                if (result.image) {
+                    localStorage.removeItem(storageKey);
+                    this.reportProgress(file.size, file.size);
+                    return result.image;
+                }
+            } catch (error) {
+                // 文件不符合要求等客户端错误不重试
+                if (error.status && error.status !== 409 && error.status < 500) {
+                    localStorage.removeItem(storageKey);
+                    throw error;
+                }
+                if (++failures > this.maxRetries) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, Math.min(30000, 500 * 2 ** failures)));
+                // 中断的块可能已部分写入，以服务端的偏移量为准
+                const status = await this.resumeSession(session.upload_id);
+                if (!status) {
+                    localStorage.removeItem(storageKey);
+                    throw error;
+                }
+                offset = status.offset;
+            }
+        }
+    }
+
+    /**
+     * 查询已有上传会话
+     * @param {string|null} uploadId 会话ID
+     * @returns {Promise<Object|null>} 会话状态，会话不存在或网络错误时返回null
+     */
+    async resumeSession(uploadId) {
+        if (!uploadId) {
+            return null;
+        }
+        try {
+            return await this.request(`/api/uploads/${uploadId}`);
+        } catch (error) {
+            return null;
+        }
+    }
+
+    /**
+     * 发送请求并解析JSON结果
+     * @param {string} url 请求地址
+     * @param {Object} options fetch 选项
+     * @returns {Promise<Object>} 成功时的响应数据
+     */
+    async request(url, options = {}) {
+        const response = await fetch(url, options);
+        let result = null;
+        try {
+            result = await response.json();
+        } catch (error) {
+            // 代理返回的错误页等非JSON响应
+        }
+        if (!response.ok || !result || !result.success) {
+            const error = new Error((result && result.message) || `上传失败 (${response.status})`);
+            error.status = response.status;
+            throw error;
+        }
+        return result;
+    }
+
+    /**
+     * 调用进度回调
+     */
+    reportProgress(loaded, total) {
+        if (this.onProgress) {
+            this.onProgress(loaded, total);
+        }
+    }
+}
@@ -0,0 +1,30 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/tests/conftest.py
+Description: 测试公共夹具，在临时目录中生成合成数据，数据目录等相对路径都指向该目录
+'''
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import write_dataset  # noqa: E402
+
+
+@pytest.fixture
+def data_root(tmp_path, monkeypatch):
+    """
+    在临时目录下生成 data/{figures,clothing,goods}.csv，并切换到该目录
+
+    返回:
+        Path: 临时目录
+    """
+    write_dataset(str(tmp_path), 60, seed=1)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
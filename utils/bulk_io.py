@@ -0,0 +1,222 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/bulk_io.py
+Description: 物品批量导入导出，流式读写CSV/JSONL，导入按批次一次写入
+用法:
+    python -m utils.bulk_io import <物品类型> <文件.csv|文件.jsonl>
+    python -m utils.bulk_io export <物品类型> <文件.csv|文件.jsonl>
+    python -m utils.bulk_io import <物品类型> <文件> --collection <收藏ID>
+'''
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+from .item_manager import serialize_item
+
+# 导入时每批写入的物品数
+IMPORT_BATCH_SIZE = 1000
+# 导出时每次生成的行数
+EXPORT_CHUNK_SIZE = 1000
+# 导入结果中最多返回的错误数
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = ('csv', 'jsonl')
+
+
+def detect_format(filename, default='csv'):
+    """
+    根据文件扩展名判断格式
+
+    参数:
+        filename (str): 文件名
+        default (str): 无法判断时使用的格式
+
+    返回:
+        str: 'csv' 或 'jsonl'
+    """
+    lower = (filename or '').lower()
+    if lower.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if lower.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def iter_rows(stream, fmt):
+    """
+    逐行读取导入文件，不会一次读入整个文件
+
+    参数:
+        stream: 二进制或文本文件对象
+        fmt (str): 'csv' 或 'jsonl'
+
+    返回:
+        generator: (行号, 数据字典或错误消息) ，无法解析的行返回错误消息字符串
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'不支持的格式: {fmt}')
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, f'JSON解析失败: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield line_no, 'JSON行必须是对象'
+            continue
+        yield line_no, row
+
+
+def import_items(category, rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    批量导入物品
+
+    每行按 ItemCategory.build_item 校验并补全默认值，忽略行中的ID，新ID按批次连续分配；
+    每积累 batch_size 个物品调用一次 create_items，整批只写入一次。导入期间不自动合并
+    变更日志，全部写入后合并一次，避免每批重写整个CSV
+
+    参数:
+        category (ItemCategory): 目标物品类别
+        rows (iterable): iter_rows 生成的 (行号, 数据字典或错误消息)
+        batch_size (int): 每批物品数
+
+    返回:
+        dict:
+            created (int): 成功导入的物品数
+            first_id (int): 第一个新ID，没有导入时为None
+            last_id (int): 最后一个新ID，没有导入时为None
+            errors (list): {'line': 行号, 'message': 错误消息}，最多 MAX_REPORTED_ERRORS 条
+            error_count (int): 失败的行数
+    """
+    result = {'created': 0, 'first_id': None, 'last_id': None, 'errors': [], 'error_count': 0}
+
+    def record_error(line_no, message):
+        result['error_count'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'line': line_no, 'message': message})
+
+    def flush(batch):
+        new_ids = category.create_items(batch, compact=False)
+        if new_ids:
+            result['created'] += len(new_ids)
+            if result['first_id'] is None:
+                result['first_id'] = new_ids[0]
+            result['last_id'] = new_ids[-1]
+
+    batch = []
+    for line_no, row in rows:
+        if isinstance(row, str):
+            record_error(line_no, row)
+            continue
+        try:
+            batch.append(category.build_item(row))
+        except ValueError as e:
+            record_error(line_no, str(e))
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    flush(batch)
+    if result['created']:
+        category.compact()
+    return result
+
+
+def export_items(category, fmt, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    流式导出物品，按ID顺序分块生成文本，不会拼接整个文件
+
+    参数:
+        category (ItemCategory): 物品类别
+        fmt (str): 'csv' 或 'jsonl'
+        chunk_size (int): 每块行数
+
+    返回:
+        generator: 文本块
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'不支持的格式: {fmt}')
+    df = category.export_frame()
+
+    if fmt == 'csv':
+        yield df.head(0).to_csv(index=False)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size].to_csv(index=False, header=False)
+        return
+
+    columns = list(df.columns)
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        yield ''.join(
+            json.dumps(serialize_item(dict(zip(columns, values))), ensure_ascii=False) + '\n'
+            for values in chunk.itertuples(index=False, name=None)
+        )
+
+
+def main(argv=None):
+    """
+    命令行入口，直接读写数据目录（默认收藏为 data/），正在运行的服务会根据存储签名自动感知变化
+    """
+    from .item_manager import ItemCategory
+    from .tenants import CONFIG_NAME, DEFAULT_TENANT, is_valid_tenant, load_collection
+
+    parser = argparse.ArgumentParser(description='物品批量导入导出')
+    parser.add_argument('action', choices=('import', 'export'))
+    parser.add_argument('item_type', help='物品类型，如 figures、clothing、goods 或收藏中自定义的类别')
+    parser.add_argument('path', help="文件路径，'-' 表示标准输入/输出")
+    parser.add_argument('--format', choices=FORMATS, help='文件格式，默认按扩展名判断')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument('--collection', default=DEFAULT_TENANT, help='收藏ID，默认为 data/ 下的默认收藏')
+    parser.add_argument('--root', default=os.path.join('data', 'collections'), help='收藏根目录')
+    args = parser.parse_args(argv)
+
+    data_dir = 'data' if args.collection == DEFAULT_TENANT else os.path.join(args.root, args.collection)
+    if args.collection != DEFAULT_TENANT and not (is_valid_tenant(args.collection)
+                                                  and os.path.isfile(os.path.join(data_dir, CONFIG_NAME))):
+        parser.error(f'收藏不存在: {args.collection}')
+    _, definitions = load_collection(data_dir)
+    if args.item_type not in definitions:
+        parser.error(f'收藏 {args.collection} 中没有类别 {args.item_type}')
+    category = ItemCategory(args.item_type, data_dir=data_dir,
+                            main_category=definitions[args.item_type]['main_category'])
+    fmt = args.format or detect_format(args.path)
+
+    if args.action == 'import':
+        if args.path == '-':
+            result = import_items(category, iter_rows(sys.stdin.buffer, fmt), args.batch_size)
+        else:
+            with open(args.path, 'rb') as f:
+                result = import_items(category, iter_rows(f, fmt), args.batch_size)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 1 if result['error_count'] else 0
+
+    if args.path == '-':
+        for chunk in export_items(category, fmt):
+            sys.stdout.write(chunk)
+    else:
+        with open(args.path, 'w', encoding='utf-8', newline='') as f:
+            for chunk in export_items(category, fmt):
+                f.write(chunk)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
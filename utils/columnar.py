@@ -0,0 +1,201 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/columnar.py
+Description: 物品数据的二进制列式快照，固定列类型，读取时内存映射
+'''
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# 文件格式:
+#   8字节魔数 + 8字节小端序头部长度 + JSON头部 + 按 _ALIGN 对齐的列数据
+# 头部记录行数、快照来源CSV的签名以及每列的类型和数据位置
+MAGIC = b'SMCOLS01'
+_ALIGN = 64
+
+# 固定类型的字段，其余字段按 pandas 推断的类型保存（数值或文本）
+# 行版本号在旧数据中缺失，与价格一样按浮点保存
+FLOAT_FIELDS = ('purchase_price', 'shipping_fee', 'sold_price', 'version')
+DATE_FIELDS = ('purchase_date', 'arrival_date', 'sold_date')
+CATEGORY_FIELDS = ('main_category', 'category', 'purchase_channel', 'condition')
+
+# date32 列中表示缺失的值
+MISSING_DATE = np.iinfo(np.int32).min
+
+
+def to_dates(values):
+    """
+    将日期字符串解析为 datetime64，无法解析的值为 NaT
+
+    参数:
+        values: Series 或标量
+
+    返回:
+        与输入对应的 Series 或 Timestamp/NaT
+    """
+    return pd.to_datetime(values, errors='coerce', format='mixed')
+
+
+def write_snapshot(path, df, source=None):
+    """
+    原子写入列式快照（写入临时文件后重命名）
+
+    参数:
+        path (str): 快照路径
+        df (DataFrame): 要保存的数据
+        source (tuple): 快照来源CSV的签名，用于判断CSV是否在之后被修改
+    """
+    columns = []
+    buffers = []
+    offset = 0
+    for name in df.columns:
+        meta, parts = _encode_column(name, df[name])
+        meta['buffers'] = []
+        for part in parts:
+            offset += -offset % _ALIGN
+            meta['buffers'].append([offset, len(part)])
+            buffers.append((offset, part))
+            offset += len(part)
+        columns.append(meta)
+
+    header = json.dumps({
+        'rows': len(df),
+        'source': list(source) if source else None,
+        'columns': columns
+    }, ensure_ascii=False).encode('utf-8')
+    prefix = MAGIC + struct.pack('<Q', len(header)) + header
+    base = len(prefix) + (-len(prefix) % _ALIGN)
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(prefix.ljust(base, b'\0'))
+            for position, part in buffers:
+                f.seek(base + position)
+                f.write(part)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_snapshot(path):
+    """
+    读取列式快照
+
+    数值列直接引用内存映射的数据，不复制；日期、分类和文本列按需转换。
+    快照只通过重命名整体替换，已映射的旧文件在引用释放前保持有效
+
+    参数:
+        path (str): 快照路径
+
+    返回:
+        tuple: (DataFrame, 来源CSV签名)，签名为None表示快照不是由CSV导入的
+
+    异常:
+        FileNotFoundError: 快照不存在时抛出
+        ValueError: 文件格式无效时抛出
+    """
+    with open(path, 'rb') as f:
+        if os.name == 'nt':
+            # Windows 下被映射的文件无法被替换，直接读入内存
+            buffer = f.read()
+        else:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError(f'无效的快照文件: {path}')
+    header_size, = struct.unpack_from('<Q', buffer, len(MAGIC))
+    header_end = len(MAGIC) + 8 + header_size
+    header = json.loads(bytes(buffer[len(MAGIC) + 8:header_end]).decode('utf-8'))
+    base = header_end + (-header_end % _ALIGN)
+
+    rows = header['rows']
+    data = {}
+    for meta in header['columns']:
+        parts = [memoryview(buffer)[base + offset:base + offset + size] for offset, size in meta['buffers']]
+        data[meta['name']] = _decode_column(meta, parts, rows)
+    df = pd.DataFrame(data, index=pd.RangeIndex(rows), copy=False)
+    source = tuple(header['source']) if header['source'] else None
+    return df, source
+
+
+def _encode_column(name, column):
+    """
+    按列类型编码一列数据
+
+    返回:
+        tuple: (列元数据, 数据块列表)
+    """
+    missing = column.isna().to_numpy()
+    if name in DATE_FIELDS or column.dtype.kind == 'M':
+        days = to_dates(column).to_numpy().astype('datetime64[D]').astype(np.int64)
+        days = np.where(missing | (days == np.iinfo(np.int64).min), MISSING_DATE, days)
+        return {'name': name, 'kind': 'date32'}, [days.astype('<i4').tobytes()]
+
+    if name in FLOAT_FIELDS:
+        values = pd.to_numeric(column, errors='coerce').to_numpy(dtype='<f8', na_value=np.nan)
+        return {'name': name, 'kind': 'float64'}, [values.tobytes()]
+
+    if name in CATEGORY_FIELDS:
+        codes, categories = pd.factorize(column.astype(object).where(~missing, None).map(
+            lambda value: value if value is None else str(value)), sort=True)
+        meta = {'name': name, 'kind': 'category', 'categories': list(categories)}
+        return meta, [codes.astype('<i4').tobytes()]
+
+    if column.dtype.kind in 'iub':
+        return {'name': name, 'kind': 'int64'}, [column.to_numpy().astype('<i8').tobytes()]
+    if column.dtype.kind == 'f':
+        values = column.to_numpy().astype('<f8')
+        # ID等整数列在含有缺失值前以整数保存
+        if not missing.any() and np.array_equal(values, np.round(values)) and \
+                np.abs(values).max(initial=0) < 2 ** 53:
+            return {'name': name, 'kind': 'int64'}, [values.astype('<i8').tobytes()]
+        return {'name': name, 'kind': 'float64'}, [values.tobytes()]
+
+    # 文本列以 \0 分隔的 UTF-8 保存，另存缺失掩码
+    texts = column.astype(object).where(~missing, '').map(lambda value: str(value).replace('\0', ''))
+    blob = '\0'.join(texts).encode('utf-8')
+    return {'name': name, 'kind': 'text'}, [blob, missing.astype(np.uint8).tobytes()]
+
+
+def _decode_column(meta, parts, rows):
+    """
+    按列元数据解码一列数据
+
+    返回:
+        Series 或 ndarray
+    """
+    kind = meta['kind']
+    if kind == 'int64':
+        return np.frombuffer(parts[0], dtype='<i8', count=rows)
+    if kind == 'float64':
+        return np.frombuffer(parts[0], dtype='<f8', count=rows)
+    if kind == 'date32':
+        days = np.frombuffer(parts[0], dtype='<i4', count=rows)
+        values = days.astype(np.int64)
+        values[days == MISSING_DATE] = np.iinfo(np.int64).min
+        return values.view('datetime64[D]').astype('datetime64[s]')
+    if kind == 'category':
+        codes = np.frombuffer(parts[0], dtype='<i4', count=rows)
+        return pd.Categorical.from_codes(codes, categories=meta['categories'])
+    if kind == 'text':
+        values = np.empty(rows, dtype=object)
+        if rows:
+            values[:] = bytes(parts[0]).decode('utf-8').split('\0')
+            values[np.frombuffer(parts[1], dtype=np.uint8, count=rows).astype(bool)] = np.nan
+        return pd.Series(values, dtype='str')
+    raise ValueError(f'未知的列类型: {kind}')
@@ -0,0 +1,78 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/fields.py
+Description: 物品字段值的规范化规则，数据缓存、价格统计和资产汇总共用，保证全量计算与增量维护一致
+'''
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from .storage import id_key
+
+
+def id_keys(ids):
+    """
+    批量生成ID键，整数列直接转换，其余按 id_key 逐个转换
+
+    参数:
+        ids (Series): ID列
+
+    返回:
+        ndarray: 与 id_key 结果一致的字符串数组
+    """
+    if ids.dtype.kind in 'iu':
+        return ids.to_numpy().astype(str).astype(object)
+    return np.array([id_key(value) for value in ids], dtype=object)
+
+
+def numeric_column(df, column):
+    """
+    获取数值列，缺失或无法解析的值按0处理
+
+    参数:
+        df (DataFrame): 物品数据
+        column (str): 列名
+
+    返回:
+        Series: float类型的数值列
+    """
+    if column not in df.columns:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df[column], errors='coerce').fillna(0.0)
+
+
+def number(value):
+    """
+    将字段值转为数字，缺失或无法解析时为0，与 numeric_column 的规则一致
+    """
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if math.isnan(result) else result
+
+
+def valid_text(value):
+    """
+    判断文本字段是否有效（去除空白后非空的字符串）
+    """
+    return isinstance(value, str) and bool(value.strip())
+
+
+def rounded(values):
+    """
+    金额保留两位小数，消除多次加减产生的浮点误差，以 count 结尾的字段为整数
+
+    参数:
+        values (dict): 字段 -> 数值
+
+    返回:
+        dict: 取整后的字段 -> 数值
+    """
+    return {field: int(value) if field.endswith('count') else round(float(value), 2)
+            for field, value in values.items()}
@@ -0,0 +1,176 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/http_cache.py
+Description: HTTP条件缓存、渲染片段缓存和响应压缩
+'''
+
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只使用 gzip
+    brotli = None
+
+# 小于该大小的响应不压缩，压缩收益不足以抵消开销
+COMPRESS_MIN_SIZE = 500
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = (
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'image/svg+xml'
+)
+
+
+def data_etag(version, key, signatures):
+    """
+    根据数据版本生成ETag，数据、模板或请求参数任一变化时ETag随之变化
+
+    参数:
+        version (str): 模板等代码资源的版本，见 asset_version
+        key (str): 请求的路径和查询参数
+        signatures (list): 相关物品类别的存储签名
+
+    返回:
+        str: ETag值（不含引号）
+    """
+    digest = hashlib.sha1(repr((version, key, signatures)).encode('utf-8'))
+    return digest.hexdigest()[:20]
+
+
+def last_modified(signatures):
+    """
+    获取存储签名中最新的文件修改时间
+
+    参数:
+        signatures (list): 存储签名列表，每个签名由若干 (修改时间纳秒, 大小) 或None组成
+
+    返回:
+        datetime: 修改时间（UTC），没有任何数据文件时返回None
+    """
+    mtimes = [stat[0] for signature in signatures for stat in signature if stat]
+    if not mtimes:
+        return None
+    return datetime.fromtimestamp(max(mtimes) / 1e9, tz=timezone.utc)
+
+
+def asset_version(*folders):
+    """
+    计算模板等目录的版本，部署新模板后已缓存的页面随之失效
+
+    使用文件的最新修改时间，多个 worker 计算结果一致
+
+    参数:
+        *folders (str): 目录路径
+
+    返回:
+        str: 版本字符串
+    """
+    latest = 0
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            for name in files:
+                latest = max(latest, os.stat(os.path.join(root, name)).st_mtime_ns)
+    return str(latest)
+
+
+class FragmentCache:
+    """
+    渲染片段缓存
+
+    键中包含存储签名，数据变化后旧片段不会再命中，按最近最少使用淘汰
+    """
+
+    def __init__(self, max_entries=256):
+        """
+        参数:
+            max_entries (int): 最多缓存的片段数
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        """
+        获取缓存的片段，未命中时渲染并缓存
+
+        参数:
+            key (tuple): 缓存键，需包含相关的存储签名
+            render (callable): 无参数的渲染函数，返回HTML字符串
+
+        返回:
+            tuple: (HTML字符串, 是否命中)
+        """
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                return html, True
+        html = render()
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html, False
+
+    def clear(self):
+        """
+        清空全部片段
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+def compress_response(response, accept_encodings):
+    """
+    按客户端支持的编码压缩响应体，优先使用 brotli
+
+    文件、流式响应、已编码或过小的响应保持不变
+
+    参数:
+        response (Response): Flask响应
+        accept_encodings: request.accept_encodings
+
+    返回:
+        Response: 原响应对象
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    if brotli is not None and accept_encodings['br']:
+        encoding = 'br'
+    elif accept_encodings['gzip']:
+        encoding = 'gzip'
+    else:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    # 压缩后字节不同，强ETag改为弱ETag
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
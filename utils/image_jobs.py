@@ -0,0 +1,233 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/image_jobs.py
+Description: 后台图片转换任务队列，使用进程池执行WebP转换，避免阻塞请求
+'''
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from . import metrics
+from .image_processor import ENCODE_PROFILES, compress_and_convert_to_webp, get_webp_path
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，每个进程都执行图片目录监视
+    fcntl = None
+
+# 保留最近完成的任务数，供查询转换结果；更早完成的任务不再保留，避免常驻进程中无限增长
+FINISHED_JOBS_KEPT = 256
+
+
+class ImageJobQueue:
+    """
+    图片转换任务队列
+
+    任务以原始图片路径为键，同一张图片在转换完成前重复提交只会执行一次。
+    完成的任务只保留最近 FINISHED_JOBS_KEPT 个。
+    进程池在第一次提交任务时创建，无法创建进程池的环境下退化为线程池。
+    进程池只属于创建它的进程，fork 出的子进程（如预加载应用的 gunicorn worker）
+    第一次提交任务时会创建自己的进程池。
+    """
+
+    def __init__(self, max_workers=None, profile=None):
+        """
+        初始化任务队列
+
+        参数:
+            max_workers (int): 最大工作进程数，默认为CPU核数
+            profile (str): 图片编码档案，见 ENCODE_PROFILES，默认按图片是否透明自动选择
+
+        异常:
+            ValueError: 编码档案不存在时抛出
+        """
+        if profile is not None and profile not in ENCODE_PROFILES:
+            raise ValueError(f"未知的图片编码档案: {profile}")
+        self.max_workers = max_workers
+        self.profile = profile
+        self._executor = None
+        self._executor_pid = None
+        self._jobs = {}  # 原始图片绝对路径 -> 未完成的任务
+        self._finished = OrderedDict()  # 原始图片绝对路径 -> 最近完成的任务，按完成先后排列
+        self._lock = threading.Lock()
+        self._scan_lock_file = None
+        self._done_listeners = []
+
+    def add_done_listener(self, listener):
+        """
+        注册任务完成回调，在任务完成的线程中调用
+
+        参数:
+            listener (callable): 回调函数，参数为 (原始图片绝对路径, 任务状态字典)
+        """
+        self._done_listeners.append(listener)
+
+    def _get_executor(self):
+        """
+        获取执行器，调用方需持有 _lock
+        """
+        if self._executor_pid != os.getpid():
+            # fork 继承的执行器不可用（工作线程没有随 fork 复制），任务状态也属于父进程
+            self._executor = None
+            self._jobs = {}
+            self._finished = OrderedDict()
+        if self._executor is None:
+            self._executor_pid = os.getpid()
+            try:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            except (OSError, NotImplementedError) as e:
+                print(f"进程池创建失败，使用线程池: {e}")
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def submit(self, original_path, item_type, overwrite=False):
+        """
+        提交图片转换任务
+
+        参数:
+            original_path (str): 原始图片路径
+            item_type (str): 物品类型
+            overwrite (bool): 输出已存在时是否重新生成
+
+        返回:
+            dict: 任务状态，见 status
+        """
+        key = os.path.abspath(original_path)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job and job['status'] == 'pending':
+                return dict(job)
+            job = {
+                'status': 'pending',
+                'item_type': item_type,
+                'output': get_webp_path(original_path, item_type),
+                'error': None
+            }
+            try:
+                future = self._get_executor().submit(
+                    _convert, original_path, item_type, metrics.is_enabled(), overwrite, self.profile
+                )
+            except Exception as e:
+                job['status'] = 'failed'
+                job['error'] = str(e)
+                self._retire(key, job)
+                return dict(job)
+            self._jobs[key] = job
+            self._finished.pop(key, None)
+        future.add_done_callback(partial(self._finish, key, job, time.perf_counter()))
+        return dict(job)
+
+    def _finish(self, key, job, submitted_at, future):
+        """
+        任务完成回调，记录结果和耗时
+        """
+        error = future.exception()
+        with self._lock:
+            if error is None:
+                job['status'] = 'done'
+            else:
+                job['status'] = 'failed'
+                job['error'] = str(error)
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+                self._retire(key, job)
+        # 排队+转换的总耗时，以及子进程中收集的各阶段耗时
+        metrics.observe('image_job_duration_seconds', time.perf_counter() - submitted_at)
+        metrics.inc('image_jobs_total', status=job['status'])
+        if error is None:
+            metrics.record_spans(future.result())
+        filename = os.path.basename(key)
+        if error is None:
+            print(f"转换图片: {filename} -> {os.path.basename(job['output'])}")
+        else:
+            print(f"转换图片失败 {filename}: {error}")
+        for listener in self._done_listeners:
+            listener(key, dict(job))
+
+    def _retire(self, key, job):
+        """
+        记入最近完成的任务，超出保留数时丢弃最早完成的，调用方需持有 _lock
+        """
+        self._finished[key] = job
+        self._finished.move_to_end(key)
+        while len(self._finished) > FINISHED_JOBS_KEPT:
+            self._finished.popitem(last=False)
+
+    def status(self, original_path):
+        """
+        查询图片转换任务状态
+
+        参数:
+            original_path (str): 原始图片路径
+
+        返回:
+            dict: 任务状态，包含 status('pending'/'done'/'failed')、item_type、output、error；
+                  本进程未提交过该图片或任务完成较早已不再保留时返回None
+        """
+        key = os.path.abspath(original_path)
+        with self._lock:
+            job = self._jobs.get(key) or self._finished.get(key)
+            return dict(job) if job else None
+
+    def acquire_scan_lock(self, lock_path):
+        """
+        多个 worker 进程中只让一个负责监视图片目录
+
+        第一个取得文件锁的进程在存活期间持有该锁，其他进程返回False；
+        持锁进程退出后锁自动释放，之后启动的 worker 会接手
+
+        参数:
+            lock_path (str): 锁文件路径
+
+        返回:
+            bool: 本进程是否持有锁，没有 fcntl 时总是True
+        """
+        if fcntl is None or self._scan_lock_file is not None:
+            return True
+        os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._scan_lock_file = lock_file
+        return True
+
+    def shutdown(self, wait=True):
+        """
+        关闭执行器
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+def _convert(original_path, item_type, collect_metrics, overwrite=False, profile=None):
+    """
+    在工作进程中执行转换
+
+    参数:
+        original_path (str): 原始图片路径
+        item_type (str): 物品类型
+        collect_metrics (bool): 是否收集各阶段耗时
+        overwrite (bool): 输出已存在时是否重新生成
+        profile (str): 图片编码档案
+
+    返回:
+        list: (阶段名称, 耗时秒) 列表，由主进程记录到指标中
+    """
+    if not collect_metrics:
+        compress_and_convert_to_webp(original_path, item_type, overwrite=overwrite, profile=profile)
+        return []
+    with metrics.capture() as spans:
+        compress_and_convert_to_webp(original_path, item_type, overwrite=overwrite, profile=profile)
+    return spans
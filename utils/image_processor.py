@@ -1,6 +1,27 @@
-from PIL import Image
 import os
 
+from .metrics import span
+
+# 除主图(最大1600)外额外生成的宽度档位，供 srcset 使用
+VARIANT_WIDTHS = (160, 480, 960)
+
+# WebP编码档案：
+#   quality/method/lossless 传给 Pillow 的 WebP 编码器，method 0-6 越大越慢、文件越小；
+#   reducing_gap 控制 JPEG 按比例解码和整数倍缩小后，最后一步精确缩放的最小倍数，越小越快
+ENCODE_PROFILES = {
+    'fast': {'quality': 78, 'method': 2, 'lossless': False, 'reducing_gap': 1.0},
+    'balanced': {'quality': 80, 'method': 4, 'lossless': False, 'reducing_gap': 1.5},
+    'small': {'quality': 72, 'method': 6, 'lossless': False, 'reducing_gap': 2.0},
+    # 透明背景的手办抠图等：无损编码并保留透明通道
+    'cutout': {'quality': 70, 'method': 4, 'lossless': True, 'reducing_gap': 2.0},
+}
+# 未指定档案时，照片使用 DEFAULT_PROFILE，带透明通道的图片使用 ALPHA_PROFILE
+DEFAULT_PROFILE = 'balanced'
+ALPHA_PROFILE = 'cutout'
+
+# EXIF 方向标签，取值 5-8 时图片需要旋转90度，宽高互换
+_EXIF_ORIENTATION = 0x0112
+
 def get_webp_path(original_path, item_type):
     """生成WebP格式的文件路径
     :param original_path: 原始图片路径
@@ -11,26 +32,147 @@ def get_webp_path(original_path, item_type):
     base_name = os.path.splitext(filename)[0]
     return os.path.join('static', 'images', item_type, base_name + '.webp')
 
-def compress_and_convert_to_webp(original_path, item_type, quality=80, max_size=(1600, 1600)):
+def get_variant_path(original_path, item_type, width):
+    """生成指定宽度档位的WebP文件路径
+    :param original_path: 原始图片路径
+    :param item_type: 物品类型
+    :param width: 宽度档位，见 VARIANT_WIDTHS
+    :return: 形如 static/images/<type>/<name>-<width>w.webp 的路径
+    """
+    base_path = os.path.splitext(get_webp_path(original_path, item_type))[0]
+    return f'{base_path}-{width}w.webp'
+
+def get_output_paths(original_path, item_type):
+    """获取一张原始图片对应的全部WebP输出路径
+    :param original_path: 原始图片路径
+    :param item_type: 物品类型
+    :return: [主图路径, 各宽度档位路径...]
+    """
+    return [get_webp_path(original_path, item_type)] + [
+        get_variant_path(original_path, item_type, width) for width in VARIANT_WIDTHS
+    ]
+
+def webp_outputs_exist(original_path, item_type):
+    """检查主图和全部宽度档位是否都已生成
+    :param original_path: 原始图片路径
+    :param item_type: 物品类型
+    :return: bool
+    """
+    return all(os.path.exists(path) for path in get_output_paths(original_path, item_type))
+
+def _save_webp(img, output_path, options):
+    """先写入临时文件再重命名，避免并发转换时读到不完整的文件
+    :param options: WebP 编码参数(quality/method/lossless)
+    """
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    img.save(tmp_path, 'WEBP', **options)
+    os.replace(tmp_path, output_path)
+
+def webp_outputs_fresh(original_path, item_type, original_mtime_ns=None):
+    """检查全部WebP输出都已生成且不早于原图（原图被替换后需要重新转换）
+    :param original_path: 原始图片路径
+    :param item_type: 物品类型
+    :param original_mtime_ns: 原图修改时间(纳秒)，为None时读取文件
+    :return: bool
+    """
+    if original_mtime_ns is None:
+        original_mtime_ns = os.stat(original_path).st_mtime_ns
+    try:
+        return all(os.stat(path).st_mtime_ns >= original_mtime_ns
+                   for path in get_output_paths(original_path, item_type))
+    except FileNotFoundError:
+        return False
+
+def has_alpha(img):
+    """判断图片是否带透明通道
+    :param img: Pillow 图片
+    :return: bool
+    """
+    return img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+def resolve_profile(profile, img):
+    """获取编码档案
+    :param profile: 档案名称，见 ENCODE_PROFILES；为None时按图片是否带透明通道选择
+    :param img: Pillow 图片
+    :return: 档案参数字典
+    :raises ValueError: 档案名称不存在
+    """
+    if profile is None:
+        profile = ALPHA_PROFILE if has_alpha(img) else DEFAULT_PROFILE
+    try:
+        return ENCODE_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"未知的图片编码档案: {profile}") from None
+
+def _decode_oriented(img, max_size, reducing_gap):
+    """按目标尺寸解码并缩放原图，再按 EXIF 方向摆正
+    JPEG 通过 draft 直接以 1/2、1/4、1/8 比例解码，不解码完整分辨率；
+    方向在缩小之后才应用，旋转的是小图
+    :param img: 刚打开、尚未解码的 Pillow 图片
+    :param max_size: 摆正后的最大尺寸(宽,高)
+    :param reducing_gap: 见 ENCODE_PROFILES
+    :return: 缩放并摆正后的图片
+    """
+    from PIL import Image, ImageOps
+
+    orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+    if orientation in (5, 6, 7, 8):
+        # 摆正前宽高互换，限制尺寸也要互换
+        max_size = (max_size[1], max_size[0])
+    img.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+    if orientation != 1:
+        img = ImageOps.exif_transpose(img)
+    return img
+
+def _encode_mode(img):
+    """转换为 WebP 编码器支持的颜色模式，带透明通道的图片保留透明（有损编码同样支持透明）
+    :param img: Pillow 图片
+    :return: RGB 或 RGBA 模式的图片
+    """
+    if has_alpha(img):
+        return img if img.mode == 'RGBA' else img.convert('RGBA')
+    return img if img.mode == 'RGB' else img.convert('RGB')
+
+def compress_and_convert_to_webp(original_path, item_type, quality=None, max_size=(1600, 1600), overwrite=False,
+                                 profile=None):
     """使用Pillow实现图片压缩和WebP转换
+    只解码一次原图，依次生成主图和 VARIANT_WIDTHS 中的各宽度档位，
+    小档位从上一档缩放而来，不会放大原图
     :param original_path: 原始图片路径
     :param item_type: 物品类型
-    :param quality: 压缩质量(1-100)
-    :param max_size: 最大尺寸(宽,高)
+    :param quality: 压缩质量(1-100)，为None时使用档案中的质量
+    :param max_size: 主图最大尺寸(宽,高)
+    :param overwrite: 输出已存在时是否重新生成，原图被替换时使用
+    :param profile: 编码档案名称，见 ENCODE_PROFILES，为None时自动选择
+    :return: 主图路径
     """
     output_path = get_webp_path(original_path, item_type)
-    if os.path.exists(output_path):
+    if not overwrite and webp_outputs_exist(original_path, item_type):
         return output_path
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
+
+    # Pillow 只在转换进程中使用，Web 进程导入本模块时不加载
+    from PIL import Image
+
     with Image.open(original_path) as img:
-        # 保持宽高比缩放
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # 转换为RGB模式(如果是RGBA)
-        if img.mode in ('RGBA', 'P'):
-            img = img.convert('RGB')
-            
-        # 直接保存为WebP格式
-        img.save(output_path, 'WEBP', quality=quality)
-    return output_path
\ No newline at end of file
+        settings = resolve_profile(profile, img)
+        options = {
+            'quality': settings['quality'] if quality is None else quality,
+            'method': settings['method'],
+            'lossless': settings['lossless'],
+        }
+        with span('image.decode_resize'):
+            img = _decode_oriented(img, max_size, settings['reducing_gap'])
+            img = _encode_mode(img)
+
+        with span('image.encode'):
+            _save_webp(img, output_path, options)
+
+        # 从大到小逐级缩放，每一档只按宽度限制
+        with span('image.variants'):
+            variant = img
+            for width in sorted(VARIANT_WIDTHS, reverse=True):
+                variant = variant.copy()
+                variant.thumbnail((width, variant.height), Image.Resampling.LANCZOS)
+                _save_webp(variant, get_variant_path(original_path, item_type, width), options)
+    return output_path
@@ -0,0 +1,216 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/image_store.py
+Description: 内容寻址的图片存储，按内容哈希命名上传图片，跨类别去重
+'''
+
+import hashlib
+import os
+import re
+import tempfile
+
+from werkzeug.utils import secure_filename
+
+from .image_processor import get_variant_path, get_webp_path
+from .metrics import span
+
+# 内容寻址图片所在目录名（static/images/store），同时作为 get_webp_path 的物品类型
+STORE_TYPE = 'store'
+
+# 哈希文件名，如 <sha256>.jpg、<sha256>.webp、<sha256>-160w.webp
+_STORED_NAME = re.compile(r'^[0-9a-f]{64}(-\d+w)?\.[a-z0-9]+$')
+
+_CHUNK_SIZE = 64 * 1024
+
+# 允许上传的原图格式及文件头，只按扩展名判断容易把其他文件当作图片保存
+UPLOAD_SIGNATURES = {
+    '.jpg': (b'\xff\xd8\xff',),
+    '.jpeg': (b'\xff\xd8\xff',),
+    '.png': (b'\x89PNG\r\n\x1a\n',),
+    '.gif': (b'GIF87a', b'GIF89a'),
+    '.bmp': (b'BM',),
+}
+# 判断文件头需要的字节数
+SIGNATURE_SIZE = 8
+
+
+def is_stored_name(filename):
+    """
+    判断文件名是否为内容寻址的哈希文件名
+
+    参数:
+        filename (str): 文件名
+
+    返回:
+        bool: 是否为哈希文件名
+    """
+    return isinstance(filename, str) and bool(_STORED_NAME.match(filename))
+
+
+def get_store_dir(static_folder):
+    """
+    获取内容寻址图片目录
+
+    参数:
+        static_folder (str): 静态文件目录
+
+    返回:
+        str: static/images/store 的路径
+    """
+    return os.path.join(static_folder, 'images', STORE_TYPE)
+
+
+def upload_extension(filename):
+    """
+    获取上传图片的扩展名，不支持的格式直接拒绝，不读取文件内容
+
+    参数:
+        filename (str): 客户端提供的文件名
+
+    返回:
+        str: 小写扩展名，如 .jpg
+
+    异常:
+        ValueError: 格式不支持时抛出
+    """
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    if ext not in UPLOAD_SIGNATURES:
+        raise ValueError(f'不支持的图片格式: {ext or filename}')
+    return ext
+
+
+def check_image_header(ext, head):
+    """
+    检查文件头与扩展名是否一致
+
+    参数:
+        ext (str): upload_extension 返回的扩展名
+        head (bytes): 文件开头的字节，至少 SIGNATURE_SIZE 字节（文件更短时为全部内容）
+
+    异常:
+        ValueError: 文件内容不是对应格式的图片时抛出
+    """
+    if not head.startswith(UPLOAD_SIGNATURES[ext]):
+        raise ValueError(f'文件内容不是有效的{ext[1:]}图片')
+
+
+def store_file(tmp_path, digest, ext, static_folder):
+    """
+    将已写完并计算好哈希的临时文件移入内容寻址目录
+
+    参数:
+        tmp_path (str): 临时文件路径，需与内容寻址目录在同一文件系统
+        digest (str): 文件内容的 sha256 十六进制摘要
+        ext (str): 扩展名
+        static_folder (str): 静态文件目录
+
+    返回:
+        str: 哈希文件名，如 <sha256>.jpg
+    """
+    filename = digest + ext
+    target_path = os.path.join(get_store_dir(static_folder), filename)
+    if os.path.exists(target_path):
+        # 已有相同内容的图片，直接复用
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, target_path)
+    return filename
+
+
+def save_upload(image_file, static_folder):
+    """
+    边读取边计算哈希保存上传图片，内容相同的图片只保存一份
+
+    参数:
+        image_file (FileStorage): 上传的图片文件
+        static_folder (str): 静态文件目录
+
+    返回:
+        str: 哈希文件名，如 <sha256>.jpg
+
+    异常:
+        ValueError: 格式不支持或文件内容与扩展名不符时抛出
+    """
+    ext = upload_extension(image_file.filename)
+    store_dir = get_store_dir(static_folder)
+    os.makedirs(store_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=store_dir, suffix='.tmp')
+    try:
+        with span('upload.store'), os.fdopen(fd, 'wb') as f:
+            chunk = image_file.stream.read(_CHUNK_SIZE)
+            # 读到第一块就检查文件头，不是图片时不再读取剩余内容
+            check_image_header(ext, chunk[:SIGNATURE_SIZE])
+            while chunk:
+                digest.update(chunk)
+                f.write(chunk)
+                chunk = image_file.stream.read(_CHUNK_SIZE)
+        return store_file(tmp_path, digest.hexdigest(), ext, static_folder)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def resolve_image(static_folder, item_type, image):
+    """
+    获取物品图片的原图路径及转换时使用的物品类型
+
+    参数:
+        static_folder (str): 静态文件目录
+        item_type (str): 物品类型
+        image (str): 数据中的图片字段
+
+    返回:
+        tuple: (原图路径, 转换类型)，哈希图片的转换类型为 STORE_TYPE
+    """
+    if is_stored_name(image):
+        return os.path.join(get_store_dir(static_folder), image), STORE_TYPE
+    return os.path.join(static_folder, 'images', item_type, image), item_type
+
+
+def image_url(item_type, image, width=None):
+    """
+    生成物品图片WebP的访问URL
+
+    哈希图片通过 /images/ 路由提供长期缓存，旧图片仍使用 /static/images/<类型>/
+
+    参数:
+        item_type (str): 物品类型
+        image (str): 数据中的图片字段
+        width (int): 宽度档位，为None时返回主图
+
+    返回:
+        str: 图片URL
+    """
+    if is_stored_name(image):
+        output_type = STORE_TYPE
+        prefix = '/images/'
+    else:
+        output_type = item_type
+        prefix = f'/static/images/{item_type}/'
+    if width is None:
+        path = get_webp_path(image, output_type)
+    else:
+        path = get_variant_path(image, output_type, width)
+    return prefix + os.path.basename(path)
+
+
+def original_image_url(item_type, image):
+    """
+    生成物品原始上传图片的访问URL，WebP尚未生成时作为回退
+
+    参数:
+        item_type (str): 物品类型
+        image (str): 数据中的图片字段
+
+    返回:
+        str: 图片URL
+    """
+    if is_stored_name(image):
+        return f'/images/{image}'
+    return f'/static/images/{item_type}/{image}'
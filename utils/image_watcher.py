@@ -0,0 +1,397 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/image_watcher.py
+Description: 基于修改时间清单的图片目录监视，只为新增或被替换的原图提交转换任务
+'''
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .image_processor import (ENCODE_PROFILES, compress_and_convert_to_webp, webp_outputs_exist,
+                              webp_outputs_fresh)
+
+# 支持转换的原始图片格式
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+# 默认清单文件
+MANIFEST_PATH = os.path.join('data', 'image_manifest.json')
+
+# 原图被原地覆盖时目录修改时间不变，每隔若干轮完整检查一次各文件
+FULL_SCAN_EVERY = 10
+
+
+class ImageManifest:
+    """
+    已转换原图的清单
+
+    记录每张原图转换时的 (修改时间纳秒, 大小)，以及每个图片目录上次扫描时的修改时间，
+    保存在 JSON 文件中，进程重启后不需要重新检查已转换的图片
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        """
+        参数:
+            path (str): 清单文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.files = {}
+        self.dirs = {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.files = {key: tuple(value) for key, value in data.get('files', {}).items()}
+            self.dirs = dict(data.get('dirs', {}))
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError) as e:
+            print(f"图片清单损坏，重新生成: {e}")
+
+    def matches(self, key, stat):
+        """
+        判断原图自上次转换后是否未变化
+
+        参数:
+            key (str): 清单键，格式为 <物品类型>/<文件名>
+            stat (tuple): (修改时间纳秒, 大小)
+
+        返回:
+            bool: 未变化时返回True
+        """
+        with self._lock:
+            return self.files.get(key) == stat
+
+    def mark(self, key, stat):
+        """
+        记录原图已转换
+        """
+        with self._lock:
+            if self.files.get(key) != stat:
+                self.files[key] = stat
+                self._dirty = True
+
+    def prune(self, item_type, existing):
+        """
+        删除某个目录下已不存在的原图记录
+
+        参数:
+            item_type (str): 物品类型
+            existing (set): 目录中现有的原图文件名
+        """
+        prefix = item_type + '/'
+        with self._lock:
+            stale = [key for key in self.files
+                     if key.startswith(prefix) and key[len(prefix):] not in existing]
+            for key in stale:
+                del self.files[key]
+            if stale:
+                self._dirty = True
+
+    def set_dir_mtime(self, item_type, mtime_ns):
+        """
+        记录目录扫描时的修改时间
+        """
+        with self._lock:
+            if self.dirs.get(item_type) != mtime_ns:
+                self.dirs[item_type] = mtime_ns
+                self._dirty = True
+
+    def forget_dir(self, item_type):
+        """
+        清除目录的修改时间记录，下一轮检查时重新列出该目录
+        """
+        with self._lock:
+            if self.dirs.pop(item_type, None) is not None:
+                self._dirty = True
+
+    def save(self):
+        """
+        清单有变化时写入文件，先写临时文件再重命名
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {'files': {key: list(value) for key, value in self.files.items()},
+                    'dirs': dict(self.dirs)}
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+
+def _file_stat(stat_result):
+    return (stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def _iter_originals(image_dir):
+    """
+    列出目录中的原始图片
+
+    返回:
+        list: (文件名, 路径, (修改时间纳秒, 大小)) 列表
+    """
+    originals = []
+    with os.scandir(image_dir) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                originals.append((entry.name, entry.path, _file_stat(entry.stat())))
+    return originals
+
+
+class ImageWatcher:
+    """
+    图片目录监视器
+
+    每轮只读取各图片目录自身的修改时间，目录有文件新增、删除或重命名时才列出目录，
+    清单中已记录且未变化的原图直接跳过；每 FULL_SCAN_EVERY 轮完整检查一次，
+    发现原地覆盖的原图。需要转换的原图提交到 ImageJobQueue，转换完成后记入清单；
+    有转换失败时不记录目录的修改时间，下一轮检查重新提交失败的原图。
+    """
+
+    def __init__(self, image_jobs, static_folder, item_types, manifest_path=MANIFEST_PATH):
+        """
+        参数:
+            image_jobs (ImageJobQueue): 图片转换任务队列
+            static_folder (str): 静态文件目录
+            item_types (list|callable): 物品类型列表，对应 static/images/<类型> 目录；
+                也可以是返回该列表的无参数函数，每轮检查时调用，之后新建的收藏及其类别随之加入
+            manifest_path (str): 清单文件路径
+        """
+        self.image_jobs = image_jobs
+        self.static_folder = static_folder
+        self.item_types = item_types if callable(item_types) else list(item_types)
+        self.manifest = ImageManifest(manifest_path)
+        self._pending = {}  # 原图绝对路径 -> (清单键, 提交时的文件状态)
+        self._failed = set()  # 本轮检查开始后有转换失败的物品类型
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        image_jobs.add_done_listener(self._on_done)
+
+    def poll(self, full=False):
+        """
+        检查一轮图片目录
+
+        参数:
+            full (bool): 是否忽略目录修改时间，完整检查每个目录
+
+        返回:
+            int: 提交的任务数
+        """
+        submitted = 0
+        item_types = self.item_types() if callable(self.item_types) else self.item_types
+        for item_type in item_types:
+            image_dir = os.path.join(self.static_folder, 'images', item_type)
+            try:
+                dir_mtime = os.stat(image_dir).st_mtime_ns
+            except FileNotFoundError:
+                os.makedirs(image_dir, exist_ok=True)
+                continue
+            if not full and self.manifest.dirs.get(item_type) == dir_mtime:
+                continue
+
+            with self._lock:
+                self._failed.discard(item_type)
+            originals = _iter_originals(image_dir)
+            for filename, image_path, stat in originals:
+                submitted += self._check(item_type, filename, image_path, stat)
+            self.manifest.prune(item_type, {filename for filename, _, _ in originals})
+            # 与 _on_done 在同一把锁下判断，任务在此之前或之后失败都不会留下目录记录
+            with self._lock:
+                if item_type not in self._failed:
+                    self.manifest.set_dir_mtime(item_type, dir_mtime)
+        self.manifest.save()
+        return submitted
+
+    def _check(self, item_type, filename, image_path, stat):
+        """
+        检查单张原图，需要转换时提交任务
+
+        返回:
+            int: 提交时返回1，否则返回0
+        """
+        key = f'{item_type}/{filename}'
+        if self.manifest.matches(key, stat):
+            return 0
+        # 清单中没有记录（如首次运行），但输出已是最新的，直接记入清单
+        if webp_outputs_fresh(image_path, item_type, stat[0]):
+            self.manifest.mark(key, stat)
+            return 0
+        abs_path = os.path.abspath(image_path)
+        with self._lock:
+            if abs_path in self._pending:
+                return 0
+            self._pending[abs_path] = (key, stat)
+        # 输出存在但早于原图，说明原图被替换过，需要覆盖旧输出
+        overwrite = webp_outputs_exist(image_path, item_type)
+        job = self.image_jobs.submit(image_path, item_type, overwrite=overwrite)
+        if job['status'] == 'failed':
+            with self._lock:
+                self._pending.pop(abs_path, None)
+                self._failed.add(item_type)
+        return 1
+
+    def _on_done(self, original_path, job):
+        """
+        转换完成回调，成功时按提交时的文件状态记入清单，失败时清除所在目录的修改时间记录
+
+        转换期间原图再次变化时，下一轮检查会发现状态不一致并重新转换
+        """
+        with self._lock:
+            entry = self._pending.pop(original_path, None)
+            idle = not self._pending
+            if entry is not None and job['status'] == 'failed':
+                self._failed.add(job['item_type'])
+                self.manifest.forget_dir(job['item_type'])
+        if entry is None:
+            return
+        if job['status'] == 'done':
+            self.manifest.mark(*entry)
+        if idle:
+            self.manifest.save()
+
+    def start(self, interval):
+        """
+        启动后台监视线程
+
+        参数:
+            interval (float): 检查间隔秒数，不大于0时不启动
+        """
+        if interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,),
+                                        name='image-watcher', daemon=True)
+        self._thread.start()
+
+    def _run(self, interval):
+        rounds = 0
+        while not self._stop.wait(interval):
+            rounds += 1
+            try:
+                submitted = self.poll(full=rounds % FULL_SCAN_EVERY == 0)
+            except OSError as e:
+                print(f"检查图片目录失败: {e}")
+                continue
+            if submitted:
+                print(f"提交图片转换任务: {submitted}个")
+
+    def stop(self):
+        """
+        停止后台监视线程
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def _reconcile_one(image_path, item_type, overwrite, profile):
+    """
+    在工作进程中转换单张图片
+
+    返回:
+        str: 失败时返回错误信息，成功返回None
+    """
+    try:
+        compress_and_convert_to_webp(image_path, item_type, overwrite=overwrite, profile=profile)
+    except Exception as e:
+        return str(e)
+    return None
+
+
+def reconcile(static_folder, item_types, manifest_path=MANIFEST_PATH, workers=None, profile=None):
+    """
+    完整核对全部图片目录，使用所有CPU核并行转换缺失或过期的输出，并重建清单
+
+    可在服务运行时执行，服务的监视线程会读取到新的清单
+
+    参数:
+        static_folder (str): 静态文件目录
+        item_types (list): 物品类型列表
+        manifest_path (str): 清单文件路径
+        workers (int): 并行进程数，默认为CPU核数
+        profile (str): 图片编码档案，见 ENCODE_PROFILES，默认自动选择
+
+    返回:
+        dict: 核对结果，包含 checked、converted、error_count、errors、duration_seconds
+    """
+    started = time.perf_counter()
+    manifest = ImageManifest(manifest_path)
+    checked = 0
+    tasks = []  # (清单键, 文件状态, 图片路径, 物品类型, 是否覆盖)
+    for item_type in item_types:
+        image_dir = os.path.join(static_folder, 'images', item_type)
+        if not os.path.isdir(image_dir):
+            continue
+        dir_mtime = os.stat(image_dir).st_mtime_ns
+        originals = _iter_originals(image_dir)
+        for filename, image_path, stat in originals:
+            checked += 1
+            key = f'{item_type}/{filename}'
+            if webp_outputs_fresh(image_path, item_type, stat[0]):
+                manifest.mark(key, stat)
+            else:
+                overwrite = webp_outputs_exist(image_path, item_type)
+                tasks.append((key, stat, image_path, item_type, overwrite))
+        manifest.prune(item_type, {filename for filename, _, _ in originals})
+        manifest.set_dir_mtime(item_type, dir_mtime)
+
+    errors = []
+    if tasks:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            _, _, paths, types, overwrites = zip(*tasks)
+            results = executor.map(_reconcile_one, paths, types, overwrites, [profile] * len(tasks),
+                                   chunksize=max(1, len(tasks) // (workers * 4)))
+            for (key, stat, *_), error in zip(tasks, results):
+                if error is None:
+                    manifest.mark(key, stat)
+                else:
+                    errors.append({'image': key, 'error': error})
+    manifest.save()
+    return {
+        'checked': checked,
+        'converted': len(tasks) - len(errors),
+        'error_count': len(errors),
+        'errors': errors,
+        'duration_seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def main(argv=None):
+    """
+    命令行入口：python -m utils.image_watcher reconcile
+    """
+    from .image_store import STORE_TYPE
+    from .tenants import collection_item_types
+
+    parser = argparse.ArgumentParser(description='图片清单核对')
+    parser.add_argument('action', choices=('reconcile',))
+    parser.add_argument('--static', default='static', help='静态文件目录，默认 static')
+    parser.add_argument('--data', default='data', help='默认收藏的数据目录，默认 data')
+    parser.add_argument('--collections', default=os.path.join('data', 'collections'),
+                        help='其他收藏所在目录，其中各收藏的自定义类别一并核对，默认 data/collections')
+    parser.add_argument('--manifest', default=MANIFEST_PATH, help=f'清单文件路径，默认 {MANIFEST_PATH}')
+    parser.add_argument('--workers', type=int, help='并行进程数，默认为CPU核数')
+    parser.add_argument('--profile', choices=sorted(ENCODE_PROFILES), help='图片编码档案，默认按图片是否透明自动选择')
+    args = parser.parse_args(argv)
+
+    item_types = collection_item_types(args.collections, args.data) + [STORE_TYPE]
+    result = reconcile(args.static, item_types, args.manifest, args.workers, args.profile)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 1 if result['error_count'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,9 +8,46 @@ Description: 物品管理类，封装物品数据的加载、保存、更新等
 '''
 
 import pandas as pd
+import numpy as np
+import base64
+import datetime
+import json
+import math
 import os
-from werkzeug.utils import secure_filename
+import threading
+from .columnar import DATE_FIELDS, to_dates
+from .fields import id_keys
 from .image_processor import compress_and_convert_to_webp
+from .image_store import get_store_dir, is_stored_name, resolve_image, save_upload
+from .metrics import count_cache, span
+from .records import RecordList, build_columns
+from .rollups import PortfolioRollup
+from .stats_service import PriceStats
+from .storage import CategoryStorage, id_key
+
+# 列表接口支持的排序字段，字段名前加 '-' 表示倒序
+SORT_FIELDS = ('purchase_date', 'name', 'purchase_price', 'id')
+# 默认排序：购买日期倒序，无购买日期的按名称排列（与 load_data 一致）
+DEFAULT_SORT = '-purchase_date'
+# 行版本号字段：创建时为1，每次更新加1，未记录版本的旧数据视为1
+VERSION_FIELD = 'version'
+# 不能通过更新接口修改的字段
+READONLY_FIELDS = ('id', 'item_id', 'item_type', VERSION_FIELD)
+# 按数值保存的价格字段
+PRICE_FIELDS = ('purchase_price', 'shipping_fee', 'sold_price')
+# 版本表每项的估算内存（字典项、ID键及版本号）
+VERSION_ENTRY_NBYTES = 100
+
+
+class VersionConflict(ValueError):
+    """
+    条件更新时物品已被其他请求修改，current 为当前版本号
+    """
+
+    def __init__(self, current):
+        super().__init__('物品已被修改，请刷新后重试')
+        self.current = current
+
 
 class ItemCategory:
     """
@@ -19,50 +56,216 @@ class ItemCategory:
     用于封装物品数据的加载、保存、更新等功能，实现代码复用
     """
     
-    def __init__(self, category_type, app=None):
+    def __init__(self, category_type, app=None, image_jobs=None, data_dir='data', main_category=None):
         """
         初始化物品类别管理类
         
         参数:
-            category_type (str): 物品类别类型，如'figures', 'clothing', 'goods'
+            category_type (str): 物品类别类型，如'figures', 'clothing', 'goods'，或收藏中自定义的类别
             app (Flask): Flask应用实例，用于获取静态文件路径
+            image_jobs (ImageJobQueue): 后台图片转换队列，为None时在请求内同步转换
+            data_dir (str): 数据目录，默认为 data，托管的其他收藏各自使用独立目录，见 tenants
+            main_category (str): 新物品的主类别，为None时按内置类别确定
             
         属性:
             type (str): 物品类别类型
-            data_path (str): 数据文件路径
+            data_path (str): 导入用的CSV路径，见 CategoryStorage
+            main_category (str): 新物品的主类别
             template_prefix (str): 模板前缀
             app (Flask): Flask应用实例
+            image_jobs (ImageJobQueue): 后台图片转换队列
+            storage (CategoryStorage): 存储引擎（列式快照 + 变更日志）
+            _cache (dict): 已解析数据的内存缓存，包含数据、默认排序及派生视图
+            _cache_signature (tuple): 缓存对应的存储签名
+            _cache_lock (Lock): 保护缓存重建的锁
+            _max_id (tuple): (存储签名, 最近分配的ID)，用于连续创建时跳过数据加载
+            _versions (tuple): (存储签名, {ID键: 版本号})，条件更新时在写锁内检查版本，见 _current_versions
+            _stats (PriceStats): 增量维护的价格统计
+            _stats_signature (tuple): 价格统计对应的存储签名
+            _stats_lock (Lock): 保护价格统计和资产汇总的锁
+            _rollup (PortfolioRollup): 增量维护的资产汇总，同时持久化到 storage.rollup_path
+            _rollup_signature (tuple): 资产汇总对应的存储签名
+            _write_listeners (list): 写入回调列表，见 add_write_listener
         """
         self.type = category_type
-        self.data_path = f'data/{category_type}.csv'
+        self.data_path = os.path.join(data_dir, f'{category_type}.csv')
+        self.main_category = main_category
         self.template_prefix = f'{category_type}/'
         self.app = app
+        self.image_jobs = image_jobs
+        self.storage = CategoryStorage(self.data_path)
+        self._cache = None
+        self._cache_signature = None
+        self._cache_lock = threading.Lock()
+        self._max_id = (None, 0)
+        self._versions = (None, {})
+        self._stats = None
+        self._stats_signature = None
+        self._stats_lock = threading.Lock()
+        self._rollup = None
+        self._rollup_signature = None
+        self._write_listeners = []
+    
+    def add_write_listener(self, listener):
+        """
+        注册写入回调，每次追加变更记录后在写锁内调用，供搜索索引等派生数据增量更新
+        
+        参数:
+            listener (callable): 回调函数，参数为
+                (类别管理器, [(操作类型, 物品ID, 变更的字段), ...], 写入前的存储签名, 写入后的存储签名)
+        """
+        self._write_listeners.append(listener)
+    
+    def _build_dataset(self):
+        """
+        解析数据文件并生成缓存内容
+        
+        记录按列保存，不为每行生成字典，见 records.RecordList
+        
+        返回:
+            dict: 缓存内容
+                raw (DataFrame): 按文件原始顺序保存的数据，供写入使用
+                columns (dict): raw 按列转换后的值，见 records.build_columns
+                order (ndarray): 默认排序下 raw 的行位置
+                records (RecordList): 按默认排序排列的物品视图
+                categories (list): 子类别列表
+                index (dict): ID -> records中的位置
+                row_index (dict): ID -> raw中的行标签
+                max_id (int): 当前最大ID，无数据时为0
+                nbytes (int): 估算的内存占用，见 _estimate_nbytes
+        """
+        raw = self.storage.load_frame()
+        with span('dataset.records'):
+            columns = build_columns(raw)
+        order = np.arange(len(raw))
+        if not raw.empty:
+            with span('dataset.sort'):
+                # 先按购买日期倒序排列，对于没有购买日期的按名称排列，缺失值排在最后
+                dates = to_dates(raw['purchase_date']).to_numpy(dtype='datetime64[s]')
+                names = raw['name'].to_numpy(dtype=object, na_value=np.nan)
+                missing_name = pd.isna(names)
+                order = np.lexsort((
+                    np.where(missing_name, '', names).astype(str),
+                    missing_name,
+                    -dates.astype(np.int64),
+                    np.isnat(dates)
+                ))
+        
+        with span('dataset.index'):
+            categories = []
+            if 'category' in raw.columns:
+                categories = sorted(
+                    category for category in raw['category'].dropna().unique()
+                    if category
+                )
+            index = {}
+            row_index = {}
+            max_id = 0
+            if 'id' in raw.columns and not raw.empty:
+                keys = id_keys(raw['id'])
+                index = dict(zip(keys[order].tolist(), range(len(order))))
+                row_index = dict(zip(keys.tolist(), raw.index))
+                ids = pd.to_numeric(raw['id'], errors='coerce')
+                if ids.notna().any():
+                    max_id = int(ids.max())
+        return {
+            'raw': raw,
+            'columns': columns,
+            'order': order,
+            'records': RecordList(columns, order),
+            'categories': categories,
+            'index': index,
+            'row_index': row_index,
+            'max_id': max_id,
+            'nbytes': _estimate_nbytes(raw)
+        }
+    
+    def _get_dataset(self):
+        """
+        获取缓存的数据集，数据文件的修改时间或大小变化时自动重建
+        
+        返回:
+            dict: 缓存内容，结构见 _build_dataset
+        """
+        signature = self.storage.signature()
+        cache = self._cache
+        if cache is not None and signature == self._cache_signature:
+            count_cache('dataset', True)
+            return cache
+        
+        count_cache('dataset', False)
+        with self._cache_lock:
+            # 等待锁期间可能已被其他线程重建
+            if self._cache is not None and signature == self._cache_signature:
+                return self._cache
+            cache = self._build_dataset()
+            self._cache = cache
+            self._cache_signature = self.storage.loaded_signature(signature)
+            return cache
+    
+    def invalidate_cache(self):
+        """
+        清除内存缓存，下次读取时重新解析数据文件
+        """
+        with self._cache_lock:
+            self._cache = None
+            self._cache_signature = None
+    
+    def memory_usage(self):
+        """
+        获取内存中数据的估算占用，未加载时为0
+        
+        包括数据缓存（见 _estimate_nbytes）、随缓存按需生成的排序及子类别数组、版本表、
+        价格统计和资产汇总的逐物品记录
+        
+        返回:
+            int: 字节数
+        """
+        total = 0
+        cache = self._cache
+        if cache is not None:
+            # 其他线程可能正在向缓存加入排序数组，先复制再遍历
+            total += cache['nbytes'] + sum(value.nbytes for value in list(cache.values())
+                                           if isinstance(value, np.ndarray))
+        total += len(self._versions[1]) * VERSION_ENTRY_NBYTES
+        for derived in (self._stats, self._rollup):
+            if derived is not None:
+                total += derived.memory_usage()
+        return total
+    
+    def release(self):
+        """
+        释放数据缓存、价格统计、资产汇总等全部内存中的派生数据，收藏被移出内存时调用，
+        之后的读取按需重新加载
+        """
+        self.invalidate_cache()
+        with self._stats_lock:
+            self._stats = None
+            self._stats_signature = None
+            self._rollup = None
+            self._rollup_signature = None
+        self._versions = (None, {})
     
     def load_data(self):
         """
         加载物品数据
         
+        数据在内存中缓存，仅当数据文件变化或调用写入方法后重新解析。
+        返回只读的视图列表，len() 为O(1)，迭代时才逐个生成物品视图
+        
         返回:
-            list: 物品数据字典列表，按购买日期倒序排列，无购买日期的按名称排列
+            RecordList: 物品数据视图列表，按购买日期倒序排列，无购买日期的按名称排列
+        """
+        return self._get_dataset()['records']
+    
+    def count_items(self):
+        """
+        获取物品数量，不读取任何物品字段
         
-        异常:
-            FileNotFoundError: 当数据文件不存在时抛出
-            pd.errors.EmptyDataError: 当数据文件为空时抛出
+        返回:
+            int: 物品数量
         """
-        try:
-            df = pd.read_csv(self.data_path)
-            # 将空的购买日期替换为 NaT，并只保留日期部分
-            df['purchase_date'] = pd.to_datetime(df['purchase_date'], errors='coerce').dt.date
-            # 先按购买日期倒序排列，对于没有购买日期的按名称排列
-            df = df.sort_values(
-                by=['purchase_date', 'name'],
-                ascending=[False, True],
-                na_position='last'
-            )
-            return df.to_dict('records')
-        except (FileNotFoundError, pd.errors.EmptyDataError) as e:
-            print(f"加载数据文件失败: {e}")
-            return []
+        return len(self._get_dataset()['order'])
     
     def get_categories(self):
         """
@@ -71,8 +274,25 @@ class ItemCategory:
         返回:
             list: 子类别列表，按字母顺序排序
         """
-        data = self.load_data()
-        return sorted(list(set(item['category'] for item in data if item.get('category'))))
+        return list(self._get_dataset()['categories'])
+    
+    def default_positions(self):
+        """
+        获取物品在默认排序中的位置，供搜索结果相关度相同时排序
+        
+        返回:
+            dict: ID键 -> 位置，调用方不能修改
+        """
+        return self._get_dataset()['index']
+    
+    def export_frame(self):
+        """
+        获取按数据文件原始顺序排列的DataFrame，供导出使用
+        
+        返回:
+            DataFrame: 缓存中的数据，调用方不能修改
+        """
+        return self._get_dataset()['raw']
     
     def get_item_by_id(self, item_id):
         """
@@ -82,78 +302,393 @@ class ItemCategory:
             item_id (int): 物品ID
             
         返回:
-            dict: 物品数据字典，如果找不到则返回None
+            Record: 物品数据视图，用法与字典相同，如果找不到则返回None
+        """
+        dataset = self._get_dataset()
+        pos = dataset['index'].get(id_key(item_id))
+        if pos is None:
+            return None
+        return dataset['records'][pos]
+    
+    def changes_since(self, version, limit=None):
+        """
+        获取某个数据版本之后新增或修改的物品，供客户端增量同步
+        
+        参数:
+            version (str): 客户端持有的数据版本，见 CategoryStorage.data_version
+            limit (int): 变化的物品超过该数量时不返回明细，由客户端重新加载
+            
+        返回:
+            dict:
+                version (str): 当前数据版本，客户端下次同步时传入
+                full (bool): 是否无法增量同步（版本已失效或变化过多），为True时 items 为空
+                items (list): 新增或修改的物品数据视图，按ID排列
+        """
+        # 先取签名再读数据，数据不会旧于返回的版本，之后的写入最多在下次同步时重复返回
+        signature = self.storage.signature()
+        dataset = self._get_dataset()
+        current = self.storage.data_version(signature)
+        keys = self.storage.changed_since(version, signature) if version else None
+        if keys is None or (limit is not None and len(keys) > limit):
+            return {'version': current, 'full': True, 'items': []}
+        index = dataset['index']
+        records = dataset['records']
+        items = [records[index[key]] for key in sorted(keys, key=lambda key: (len(key), key)) if key in index]
+        return {'version': current, 'full': False, 'items': items}
+    
+    def _sort_order(self, dataset, sort):
+        """
+        获取指定排序下的记录位置数组，结果随数据集缓存
+        
+        参数:
+            dataset (dict): 缓存的数据集
+            sort (str): 排序字段，前缀 '-' 表示倒序
+            
+        返回:
+            ndarray: records 中的位置，按排序先后排列
+        """
+        key = 'order:' + sort
+        count_cache('sort_order', key in dataset)
+        if key not in dataset:
+            if sort == DEFAULT_SORT or dataset['raw'].empty:
+                order = np.arange(len(dataset['records']))
+            else:
+                field = sort.lstrip('-')
+                values = dataset['raw'][field]
+                if field in DATE_FIELDS:
+                    values = to_dates(values)
+                values = pd.Series(values.to_numpy()[dataset['order']])
+                # 稳定排序，相同值保持默认顺序
+                order = values.sort_values(
+                    ascending=not sort.startswith('-'),
+                    na_position='last',
+                    kind='stable'
+                ).index.to_numpy()
+            dataset[key] = order
+        return dataset[key]
+    
+    def query_items(self, category=None, sort=None, cursor=None, limit=50):
+        """
+        分页查询物品，供列表接口使用
+        
+        参数:
+            category (str): 子类别筛选，为空时不筛选
+            sort (str): 排序字段，见 SORT_FIELDS，前缀 '-' 表示倒序，默认 DEFAULT_SORT
+            cursor (str): 上一页返回的游标，为空时从第一页开始
+            limit (int): 每页数量
+            
+        返回:
+            dict:
+                items (list): 当前页的物品数据视图
+                next_cursor (str): 下一页游标，没有更多数据时为None
+                total (int): 符合筛选条件的物品总数
+                
+        异常:
+            ValueError: 排序字段或游标无效时抛出
+        """
+        sort = sort or DEFAULT_SORT
+        if sort.lstrip('-') not in SORT_FIELDS:
+            raise ValueError(f'不支持的排序字段: {sort}')
+        offset = decode_cursor(cursor)
+        
+        dataset = self._get_dataset()
+        order = self._sort_order(dataset, sort)
+        if category:
+            if 'category_array' not in dataset:
+                raw = dataset['raw']
+                dataset['category_array'] = (
+                    raw['category'].to_numpy(dtype=object)[dataset['order']] if 'category' in raw.columns
+                    else np.full(len(dataset['order']), None)
+                )
+            order = order[dataset['category_array'][order] == category]
+        
+        records = dataset['records']
+        page = [records[pos] for pos in order[offset:offset + limit]]
+        end = offset + len(page)
+        return {
+            'items': page,
+            'next_cursor': encode_cursor(end) if end < len(order) else None,
+            'total': len(order)
+        }
+    
+    def _current_max_id(self):
+        """
+        获取当前最大ID，调用方需持有写锁
+        
+        连续创建时直接使用上次分配的ID，只有存储被其他进程修改过才重新加载数据
+        
+        返回:
+            int: 当前最大ID，无数据时为0
+        """
+        signature, max_id = self._max_id
+        if signature is not None and signature == self.storage.signature():
+            return max_id
+        return self._get_dataset()['max_id']
+    
+    def _current_versions(self):
+        """
+        获取各物品的当前版本号，调用方需持有写锁
+        
+        与 _current_max_id 相同，本进程写入后直接使用内存中的版本表；其他进程只追加了变更日志时
+        只读取新增的部分，快照被合并或CSV被重新导入时才从数据重建
+        
+        返回:
+            dict: ID键 -> 版本号
+        """
+        signature, versions = self._versions
+        current = self.storage.signature()
+        if signature == current:
+            return versions
+        entries = self.storage.journal_since(signature) if signature is not None else None
+        if entries is None:
+            versions = _row_versions(self._get_dataset()['raw'])
+        else:
+            for entry in entries:
+                _apply_version(versions, entry['op'], entry['id'], entry['fields'])
+        self._versions = (current, versions)
+        return versions
+    
+    def _check_version(self, item_id, expected_version=None):
+        """
+        获取物品的当前版本号并与客户端的版本号比较，调用方需持有写锁
+        
+        参数:
+            item_id: 物品ID
+            expected_version (int): 客户端编辑时的版本号，为None时不比较
+            
+        返回:
+            int: 当前版本号，物品不存在时返回None
+            
+        异常:
+            VersionConflict: 版本号不一致时抛出
         """
-        data = self.load_data()
-        return next((item for item in data if str(item['id']) == str(item_id)), None)
+        current = self._current_versions().get(id_key(item_id))
+        if current is not None and expected_version is not None and expected_version != current:
+            raise VersionConflict(current)
+        return current
     
-    def update_item(self, item_id, form_data, image_file=None):
+    def _append_change(self, op, item_id, fields):
+        """
+        追加一条变更记录，调用方需持有写锁
+        
+        参数:
+            op (str): 操作类型，'create' 或 'update'
+            item_id (int): 物品ID
+            fields (dict): 变更的字段
+        """
+        self._append_changes([(op, item_id, fields)])
+    
+    def _append_changes(self, changes, compact=True):
+        """
+        一次写入追加多条变更记录，增量更新价格统计并通知写入回调，调用方需持有写锁
+        
+        写入前统计与存储一致时直接调整受影响物品的贡献；否则说明存储已被其他进程修改，
+        保持统计过期，下次读取时重建
+        
+        参数:
+            changes (list): (操作类型, 物品ID, 变更的字段) 列表
+            compact (bool): 变更日志超过阈值时是否自动合并
+        """
+        previous_signature = self.storage.signature()
+        with self._stats_lock:
+            stats_current = self._stats is not None and self._stats_signature == previous_signature
+        rollup = self._writable_rollup(previous_signature, changes)
+        self.storage.append_many(changes, compact)
+        signature = self.storage.signature()
+        if self._versions[0] == previous_signature:
+            versions = self._versions[1]
+            for op, item_id, fields in changes:
+                _apply_version(versions, op, item_id, fields)
+            self._versions = (signature, versions)
+        if stats_current:
+            with self._stats_lock:
+                for op, item_id, fields in changes:
+                    if op == 'create':
+                        self._stats.add(item_id, fields)
+                    else:
+                        self._stats.update(item_id, fields)
+                self._stats_signature = signature
+        if rollup is not None:
+            with self._stats_lock:
+                for op, item_id, fields in changes:
+                    if op == 'create':
+                        rollup.add(item_id, fields)
+                    else:
+                        rollup.update(item_id, fields)
+                self._rollup = rollup
+                self._rollup_signature = signature
+            rollup.save(self.storage.rollup_path, signature)
+        for listener in self._write_listeners:
+            listener(self, changes, previous_signature, signature)
+    
+    def _save_image(self, image_file, uploaded_image=None):
+        """
+        保存上传的图片并转换为WebP格式
+        
+        配置了后台队列时只提交转换任务，原图保存后立即返回
+        
+        参数:
+            image_file (FileStorage): 上传的图片文件，可选
+            uploaded_image (str): 已通过分块上传存入的哈希文件名，可选，优先于 image_file
+            
+        返回:
+            str: 保存后的哈希文件名，没有上传图片时返回None
+            
+        异常:
+            ValueError: 分块上传的图片不存在时抛出
+        """
+        static_folder = self.app.static_folder if self.app else 'static'
+        if uploaded_image:
+            filename = uploaded_image
+            if not (is_stored_name(filename)
+                    and os.path.exists(os.path.join(get_store_dir(static_folder), filename))):
+                raise ValueError('上传的图片不存在')
+        elif image_file and image_file.filename:
+            # 按内容哈希保存原始图片，相同图片只保存一份
+            filename = save_upload(image_file, static_folder)
+        else:
+            return None
+        image_path, output_type = resolve_image(static_folder, self.type, filename)
+        # 转换为WebP格式
+        if self.image_jobs is not None:
+            self.image_jobs.submit(image_path, output_type)
+        else:
+            compress_and_convert_to_webp(image_path, output_type)
+        return filename
+    
+    def update_item(self, item_id, form_data, image_file=None, uploaded_image=None, expected_version=None):
         """
         更新物品属性
         
+        只写入提交的字段，未提交的字段保持不变。每次更新版本号加1；传入 expected_version 时
+        为条件更新，物品在编辑期间已被其他请求修改则不写入，避免后保存的覆盖先保存的修改。
+        版本检查和写入在同一次写锁内完成，多个 worker 并发更新也不会漏检
+        
         参数:
             item_id (str): 物品ID
-            form_data (dict): 表单数据
+            form_data (dict): 表单数据，只包含需要修改的字段即可
             image_file (FileStorage): 上传的图片文件，可选
+            uploaded_image (str): 分块上传完成后得到的哈希文件名，可选
+            expected_version (int): 客户端编辑时的版本号，为None时不检查
             
         返回:
             bool: 更新是否成功
             str: 成功或错误消息
+            int: 更新后的版本号，失败时为None
             
         异常:
-            Exception: 当更新失败时抛出
+            VersionConflict: 版本号不一致时抛出
         """
         try:
-            # 加载数据
-            df = pd.read_csv(self.data_path)
-            
-            # 确保item_id和DataFrame中的id列类型一致
-            item_id = str(item_id)  # 统一转为字符串
-            df['id'] = df['id'].astype(str)
-            
-            # 处理图片上传
-            image_filename = None
-            if image_file and image_file.filename:
-                # 生成安全的文件名
-                filename = secure_filename(image_file.filename)
-                # 确保目录存在
-                if self.app:
-                    image_dir = os.path.join(self.app.static_folder, 'images', self.type)
-                else:
-                    image_dir = os.path.join('static', 'images', self.type)
-                os.makedirs(image_dir, exist_ok=True)
-                # 保存原始图片
-                image_path = os.path.join(image_dir, filename)
-                image_file.save(image_path)
-                # 转换为WebP格式
-                compress_and_convert_to_webp(image_path, self.type)
-                # 更新数据库中的图片字段
-                image_filename = filename
+            # 可修改的字段：字段定义及已加载数据中的列，不为此加载数据
+            editable = set(self.field_defaults())
+            cache = self._cache
+            if cache is not None:
+                editable.update(cache['raw'].columns)
+            changes = {key: _check_value(key, value) for key, value in form_data.items()
+                       if key in editable and key not in READONLY_FIELDS}
             
-            # 更新其他属性
-            for key, value in form_data.items():
-                if key in df.columns and key not in ['item_type', 'item_id']:
-                    df.loc[df['id'] == item_id, key] = value
+            # 先检查物品是否存在及版本，冲突时不保存图片
+            with self.storage.write_lock():
+                if self._check_version(item_id, expected_version) is None:
+                    return False, '物品不存在', None
             
-            # 如果有新图片，更新图片字段
+            # 处理图片上传，如果有新图片，更新图片字段
+            image_filename = self._save_image(image_file, uploaded_image)
             if image_filename:
-                df.loc[df['id'] == item_id, 'image'] = image_filename
+                changes['image'] = image_filename
             
-            # 保存更新后的数据
-            df.to_csv(self.data_path, index=False, encoding='utf-8')
+            # 保存图片期间可能有其他写入，在追加变更记录的同一次写锁内重新检查
+            with self.storage.write_lock():
+                # 其他进程可能在此期间重写或重新导入了数据
+                current = self._check_version(item_id, expected_version)
+                if current is None:
+                    return False, '物品不存在', None
+                version = current + 1
+                changes[VERSION_FIELD] = version
+                self._append_change('update', int(id_key(item_id)), changes)
+            self.invalidate_cache()
             
-            return True, '属性更新成功'
+            return True, '属性更新成功', version
+        except VersionConflict:
+            raise
+        except ValueError as e:
+            return False, str(e), None
         except Exception as e:
             print(f"更新失败: {str(e)}")
-            return False, f'更新失败: {str(e)}'
+            return False, f'更新失败: {str(e)}', None
     
-    def create_item(self, form_data, image_file=None):
+    def field_defaults(self):
+        """
+        获取新物品的字段及默认值，同时作为批量导入的字段定义
+        
+        返回:
+            dict: 字段 -> 默认值
+        """
+        # 定义字段映射（确保所有必要字段都有默认值）
+        main_category = self.main_category
+        if main_category is None:
+            if self.type == 'figures':
+                main_category = '手办'
+            elif self.type == 'clothing':
+                main_category = '衣服'
+            else:
+                main_category = '好物'
+        return {
+            'name': '',
+            'main_category': main_category,  # 根据类型设置主类别
+            'category': '',
+            'purchase_price': 0,
+            'shipping_fee': 0,
+            'purchase_date': '',
+            'arrival_date': '',
+            'purchase_channel': '',
+            'condition': '',
+            'remark': '',
+            'sold_price': None,
+            'sold_date': '',
+            'image': ''  # 图片字段，暂时为空
+        }
+    
+    def build_item(self, form_data):
+        """
+        按 field_defaults 生成新物品数据，缺失或为空的字段使用默认值
+        
+        参数:
+            form_data (dict): 表单数据或导入的一行数据，不在字段定义中的键会被忽略
+            
+        返回:
+            dict: 新物品数据（不含ID）
+            
+        异常:
+            ValueError: 字段值不是标量（如JSONL中的列表或对象），或价格字段不是有效数字时抛出
+        """
+        new_item = {}
+        for field, default_value in self.field_defaults().items():
+            value = _check_value(field, form_data.get(field))
+            if isinstance(value, str):
+                value = value if value.strip() else None
+            elif isinstance(value, float) and math.isnan(value):
+                value = None
+            new_item[field] = default_value if value is None else value
+        
+        # 数据类型转换
+        for field in PRICE_FIELDS:
+            if new_item[field] or new_item[field] == 0:
+                try:
+                    new_item[field] = float(new_item[field])
+                except (TypeError, ValueError):
+                    raise ValueError(f'{field} 不是有效的数字: {new_item[field]}')
+        return new_item
+    
+    def create_item(self, form_data, image_file=None, uploaded_image=None):
         """
         创建新物品
         
         参数:
             form_data (dict): 表单数据
             image_file (FileStorage): 上传的图片文件，可选
+            uploaded_image (str): 分块上传完成后得到的哈希文件名，可选
             
         返回:
             bool: 创建是否成功
@@ -164,162 +699,309 @@ class ItemCategory:
             Exception: 当创建失败时抛出
         """
         try:
-            # 加载现有数据
-            try:
-                df = pd.read_csv(self.data_path)
-            except FileNotFoundError:
-                # 如果文件不存在，创建新的DataFrame
-                df = pd.DataFrame()
-                
-            # 生成新ID
-            if df.empty:
-                new_id = 1
-            else:
-                new_id = int(df['id'].max()) + 1  # 转换为Python int类型
-                
             # 准备新条目数据
-            new_item = {'id': new_id}
-            
-            # 定义字段映射（确保所有必要字段都有默认值）
-            main_category = ''
-            if self.type == 'figures':
-                main_category = '手办'
-            elif self.type == 'clothing':
-                main_category = '衣服'
-            else:
-                main_category = '好物'
-            field_defaults = {
-                'name': '',
-                'main_category': main_category,  # 根据类型设置主类别
-                'category': '',
-                'purchase_price': 0,
-                'shipping_fee': 0,
-                'purchase_date': '',
-                'arrival_date': '',
-                'purchase_channel': '',
-                'condition': '',
-                'remark': '',
-                'sold_price': None,
-                'sold_date': '',
-                'image': ''  # 图片字段，暂时为空
-            }
-            
-            # 填充数据
-            for field, default_value in field_defaults.items():
-                if field in form_data and form_data.get(field).strip():
-                    new_item[field] = form_data.get(field)
-                else:
-                    new_item[field] = default_value
-                
-            # 数据类型转换
-            if new_item['purchase_price']:
-                new_item['purchase_price'] = float(new_item['purchase_price'])
-            if new_item['shipping_fee']:
-                new_item['shipping_fee'] = float(new_item['shipping_fee'])
+            new_item = self.build_item(form_data)
                 
             # 处理图片上传
-            if image_file and image_file.filename:
-                # 生成安全的文件名
-                filename = secure_filename(image_file.filename)
-                # 确保目录存在
-                if self.app:
-                    image_dir = os.path.join(self.app.static_folder, 'images', self.type)
-                else:
-                    image_dir = os.path.join('static', 'images', self.type)
-                os.makedirs(image_dir, exist_ok=True)
-                # 保存原始图片
-                image_path = os.path.join(image_dir, filename)
-                image_file.save(image_path)
-                # 转换为WebP格式
-                compress_and_convert_to_webp(image_path, self.type)
-                # 更新数据库中的图片字段
-                new_item['image'] = filename
-                
-            # 添加新条目到DataFrame
-            new_df = pd.DataFrame([new_item])
-            if df.empty:
-                df = new_df
-            else:
-                df = pd.concat([df, new_df], ignore_index=True)
-                
-            # 保存更新后的数据
-            df.to_csv(self.data_path, index=False, encoding='utf-8')
+            image_filename = self._save_image(image_file, uploaded_image)
+            if image_filename:
+                new_item['image'] = image_filename
             
+            new_id = self.create_items([new_item])[0]
             return True, '创建成功', new_id
         except Exception as e:
             print(f"创建失败: {str(e)}")
             return False, f'创建失败: {str(e)}', None
     
+    def create_items(self, items, compact=True):
+        """
+        批量创建物品，连续分配一段ID，全部变更记录一次写入
+        
+        参数:
+            items (list): 物品数据列表，通常由 build_item 生成
+            compact (bool): 变更日志超过阈值时是否自动合并，连续写入多批时可关闭，最后调用 compact
+            
+        返回:
+            list: 新物品ID列表，与 items 顺序一致
+        """
+        if not items:
+            return []
+        # 在写锁内分配ID并追加变更记录，避免并发创建时ID冲突
+        with self.storage.write_lock():
+            first_id = self._current_max_id() + 1
+            new_ids = list(range(first_id, first_id + len(items)))
+            self._append_changes([('create', new_id, dict(item, **{VERSION_FIELD: 1}))
+                                  for new_id, item in zip(new_ids, items)], compact)
+            self._max_id = (self.storage.signature(), new_ids[-1])
+        self.invalidate_cache()
+        return new_ids
+    
+    def compact(self):
+        """
+        将变更日志合并回CSV快照
+        
+        合并不改变数据内容，合并前与存储一致的价格统计、ID分配及写入回调的派生数据在合并后仍然有效
+        """
+        with self.storage.write_lock():
+            previous_signature = self.storage.signature()
+            self.storage.compact()
+            signature = self.storage.signature()
+            with self._stats_lock:
+                if self._stats is not None and self._stats_signature == previous_signature:
+                    self._stats_signature = signature
+                rollup_current = self._rollup is not None and self._rollup_signature == previous_signature
+                if rollup_current:
+                    self._rollup_signature = signature
+            if rollup_current:
+                self._rollup.save(self.storage.rollup_path, signature)
+            if self._max_id[0] == previous_signature:
+                self._max_id = (signature, self._max_id[1])
+            if self._versions[0] == previous_signature:
+                self._versions = (signature, self._versions[1])
+            for listener in self._write_listeners:
+                listener(self, [], previous_signature, signature)
+        self.invalidate_cache()
+    
     def calculate_price_stats(self):
         """
         计算价格统计信息
         
-        计算总买入价格（包含购买价格和运费）、总卖出价格，以及按子类别统计的价格信息
+        计算总买入价格（包含购买价格和运费）、总卖出价格，以及按子类别统计的价格信息。
+        统计在首次调用时向量化计算，之后由 create_item/update_item 增量维护，
+        存储被其他进程修改时才重新计算
         
         返回:
             tuple: (total_stats, category_stats)
                 total_stats (dict): 整体统计信息
                 category_stats (dict): 按子类别统计的价格信息
         """
-        # 加载数据
-        items_data = self.load_data()
-        categories = self.get_categories()
-        
-        # 计算总买入价格（购买价格+运费）
-        total_stats = {
-            "total_purchase_price": 0,          # 所有物品的购买总价
-            "total_purchase_price_existing": 0, # 持有物品的购买总价
-            "total_purchase_price_sold": 0,     # 已售物品的购买总价
-            "total_sold_price": 0,              # 所有物品的卖出总价
-            "total_count": len(items_data),     # 物品总数
-            "existing_count": 0,                # 持有物品数
-            "sold_count": 0                     # 已售物品数
-        }
+        signature = self.storage.signature()
+        with self._stats_lock:
+            if self._stats is not None and signature == self._stats_signature:
+                count_cache('price_stats', True)
+                return self._stats.snapshot()
         
-        # 按子类别计算价格统计
-        category_stats = {}
-        
-        # 初始化每个类别的统计数据
-        for category in categories:
-            category_stats[category] = {
-                'purchase_price': 0,
-                'purchase_price_existing': 0,
-                'purchase_price_sold': 0,
-                'sold_price': 0,
-                'count': 0,
-                "existing_count": 0,
-                'sold_count': 0
-            }
-        
-        for item in items_data:
-            # 计算买入价格（购买价格+运费）
-            purchase_price = item.get('purchase_price', 0) or 0
-            shipping_fee = item.get('shipping_fee', 0) or 0
-            item_total_price = purchase_price + shipping_fee
-            total_stats['total_purchase_price'] += item_total_price
-            
-            # 计算卖出价格
-            sold_price = item.get('sold_price', 0) or 0
-            if sold_price and sold_price == sold_price:  # 检查是否为NaN
-                total_stats['total_purchase_price_sold'] += item_total_price
-                total_stats['total_sold_price'] += sold_price
-                total_stats['sold_count'] += 1
-            else:
-                total_stats['total_purchase_price_existing'] += item_total_price
-                total_stats['existing_count'] += 1
+        count_cache('price_stats', False)
+        dataset = self._get_dataset()
+        signature = self.storage.loaded_signature(signature)
+        with span('stats.build'):
+            stats = PriceStats.from_frame(dataset['raw'])
+        with self._stats_lock:
+            self._stats = stats
+            self._stats_signature = signature
+            return stats.snapshot()
+    
+    def _writable_rollup(self, signature, changes):
+        """
+        获取写入前与存储一致的资产汇总，供写入后增量更新，调用方需持有写锁
+        
+        优先使用内存中的汇总，其次读取汇总文件；包含更新操作时需要逐物品记录，
+        没有时从当前数据补齐（更新物品前通常已加载数据）。两者都不一致时返回None，
+        汇总文件随之过期，下次读取时重建
+        
+        参数:
+            signature (tuple): 写入前的存储签名
+            changes (list): 待写入的变更记录
             
-            # 按类别统计
-            category = item.get('category', '')
-            if category in category_stats:
-                category_stats[category]['purchase_price'] += item_total_price
-                category_stats[category]['count'] += 1
-                if sold_price and sold_price == sold_price:  # 检查是否为NaN
-                    category_stats[category]['purchase_price_sold'] += item_total_price
-                    category_stats[category]['sold_price'] += sold_price
-                    category_stats[category]['sold_count'] += 1
-                else:
-                    category_stats[category]['purchase_price_existing'] += item_total_price
-                    category_stats[category]['existing_count'] += 1
-        
-        return total_stats, category_stats
-    
\ No newline at end of file
+        返回:
+            PortfolioRollup: 资产汇总，或None
+        """
+        with self._stats_lock:
+            rollup = self._rollup if self._rollup_signature == signature else None
+        if rollup is None:
+            rollup = PortfolioRollup.load(self.storage.rollup_path, signature)
+            if rollup is None:
+                return None
+        if not rollup.has_items and any(op != 'create' for op, _, _ in changes):
+            with span('rollup.load_items'):
+                rollup.load_items(self._get_dataset()['raw'])
+        return rollup
+    
+    def portfolio_rollup(self):
+        """
+        获取资产汇总表（按月支出与卖出、按渠道支出、持有成本与已实现收益）
+        
+        依次使用内存中的汇总、汇总文件，都与存储不一致时才扫描物品数据重建并写回文件；
+        create_item/update_item 写入时增量维护，不需要重建
+        
+        返回:
+            dict: PortfolioRollup.tables 的结构，返回的是副本
+        """
+        signature = self.storage.signature()
+        with self._stats_lock:
+            if self._rollup is not None and signature == self._rollup_signature:
+                count_cache('rollup', True)
+                return self._rollup.tables()
+        
+        rollup = PortfolioRollup.load(self.storage.rollup_path, signature)
+        count_cache('rollup', rollup is not None)
+        if rollup is None:
+            dataset = self._get_dataset()
+            signature = self.storage.loaded_signature(signature)
+            with span('rollup.build'):
+                rollup = PortfolioRollup.from_frame(dataset['raw'])
+            rollup.save(self.storage.rollup_path, signature)
+        with self._stats_lock:
+            self._rollup = rollup
+            self._rollup_signature = signature
+            return rollup.tables()
+
+def _check_value(field, value):
+    """
+    校验更新的字段值：只接受标量，价格字段转换为数字，空值表示清空、保持不变
+    
+    参数:
+        field (str): 字段名
+        value: 表单或JSON中的值
+        
+    返回:
+        转换后的值
+        
+    异常:
+        ValueError: 值不是标量，或价格字段不是有效数字时抛出
+    """
+    if value is not None and not isinstance(value, (str, int, float, bool)):
+        raise ValueError(f'{field} 不是有效的值: {value!r}')
+    if field not in PRICE_FIELDS or value is None or (isinstance(value, str) and not value.strip()):
+        return value
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        return float(value)
+    except ValueError:
+        raise ValueError(f'{field} 不是有效的数字: {value}') from None
+
+
+def _estimate_nbytes(raw):
+    """
+    估算数据集的内存占用：DataFrame 本身（含文本）、按列转换后的 Python 值（每个值按一个指针加
+    一个数值或日期对象计）以及两个ID索引字典
+    
+    参数:
+        raw (DataFrame): 物品数据
+        
+    返回:
+        int: 字节数
+    """
+    if raw.empty:
+        return 0
+    return int(raw.memory_usage(deep=True).sum()) + raw.size * 32 + len(raw) * 200
+
+
+def _row_versions(raw):
+    """
+    从数据中生成版本表
+    
+    参数:
+        raw (DataFrame): 按文件原始顺序保存的数据
+        
+    返回:
+        dict: ID键 -> 版本号，未记录版本的为1
+    """
+    if 'id' not in raw.columns or raw.empty:
+        return {}
+    if VERSION_FIELD in raw.columns:
+        versions = pd.to_numeric(raw[VERSION_FIELD], errors='coerce').fillna(1).astype(np.int64)
+    else:
+        versions = np.ones(len(raw), dtype=np.int64)
+    return dict(zip(id_keys(raw['id']).tolist(), np.asarray(versions).tolist()))
+
+
+def _apply_version(versions, op, item_id, fields):
+    """
+    将一条变更记录应用到版本表
+    """
+    if VERSION_FIELD in fields:
+        versions[id_key(item_id)] = int(fields[VERSION_FIELD])
+    elif op == 'create':
+        versions.setdefault(id_key(item_id), 1)
+
+
+def item_version(item):
+    """
+    获取物品数据中的版本号
+    
+    参数:
+        item (Mapping): 物品数据字典或 Record
+        
+    返回:
+        int: 版本号，未记录版本的旧数据为1
+    """
+    try:
+        value = float(item.get(VERSION_FIELD))
+    except (TypeError, ValueError):
+        return 1
+    return 1 if math.isnan(value) else int(value)
+
+
+def encode_cursor(offset):
+    """
+    将偏移量编码为不透明的分页游标
+    
+    参数:
+        offset (int): 下一页起始位置
+        
+    返回:
+        str: 游标字符串
+    """
+    raw = json.dumps({'o': offset}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解析分页游标
+    
+    参数:
+        cursor (str): 游标字符串，为空时返回0
+        
+    返回:
+        int: 起始位置
+        
+    异常:
+        ValueError: 游标无效时抛出
+    """
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        offset = int(json.loads(base64.urlsafe_b64decode(padded))['o'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f'无效的游标: {cursor}') from e
+    if offset < 0:
+        raise ValueError(f'无效的游标: {cursor}')
+    return offset
+
+
+def serialize_item(item, fields=None):
+    """
+    将物品数据字典转换为可JSON序列化的字典
+    
+    NaN/NaT 转为 None，日期转为 ISO 格式字符串（零点的 Timestamp 只保留日期），numpy 数值转为 Python 数值
+    
+    参数:
+        item (Mapping): 物品数据字典或 Record
+        fields (list): 需要返回的字段，为None时返回全部字段
+        
+    返回:
+        dict: 序列化后的字典
+    """
+    pairs = item.items() if fields is None else [(field, item[field]) for field in fields if field in item]
+    result = {}
+    for key, value in pairs:
+        if isinstance(value, str):
+            result[key] = value
+            continue
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, float) and math.isnan(value):
+            value = None
+        elif value is pd.NaT:
+            value = None
+        elif isinstance(value, pd.Timestamp) and value == value.normalize():
+            # 快照中的日期列为 datetime64，只输出日期部分
+            value = value.date().isoformat()
+        elif isinstance(value, (datetime.date, datetime.datetime)):
+            value = value.isoformat()
+        result[key] = value
+    return result
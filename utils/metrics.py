@@ -0,0 +1,319 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/metrics.py
+Description: 耗时埋点与指标统计，输出 Server-Timing 响应头和 Prometheus 文本格式
+'''
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# 耗时直方图的分桶上限（秒）
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_PREFIX = 'storage_management_'
+
+_enabled = True
+_local = threading.local()
+_lock = threading.Lock()
+# (指标名, 标签元组) -> [各分桶计数..., 总和, 总数]
+_histograms = {}
+# (指标名, 标签元组) -> 计数
+_counters = {}
+
+
+def configure(enabled):
+    """
+    开启或关闭埋点，关闭后 span 返回空操作对象，计数直接返回
+
+    参数:
+        enabled (bool): 是否开启
+    """
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def is_enabled():
+    """
+    返回:
+        bool: 埋点是否开启
+    """
+    return _enabled
+
+
+class _Span:
+    """
+    计时上下文，退出时记录到直方图，并加入当前请求或 capture 的耗时列表
+    """
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record_span(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoopSpan:
+    """
+    关闭埋点时使用的空操作上下文
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name):
+    """
+    记录一段代码的耗时
+
+    用法:
+        with span('dataset.read'):
+            ...
+
+    参数:
+        name (str): 阶段名称，同时作为 Server-Timing 的指标名
+
+    返回:
+        上下文管理器
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(name)
+
+
+def record_span(name, seconds):
+    """
+    记录一个阶段的耗时
+
+    参数:
+        name (str): 阶段名称
+        seconds (float): 耗时（秒）
+    """
+    if not _enabled:
+        return
+    spans = getattr(_local, 'spans', None)
+    if spans is not None:
+        spans.append((name, seconds))
+    if not getattr(_local, 'capturing', False):
+        _observe(('span_duration_seconds', (('span', name),)), seconds)
+
+
+def record_spans(spans):
+    """
+    将 capture 收集到的阶段耗时记录到本进程的直方图
+
+    参数:
+        spans (list): (阶段名称, 耗时秒) 列表
+    """
+    for name, seconds in spans:
+        _observe(('span_duration_seconds', (('span', name),)), seconds)
+
+
+def count_cache(cache, hit):
+    """
+    记录一次缓存访问
+
+    参数:
+        cache (str): 缓存名称
+        hit (bool): 是否命中
+    """
+    if not _enabled:
+        return
+    inc('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+def observe(metric, seconds, **labels):
+    """
+    向直方图记录一个观测值
+
+    参数:
+        metric (str): 指标名（不含前缀）
+        seconds (float): 观测值（秒）
+        **labels: 标签
+    """
+    if not _enabled:
+        return
+    _observe((metric, tuple(sorted(labels.items()))), seconds)
+
+
+def _observe(key, seconds):
+    """
+    按 (指标名, 标签元组) 记录观测值
+    """
+    index = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        values = _histograms.get(key)
+        if values is None:
+            values = _histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+        if index < len(BUCKETS):
+            values[index] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+
+def inc(metric, amount=1, **labels):
+    """
+    增加计数器
+
+    参数:
+        metric (str): 指标名（不含前缀）
+        amount (int): 增加量
+        **labels: 标签
+    """
+    if not _enabled:
+        return
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def begin_request():
+    """
+    开始收集当前线程的阶段耗时，供 Server-Timing 使用
+    """
+    _local.spans = []
+
+
+def end_request():
+    """
+    结束收集
+
+    返回:
+        list: (阶段名称, 耗时秒) 列表，未开始收集时为空列表
+    """
+    spans = getattr(_local, 'spans', None) or []
+    _local.spans = None
+    return spans
+
+
+@contextmanager
+def capture():
+    """
+    在当前线程收集阶段耗时，用于在图片转换子进程中收集后传回主进程
+
+    收集期间只记录到列表，不写入本进程的直方图，由调用方通过 record_spans 在主进程中记录
+
+    返回:
+        list: 退出时包含收集到的 (阶段名称, 耗时秒)
+    """
+    previous = getattr(_local, 'spans', None)
+    spans = []
+    _local.spans = spans
+    _local.capturing = True
+    try:
+        yield spans
+    finally:
+        _local.spans = previous
+        _local.capturing = False
+
+
+def server_timing(spans, total=None):
+    """
+    生成 Server-Timing 响应头
+
+    参数:
+        spans (list): (阶段名称, 耗时秒) 列表
+        total (float): 请求总耗时（秒），可选
+
+    返回:
+        str: 响应头的值
+    """
+    entries = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in spans]
+    if total is not None:
+        entries.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(entries)
+
+
+def render_prometheus():
+    """
+    以 Prometheus 文本格式输出当前进程的全部指标
+
+    多 worker 部署时每个进程各自统计，由 Prometheus 分别抓取或按实例聚合
+
+    返回:
+        str: 指标文本
+    """
+    with _lock:
+        histograms = {key: list(values) for key, values in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    declared = set()
+    for (metric, labels), values in sorted(histograms.items()):
+        name = METRIC_PREFIX + metric
+        if name not in declared:
+            lines.append(f'# TYPE {name} histogram')
+            declared.add(name)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, values):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, le=repr(bound))} {cumulative}')
+        lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {values[-1]}')
+        lines.append(f'{name}_sum{_labels(labels)} {values[-2]:.6f}')
+        lines.append(f'{name}_count{_labels(labels)} {values[-1]}')
+
+    hit_ratio = {}
+    for (metric, labels), value in sorted(counters.items()):
+        name = METRIC_PREFIX + metric
+        if name not in declared:
+            lines.append(f'# TYPE {name} counter')
+            declared.add(name)
+        lines.append(f'{name}{_labels(labels)} {value}')
+        if metric == 'cache_requests_total':
+            label_map = dict(labels)
+            totals = hit_ratio.setdefault(label_map['cache'], [0, 0])
+            totals[0] += value if label_map['result'] == 'hit' else 0
+            totals[1] += value
+
+    if hit_ratio:
+        name = METRIC_PREFIX + 'cache_hit_ratio'
+        lines.append(f'# TYPE {name} gauge')
+        for cache, (hits, total) in sorted(hit_ratio.items()):
+            lines.append(f'{name}{_labels((("cache", cache),))} {hits / total:.4f}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """
+    清空全部指标
+    """
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _labels(labels, **extra):
+    """
+    格式化标签，如 {span="dataset.read",le="0.01"}
+    """
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items) + '}'
+
+
+def _escape(value):
+    """
+    转义标签值中的反斜杠、双引号和换行
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
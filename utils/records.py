@@ -0,0 +1,132 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/records.py
+Description: 基于列的只读物品记录视图，按需读取字段，不为每行生成字典
+'''
+
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .columnar import DATE_FIELDS, to_dates
+
+
+def build_columns(df):
+    """
+    将DataFrame转换为按列保存的 Python 值列表，供 Record 按行读取
+
+    每列整体转换一次（numpy 数值转为 Python 数值，日期转为 datetime.date，缺失日期为 NaT），
+    之后按行读取只是列表索引，不再逐个转换
+
+    参数:
+        df (DataFrame): 物品数据
+
+    返回:
+        dict: 字段 -> 值列表
+    """
+    columns = {}
+    for name in df.columns:
+        column = df[name]
+        if name in DATE_FIELDS or column.dtype.kind == 'M':
+            values = to_dates(column).to_numpy(dtype='datetime64[s]').astype('datetime64[D]').tolist()
+            columns[name] = [pd.NaT if value is None else value for value in values]
+        elif column.dtype.kind in 'iufb' and not isinstance(column.dtype, pd.CategoricalDtype):
+            columns[name] = column.to_numpy().tolist()
+        else:
+            columns[name] = column.to_numpy(dtype=object, na_value=np.nan).tolist()
+    return columns
+
+
+class Record(Mapping):
+    """
+    单个物品的只读视图
+
+    行为与物品数据字典一致（item['name']、item.get('image')、模板中的 item.name），
+    只保存列和行位置，字段值在访问时才从列中读取
+    """
+
+    __slots__ = ('_columns', '_row')
+
+    def __init__(self, columns, row):
+        """
+        参数:
+            columns (dict): build_columns 生成的列
+            row (int): 行位置
+        """
+        self._columns = columns
+        self._row = row
+
+    def __getitem__(self, field):
+        return self._columns[field][self._row]
+
+    def __getattr__(self, field):
+        # 模板中 item.name 先按属性查找，直接返回字段值，避免先抛出 AttributeError
+        if field[0] == '_':
+            raise AttributeError(field)
+        try:
+            return self._columns[field][self._row]
+        except KeyError:
+            raise AttributeError(field) from None
+
+    def __contains__(self, field):
+        return field in self._columns
+
+    def get(self, field, default=None):
+        column = self._columns.get(field)
+        return default if column is None else column[self._row]
+
+    def keys(self):
+        return self._columns.keys()
+
+    def items(self):
+        # 一次取出全部字段，序列化整行时比逐个 item[field] 快
+        row = self._row
+        return [(field, column[row]) for field, column in self._columns.items()]
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __repr__(self):
+        return f'Record({dict(self)!r})'
+
+
+class RecordList(Sequence):
+    """
+    按指定行顺序排列的物品视图列表
+
+    len() 不读取任何字段，索引和迭代时才生成 Record，切片返回新的视图
+    """
+
+    __slots__ = ('_columns', '_order')
+
+    def __init__(self, columns, order):
+        """
+        参数:
+            columns (dict): build_columns 生成的列
+            order (ndarray): 行位置数组，决定列表顺序
+        """
+        self._columns = columns
+        self._order = order
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return RecordList(self._columns, self._order[pos])
+        return Record(self._columns, int(self._order[pos]))
+
+    def __iter__(self):
+        columns = self._columns
+        for row in self._order.tolist():
+            yield Record(columns, row)
+
+    def __repr__(self):
+        return f'RecordList(<{len(self)} items>)'
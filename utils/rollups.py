@@ -0,0 +1,416 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/rollups.py
+Description: 资产汇总表（按月支出与卖出、按渠道支出、持有与已实现收益），写入时增量维护并持久化
+'''
+
+import json
+import os
+
+import pandas as pd
+
+from .columnar import to_dates
+from .fields import id_keys, number, numeric_column, rounded, valid_text
+from .storage import id_key
+
+# 按月汇总的字段：当月购买支出、购买件数、当月卖出收入、卖出物品的购买成本、卖出件数
+MONTH_FIELDS = ('spend', 'count', 'revenue', 'sold_cost', 'sold_count')
+
+# 按渠道汇总的字段
+CHANNEL_FIELDS = ('spend', 'count')
+
+# 整体汇总的字段
+TOTAL_FIELDS = ('spend', 'count', 'holding_cost', 'holding_count', 'revenue', 'sold_cost', 'sold_count')
+
+# 影响汇总的物品字段
+SOURCE_FIELDS = ('purchase_date', 'purchase_channel', 'purchase_price', 'shipping_fee',
+                 'sold_date', 'sold_price')
+
+# 汇总文件格式版本，字段变化时旧文件自动失效
+ROLLUP_VERSION = 1
+
+# 每条逐物品记录的估算内存（字典项、ID键、元组及其中的数值，月份和渠道字符串共用）
+ITEM_NBYTES = 260
+
+
+class PortfolioRollup:
+    """
+    单个物品类别的资产汇总表
+
+    与 PriceStats 相同，为每个物品记录影响汇总的字段（购买月份、渠道、购买价格、运费、卖出月份、卖出价格），
+    创建或更新物品时先减去旧贡献再加上新贡献。汇总结果连同存储签名保存到文件，
+    进程重启或其他 worker 写入后，只要签名一致就直接读取，不需要重新扫描物品数据。
+    构建或从文件读取的汇总都不含逐物品记录（读取汇总用不到），第一次更新物品前由 load_items 补齐，
+    只有新建物品时不需要。
+    """
+
+    def __init__(self):
+        """
+        初始化空的汇总
+
+        属性:
+            months (dict): 月份(YYYY-MM) -> 字段见 MONTH_FIELDS
+            channels (dict): 购买渠道 -> 字段见 CHANNEL_FIELDS，未填写渠道的键为空字符串
+            totals (dict): 整体汇总，字段见 TOTAL_FIELDS
+            _items (dict): 物品ID -> (购买月份, 渠道, 购买价格, 运费, 卖出月份, 卖出价格)，未加载时为None
+        """
+        self.months = {}
+        self.channels = {}
+        self.totals = dict.fromkeys(TOTAL_FIELDS, 0)
+        self._items = None
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        从物品数据构建汇总，使用向量化计算，不生成逐物品记录
+
+        参数:
+            df (DataFrame): 物品数据
+
+        返回:
+            PortfolioRollup: 汇总对象
+        """
+        rollup = cls()
+        if df.empty:
+            return rollup
+
+        frame = _source_frame(df)
+        sold = frame['sold_price'] != 0
+        rollup.totals = {
+            'spend': float(frame['total'].sum()),
+            'count': len(frame),
+            'holding_cost': float(frame['total'][~sold].sum()),
+            'holding_count': int((~sold).sum()),
+            'revenue': float(frame['sold_price'][sold].sum()),
+            'sold_cost': float(frame['total'][sold].sum()),
+            'sold_count': int(sold.sum())
+        }
+
+        purchases = frame.groupby('month', dropna=True)['total'].agg(['sum', 'count'])
+        sales = frame[sold].groupby('sold_month', dropna=True).agg(
+            revenue=('sold_price', 'sum'), sold_cost=('total', 'sum'), sold_count=('total', 'count'))
+        for month in purchases.index.union(sales.index):
+            values = dict.fromkeys(MONTH_FIELDS, 0)
+            if month in purchases.index:
+                values['spend'] = float(purchases.at[month, 'sum'])
+                values['count'] = int(purchases.at[month, 'count'])
+            if month in sales.index:
+                values['revenue'] = float(sales.at[month, 'revenue'])
+                values['sold_cost'] = float(sales.at[month, 'sold_cost'])
+                values['sold_count'] = int(sales.at[month, 'sold_count'])
+            rollup.months[month] = values
+
+        channels = frame.groupby('channel')['total'].agg(['sum', 'count'])
+        rollup.channels = {channel: {'spend': float(row['sum']), 'count': int(row['count'])}
+                           for channel, row in channels.iterrows()}
+        return rollup
+
+    @property
+    def has_items(self):
+        """
+        是否有逐物品记录，没有时不能增量更新
+        """
+        return self._items is not None
+
+    def load_items(self, df):
+        """
+        从物品数据补齐逐物品记录，汇总结果保持不变
+
+        参数:
+            df (DataFrame): 与当前汇总一致的物品数据
+        """
+        self._items = {} if df.empty else dict(zip(id_keys(df['id']), _source_tuples(_source_frame(df))))
+
+    def memory_usage(self):
+        """
+        获取逐物品记录的估算内存占用，未加载时为0；按月及按渠道的汇总很小，不计入
+
+        返回:
+            int: 字节数
+        """
+        items = self._items
+        return 0 if items is None else len(items) * ITEM_NBYTES
+
+    def add(self, item_id, fields):
+        """
+        加入一个新物品
+
+        参数:
+            item_id: 物品ID
+            fields (dict): 物品字段，缺失的字段按空值处理
+        """
+        source = _source(fields)
+        if self._items is not None:
+            self._items[id_key(item_id)] = source
+        self._apply(source, 1)
+
+    def update(self, item_id, changes):
+        """
+        更新一个物品，只需传入变化的字段
+
+        参数:
+            item_id: 物品ID
+            changes (dict): 变化的字段
+        """
+        key = id_key(item_id)
+        old = self._items.get(key)
+        if old is None:
+            self.add(item_id, changes)
+            return
+        if not any(field in changes for field in SOURCE_FIELDS):
+            return
+
+        fields = _fields(old)
+        fields.update({field: changes[field] for field in SOURCE_FIELDS if field in changes})
+        new = _source(fields)
+        self._apply(old, -1)
+        self._items[key] = new
+        self._apply(new, 1)
+
+    def _apply(self, source, sign):
+        """
+        将一个物品的贡献加到(sign=1)或减出(sign=-1)各汇总表
+        """
+        month, channel, purchase_price, shipping_fee, sold_month, sold_price = source
+        total = purchase_price + shipping_fee
+        sold = sold_price != 0
+
+        totals = self.totals
+        totals['spend'] += sign * total
+        totals['count'] += sign
+        if sold:
+            totals['revenue'] += sign * sold_price
+            totals['sold_cost'] += sign * total
+            totals['sold_count'] += sign
+        else:
+            totals['holding_cost'] += sign * total
+            totals['holding_count'] += sign
+
+        if month:
+            values = self.months.setdefault(month, dict.fromkeys(MONTH_FIELDS, 0))
+            values['spend'] += sign * total
+            values['count'] += sign
+            self._drop_empty_month(month)
+        if sold and sold_month:
+            values = self.months.setdefault(sold_month, dict.fromkeys(MONTH_FIELDS, 0))
+            values['revenue'] += sign * sold_price
+            values['sold_cost'] += sign * total
+            values['sold_count'] += sign
+            self._drop_empty_month(sold_month)
+
+        values = self.channels.setdefault(channel, dict.fromkeys(CHANNEL_FIELDS, 0))
+        values['spend'] += sign * total
+        values['count'] += sign
+        if values['count'] == 0:
+            del self.channels[channel]
+
+    def _drop_empty_month(self, month):
+        values = self.months[month]
+        if values['count'] == 0 and values['sold_count'] == 0:
+            del self.months[month]
+
+    def tables(self):
+        """
+        复制汇总表，供跨类别合并，复制后不受之后的增量更新影响
+
+        返回:
+            dict: totals、months、channels
+        """
+        return {
+            'totals': dict(self.totals),
+            'months': {month: dict(values) for month, values in self.months.items()},
+            'channels': {channel: dict(values) for channel, values in self.channels.items()}
+        }
+
+    def snapshot(self):
+        """
+        导出汇总结果
+
+        返回:
+            dict: totals（含 realized_profit）、monthly（按月份升序）、channels（按支出降序）
+        """
+        return summarize(self.totals, self.months, self.channels)
+
+    def save(self, path, signature):
+        """
+        将汇总结果（不含逐物品记录）连同存储签名写入文件，先写临时文件再重命名
+
+        参数:
+            path (str): 汇总文件路径
+            signature (tuple): 汇总对应的存储签名
+        """
+        data = {
+            'version': ROLLUP_VERSION,
+            'signature': _signature_key(signature),
+            'totals': self.totals,
+            'months': self.months,
+            'channels': self.channels
+        }
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, signature):
+        """
+        读取汇总文件
+
+        参数:
+            path (str): 汇总文件路径
+            signature (tuple): 当前的存储签名
+
+        返回:
+            PortfolioRollup: 汇总对象（没有逐物品记录）；文件不存在、已损坏或签名不一致时返回None
+        """
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (not isinstance(data, dict) or data.get('version') != ROLLUP_VERSION
+                or data.get('signature') != _signature_key(signature)):
+            return None
+        rollup = cls()
+        rollup.totals = data['totals']
+        rollup.months = data['months']
+        rollup.channels = data['channels']
+        return rollup
+
+
+def summarize(totals, months, channels):
+    """
+    将汇总表整理为接口和模板使用的结构，金额保留两位小数
+
+    参数:
+        totals (dict): 整体汇总
+        months (dict): 月份 -> 汇总
+        channels (dict): 渠道 -> 汇总
+
+    返回:
+        dict: 结构见 PortfolioRollup.snapshot
+    """
+    totals = rounded(totals)
+    totals['realized_profit'] = round(totals['revenue'] - totals['sold_cost'], 2)
+    monthly = []
+    for month in sorted(months):
+        values = rounded(months[month])
+        values['profit'] = round(values['revenue'] - values['sold_cost'], 2)
+        monthly.append({'month': month, **values})
+    channel_list = [{'channel': channel, **rounded(values)} for channel, values in channels.items()]
+    channel_list.sort(key=lambda values: (-values['spend'], values['channel']))
+    return {'totals': totals, 'monthly': monthly, 'channels': channel_list}
+
+
+def combine(tables):
+    """
+    合并多个类别的汇总
+
+    参数:
+        tables (list): PortfolioRollup.tables 的返回值列表
+
+    返回:
+        dict: 结构见 PortfolioRollup.snapshot
+    """
+    totals = dict.fromkeys(TOTAL_FIELDS, 0)
+    months = {}
+    channels = {}
+    for table in tables:
+        for field in TOTAL_FIELDS:
+            totals[field] += table['totals'][field]
+        for month, values in table['months'].items():
+            merged = months.setdefault(month, dict.fromkeys(MONTH_FIELDS, 0))
+            for field in MONTH_FIELDS:
+                merged[field] += values[field]
+        for channel, values in table['channels'].items():
+            merged = channels.setdefault(channel, dict.fromkeys(CHANNEL_FIELDS, 0))
+            for field in CHANNEL_FIELDS:
+                merged[field] += values[field]
+    return summarize(totals, months, channels)
+
+
+def _signature_key(signature):
+    """
+    将存储签名转换为JSON中的形式，便于与文件中保存的签名比较
+    """
+    return [list(stat) if stat else None for stat in signature]
+
+
+def _month_column(df, column):
+    if column not in df.columns:
+        return pd.Series(None, index=df.index, dtype=object)
+    # 逐行 strftime 很慢，先算出 年*100+月，只为不重复的月份生成字符串
+    dates = to_dates(df[column])
+    codes = dates.dt.year * 100 + dates.dt.month
+    labels = {code: f'{int(code) // 100:04d}-{int(code) % 100:02d}' for code in codes.dropna().unique()}
+    return codes.map(labels)
+
+
+def _channel_column(df):
+    if 'purchase_channel' not in df.columns:
+        return pd.Series('', index=df.index)
+    channels = df['purchase_channel'].astype(object)
+    return channels.where(channels.map(valid_text), '').map(str.strip)
+
+
+def _source_frame(df):
+    """
+    向量化提取各物品影响汇总的字段
+    """
+    purchase_price = numeric_column(df, 'purchase_price')
+    shipping_fee = numeric_column(df, 'shipping_fee')
+    return pd.DataFrame({
+        'month': _month_column(df, 'purchase_date'),
+        'channel': _channel_column(df),
+        'purchase_price': purchase_price,
+        'shipping_fee': shipping_fee,
+        'total': purchase_price + shipping_fee,
+        'sold_month': _month_column(df, 'sold_date'),
+        'sold_price': numeric_column(df, 'sold_price')
+    }, index=df.index)
+
+
+def _source_tuples(frame):
+    months = frame['month'].astype(object).where(frame['month'].notna(), None)
+    sold_months = frame['sold_month'].astype(object).where(frame['sold_month'].notna(), None)
+    return zip(months.tolist(), frame['channel'].tolist(), frame['purchase_price'].tolist(),
+               frame['shipping_fee'].tolist(), sold_months.tolist(), frame['sold_price'].tolist())
+
+
+def _month(value):
+    """
+    将日期字段转换为 YYYY-MM，缺失或无法解析时为None
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    date = to_dates(pd.Series([value]))[0]
+    return None if pd.isna(date) else date.strftime('%Y-%m')
+
+
+def _source(fields):
+    """
+    提取并规范化影响汇总的字段
+
+    返回:
+        tuple: (购买月份, 渠道, 购买价格, 运费, 卖出月份, 卖出价格)
+    """
+    channel = fields.get('purchase_channel')
+    return (
+        _month(fields.get('purchase_date')),
+        channel.strip() if valid_text(channel) else '',
+        number(fields.get('purchase_price')),
+        number(fields.get('shipping_fee')),
+        _month(fields.get('sold_date')),
+        number(fields.get('sold_price'))
+    )
+
+
+def _fields(source):
+    """
+    将已记录的贡献还原为字段，供只更新部分字段时合并（月份可以重新解析为日期）
+    """
+    return dict(zip(SOURCE_FIELDS, source))
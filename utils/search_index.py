@@ -0,0 +1,378 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/search_index.py
+Description: 物品全文搜索，内存倒排索引，中文按字符二元组切分，写入时增量更新
+'''
+
+import math
+import re
+import threading
+
+import numpy as np
+
+from .metrics import count_cache, span
+from .storage import id_key
+
+# 参与搜索的字段及权重
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'purchase_channel': 2.0,
+    'remark': 1.0
+}
+
+# 命中的查询词元占比达到该值即视为匹配，允许少量错字
+MIN_COVERAGE = 0.5
+
+# 中日韩文字连续片段，或字母数字组成的单词
+_TOKEN_PATTERN = re.compile(
+    r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+|[0-9a-z]+'
+)
+_CJK_START = '\u3040'
+
+
+def tokenize(text):
+    """
+    将文本切分为索引词元
+
+    中日韩文字切分为相邻两字的二元组（单字片段保留单字），字母数字单词切分为三元组
+    （不足三个字符的保留整词），查询时使用相同规则，因此对错字和部分匹配有一定容错
+
+    参数:
+        text (str): 待切分文本
+
+    返回:
+        list: 去重后的词元列表，保持出现顺序
+    """
+    if not isinstance(text, str) or not text:
+        return []
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        size = 2 if run[0] >= _CJK_START else 3
+        if len(run) <= size:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + size] for i in range(len(run) - size + 1))
+    return list(dict.fromkeys(tokens))
+
+
+class _CategoryIndex:
+    """
+    单个物品类别的倒排索引
+
+    物品按加入顺序分配连续的槽位，查询时用 numpy 数组按槽位累加得分，
+    每个词元的倒排表在首次查询时转换为数组并缓存，词元变化时丢弃缓存
+
+    属性:
+        slots (dict): 物品ID -> 槽位
+        keys (list): 槽位 -> 物品ID，已移除的物品为None
+        docs (dict): 物品ID -> {字段: 文本}，更新时只传入变化的字段，需要保留旧文本
+        postings (dict): 词元 -> {槽位: 字段权重之和}
+        char_tokens (dict): 汉字 -> 包含该字的二元组集合，用于单字查询
+        signature (tuple): 索引对应的存储签名
+        nbytes (int): 构建时估算的内存占用，增量更新不重新估算
+    """
+
+    def __init__(self):
+        self.slots = {}
+        self.keys = []
+        self.docs = {}
+        self.postings = {}
+        self.char_tokens = {}
+        self.signature = None
+        self.nbytes = 0
+        self._arrays = {}
+
+    def add(self, key, fields):
+        """
+        加入或替换一个物品
+        """
+        self.remove(key)
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.slots[key] = len(self.keys)
+            self.keys.append(key)
+        doc = {field: fields[field] for field in FIELD_WEIGHTS
+               if isinstance(fields.get(field), str) and fields[field]}
+        self.docs[key] = doc
+        for token, weight in _weigh(doc).items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                if len(token) == 2 and token[0] >= _CJK_START:
+                    for char in token:
+                        self.char_tokens.setdefault(char, set()).add(token)
+            posting[slot] = weight
+            self._arrays.pop(token, None)
+
+    def estimate_nbytes(self):
+        """
+        估算索引的内存占用：每个物品的文本和槽位，每条倒排记录按一个字典项计
+        """
+        entries = sum(len(posting) for posting in self.postings.values())
+        return len(self.docs) * 400 + entries * 100 + len(self.postings) * 150
+
+    def update(self, key, changes):
+        """
+        合并变化的字段后重新索引该物品
+        """
+        if not any(field in changes for field in FIELD_WEIGHTS) and key in self.docs:
+            return
+        fields = dict(self.docs.get(key, {}))
+        fields.update({field: changes[field] for field in FIELD_WEIGHTS if field in changes})
+        self.add(key, fields)
+
+    def remove(self, key):
+        """
+        从索引中移除一个物品，槽位保留给同一物品重新加入时使用
+        """
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        slot = self.slots[key]
+        for token in _weigh(doc):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(slot, None)
+            self._arrays.pop(token, None)
+            if not posting:
+                del self.postings[token]
+                for char in token if len(token) == 2 else ():
+                    self.char_tokens.get(char, set()).discard(token)
+
+    def expand(self, token):
+        """
+        获取查询词元对应的索引词元
+
+        汉字只在单字片段中单独建立索引，单字查询时还需展开为包含该字的全部二元组
+        """
+        indexed = [token] if token in self.postings else []
+        if len(token) == 1 and token >= _CJK_START:
+            indexed.extend(self.char_tokens.get(token, ()))
+        return indexed
+
+    def arrays(self, token):
+        """
+        获取词元倒排表的数组形式
+
+        返回:
+            tuple: (槽位数组, 权重数组)
+        """
+        cached = self._arrays.get(token)
+        if cached is None:
+            posting = self.postings[token]
+            cached = (
+                np.fromiter(posting.keys(), dtype=np.int64, count=len(posting)),
+                np.fromiter(posting.values(), dtype=np.float64, count=len(posting))
+            )
+            self._arrays[token] = cached
+        return cached
+
+    def match(self, tokens, required):
+        """
+        计算各物品的命中词元数和得分
+
+        参数:
+            tokens (list): 查询词元
+            required (int): 最少命中的词元数
+
+        返回:
+            tuple: (槽位数组, 命中词元数数组, 得分数组)，只包含达到 required 的物品
+        """
+        size = len(self.keys)
+        doc_count = len(self.docs) or 1
+        scores = np.zeros(size)
+        counts = np.zeros(size, dtype=np.int32)
+        for token in tokens:
+            expanded = self.expand(token)
+            hit = np.zeros(size, dtype=bool) if len(expanded) > 1 else None
+            for indexed in expanded:
+                slots, weights = self.arrays(indexed)
+                idf = math.log(1 + doc_count / len(slots))
+                scores[slots] += idf * weights
+                if hit is None:
+                    counts[slots] += 1
+                else:
+                    hit[slots] = True
+            if hit is not None:
+                # 单字展开后的多个二元组可能命中同一物品，只计一次
+                counts += hit
+        matched = np.flatnonzero(counts >= required)
+        return matched, counts[matched], scores[matched]
+
+
+class SearchIndex:
+    """
+    跨物品类别的全文搜索索引
+
+    每个类别维护独立的倒排索引，首次查询时从缓存数据构建；之后通过 ItemCategory 的
+    写入回调增量更新，单次写入只重新索引受影响的物品。与价格统计相同，存储被其他进程
+    修改后索引在下次查询时按类别重建。
+    """
+
+    def __init__(self, category_map):
+        """
+        初始化搜索索引，并注册各类别的写入回调
+
+        参数:
+            category_map (dict): 物品类型 -> ItemCategory
+        """
+        self.category_map = category_map
+        self._indexes = {}
+        self._lock = threading.Lock()
+        for category in category_map.values():
+            category.add_write_listener(self._on_write)
+
+    def _on_write(self, category, changes, previous_signature, signature):
+        """
+        写入回调：写入前索引与存储一致时增量更新，否则保持过期等待重建
+        """
+        with self._lock:
+            index = self._indexes.get(category.type)
+            if index is None or index.signature != previous_signature:
+                return
+            for op, item_id, fields in changes:
+                key = id_key(item_id)
+                if op == 'create':
+                    index.add(key, fields)
+                else:
+                    index.update(key, fields)
+            index.signature = signature
+
+    def warm(self, item_types=None):
+        """
+        预先构建索引，启动预热时调用，避免首次搜索时构建
+
+        参数:
+            item_types (list): 物品类型，为None时构建全部类型
+        """
+        for item_type in item_types or self.category_map:
+            self._get_index(item_type)
+
+    def _get_index(self, item_type):
+        """
+        获取与存储一致的类别索引，过期时重建
+        """
+        category = self.category_map[item_type]
+        signature = category.storage.signature()
+        with self._lock:
+            index = self._indexes.get(item_type)
+            if index is not None and index.signature == signature:
+                count_cache('search_index', True)
+                return index
+
+        count_cache('search_index', False)
+        items = category.load_data()
+        signature = category.storage.loaded_signature(signature)
+        index = _CategoryIndex()
+        with span('search.build'):
+            for item in items:
+                index.add(id_key(item['id']), item)
+        index.signature = signature
+        index.nbytes = index.estimate_nbytes()
+        with self._lock:
+            self._indexes[item_type] = index
+        return index
+
+    def memory_usage(self):
+        """
+        获取已构建索引的估算内存占用
+
+        返回:
+            int: 字节数
+        """
+        with self._lock:
+            return sum(index.nbytes for index in self._indexes.values())
+
+    def clear(self):
+        """
+        丢弃全部索引，下次查询时重建
+        """
+        with self._lock:
+            self._indexes.clear()
+
+    def search(self, query, item_types=None, offset=0, limit=20):
+        """
+        搜索物品，按相关度排序分页返回
+
+        相关度先按命中的查询词元数排序，再按 idf × 字段权重之和排序
+
+        参数:
+            query (str): 查询文本
+            item_types (list): 搜索的物品类型，为None时搜索全部类型
+            offset (int): 起始位置
+            limit (int): 返回数量
+
+        返回:
+            dict:
+                hits (list): (物品类型, 物品ID, 得分) 列表
+                total (int): 匹配的物品总数
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return {'hits': [], 'total': 0}
+        required = max(1, math.ceil(len(tokens) * MIN_COVERAGE))
+
+        hits = []
+        total = 0
+        for item_type in item_types or self.category_map:
+            index = self._get_index(item_type)
+            # 在索引锁之外获取，加载数据可能需要写锁，而写入回调持有写锁时会获取索引锁
+            positions = self.category_map[item_type].default_positions()
+            with self._lock, span('search.match'):
+                slots, counts, scores = index.match(tokens, required)
+                top = _top(slots, counts, scores, offset + limit, lambda candidates: np.array(
+                    [positions.get(index.keys[slot], len(positions)) for slot in candidates.tolist()],
+                    dtype=np.int64))
+                keys = [index.keys[slot] for slot in slots[top].tolist()]
+            total += len(slots)
+            hits.extend(zip(counts[top].tolist(), scores[top].tolist(), [item_type] * len(keys), keys))
+
+        # 各类别的前 offset+limit 个结果合并后再排序分页
+        hits.sort(key=lambda hit: (hit[0], hit[1]), reverse=True)
+        return {
+            'hits': [(item_type, int(key), round(score, 4))
+                     for _, score, item_type, key in hits[offset:offset + limit]],
+            'total': total
+        }
+
+
+def _top(slots, counts, scores, k, order_key):
+    """
+    按 (命中词元数, 得分) 取前k个的位置，相关度相同时按物品在类别默认排序中的位置排列
+
+    槽位是物品加入索引的顺序，增量更新后与重新构建的索引不同，各 worker 之间也可能不同，
+    不能用于排序；默认排序只取决于数据，保证分页稳定
+
+    参数:
+        slots (ndarray): 匹配的槽位
+        counts (ndarray): 命中的查询词元数
+        scores (ndarray): 得分
+        k (int): 数量
+        order_key (callable): 参数为槽位数组，返回对应物品在默认排序中的位置
+    """
+    if len(slots) == 0 or k <= 0:
+        return np.array([], dtype=np.int64)
+    # 得分归一化到[0, 1)，命中词元数优先
+    rank = counts + scores / (scores.max() + 1)
+    if len(rank) > k:
+        threshold = np.partition(rank, len(rank) - k)[len(rank) - k]
+        candidates = np.flatnonzero(rank >= threshold)
+    else:
+        candidates = np.arange(len(rank))
+    order = np.lexsort((order_key(slots[candidates]), -rank[candidates]))
+    return candidates[order][:k]
+
+
+def _weigh(doc):
+    """
+    计算物品各词元的权重，同一词元出现在多个字段时权重相加
+    """
+    weights = {}
+    for field, text in doc.items():
+        for token in tokenize(text):
+            weights[token] = weights.get(token, 0.0) + FIELD_WEIGHTS[field]
+    return weights
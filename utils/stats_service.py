@@ -0,0 +1,286 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/stats_service.py
+Description: 价格统计，全量时向量化计算，写入时增量调整受影响物品的贡献
+'''
+
+import pandas as pd
+
+from .fields import number, numeric_column, rounded
+from .storage import id_key
+
+# 每个统计分组包含的字段，与 category_stats 的结构一致
+STAT_FIELDS = (
+    'purchase_price',
+    'purchase_price_existing',
+    'purchase_price_sold',
+    'sold_price',
+    'count',
+    'existing_count',
+    'sold_count'
+)
+
+# 影响统计结果的物品字段
+SOURCE_FIELDS = ('category', 'purchase_price', 'shipping_fee', 'sold_price')
+
+# 每条逐物品记录的估算内存（字典项、ID键、元组及其中的数值）
+ITEM_NBYTES = 240
+
+
+class PriceStats:
+    """
+    单个物品类别的价格统计
+
+    为每个物品记录影响统计的字段（子类别、购买价格、运费、卖出价格），
+    创建或更新物品时先减去旧贡献再加上新贡献，单次写入的代价为O(1)。
+    """
+
+    def __init__(self):
+        """
+        初始化空的统计
+
+        属性:
+            total (dict): 整体统计，字段见 STAT_FIELDS
+            categories (dict): 子类别 -> 统计
+            _items (dict): 物品ID -> (子类别, 购买价格, 运费, 卖出价格)
+        """
+        self.total = _empty_stats()
+        self.categories = {}
+        self._items = {}
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        从物品数据构建统计，汇总部分使用向量化计算
+
+        参数:
+            df (DataFrame): 物品数据
+
+        返回:
+            PriceStats: 统计对象
+        """
+        stats = cls()
+        if df.empty:
+            return stats
+
+        categories = sorted(set(category for category in df.get('category', []) if _valid_category(category)))
+        total_stats, category_stats = aggregate_price_stats(df, categories)
+        stats.total = normalize_total_stats(total_stats)
+        stats.categories = {category: values for category, values in category_stats.items() if values['count']}
+
+        category_column = df['category'] if 'category' in df.columns else pd.Series(None, index=df.index)
+        stats._items = {
+            id_key(item_id): (category if _valid_category(category) else None,
+                              purchase_price, shipping_fee, sold_price)
+            for item_id, category, purchase_price, shipping_fee, sold_price in zip(
+                df['id'],
+                category_column,
+                numeric_column(df, 'purchase_price'),
+                numeric_column(df, 'shipping_fee'),
+                numeric_column(df, 'sold_price')
+            )
+        }
+        return stats
+
+    def memory_usage(self):
+        """
+        获取逐物品记录的估算内存占用，整体及子类别统计很小，不计入
+
+        返回:
+            int: 字节数
+        """
+        return len(self._items) * ITEM_NBYTES
+
+    def add(self, item_id, fields):
+        """
+        加入一个新物品
+
+        参数:
+            item_id: 物品ID
+            fields (dict): 物品字段，缺失的字段按空值处理
+        """
+        source = _source(fields)
+        self._items[id_key(item_id)] = source
+        self._apply(source, 1)
+
+    def update(self, item_id, changes):
+        """
+        更新一个物品，只需传入变化的字段
+
+        参数:
+            item_id: 物品ID
+            changes (dict): 变化的字段
+        """
+        key = id_key(item_id)
+        old = self._items.get(key)
+        if old is None:
+            self.add(item_id, changes)
+            return
+        if not any(field in changes for field in SOURCE_FIELDS):
+            return
+
+        fields = dict(zip(SOURCE_FIELDS, old))
+        fields.update({field: changes[field] for field in SOURCE_FIELDS if field in changes})
+        new = _source(fields)
+        self._apply(old, -1)
+        self._items[key] = new
+        self._apply(new, 1)
+
+    def _apply(self, source, sign):
+        """
+        将一个物品的贡献加到(sign=1)或减出(sign=-1)整体及子类别统计
+        """
+        category, purchase_price, shipping_fee, sold_price = source
+        purchase_total = purchase_price + shipping_fee
+        targets = [self.total]
+        if category:
+            if category not in self.categories:
+                self.categories[category] = _empty_stats()
+            targets.append(self.categories[category])
+
+        sold = sold_price != 0
+        for stats in targets:
+            stats['purchase_price'] += sign * purchase_total
+            stats['count'] += sign
+            if sold:
+                stats['purchase_price_sold'] += sign * purchase_total
+                stats['sold_price'] += sign * sold_price
+                stats['sold_count'] += sign
+            else:
+                stats['purchase_price_existing'] += sign * purchase_total
+                stats['existing_count'] += sign
+
+        # 子类别下已没有物品时移除，与 get_categories 保持一致
+        if category and self.categories[category]['count'] == 0:
+            del self.categories[category]
+
+    def snapshot(self):
+        """
+        导出统计结果
+
+        返回:
+            tuple: (total_stats, category_stats)，结构与 ItemCategory.calculate_price_stats 一致
+        """
+        total = rounded(self.total)
+        total_stats = {
+            "total_purchase_price": total['purchase_price'],
+            "total_purchase_price_existing": total['purchase_price_existing'],
+            "total_purchase_price_sold": total['purchase_price_sold'],
+            "total_sold_price": total['sold_price'],
+            "total_count": total['count'],
+            "existing_count": total['existing_count'],
+            "sold_count": total['sold_count']
+        }
+        category_stats = {category: rounded(self.categories[category]) for category in sorted(self.categories)}
+        return total_stats, category_stats
+
+
+def normalize_total_stats(total_stats):
+    """
+    将整体统计转换为与子类别统计相同的字段结构
+
+    参数:
+        total_stats (dict): calculate_price_stats 返回的整体统计
+
+    返回:
+        dict: 字段见 STAT_FIELDS
+    """
+    return {
+        'purchase_price': total_stats['total_purchase_price'],
+        'purchase_price_existing': total_stats['total_purchase_price_existing'],
+        'purchase_price_sold': total_stats['total_purchase_price_sold'],
+        'sold_price': total_stats['total_sold_price'],
+        'count': total_stats['total_count'],
+        'existing_count': total_stats['existing_count'],
+        'sold_count': total_stats['sold_count']
+    }
+
+
+def aggregate_price_stats(df, categories):
+    """
+    向量化计算价格统计信息
+
+    一次遍历完成：先按是否已售生成掩码，再对整体求和、按子类别 groupby 求和
+
+    参数:
+        df (DataFrame): 物品数据
+        categories (list): 需要统计的子类别列表
+
+    返回:
+        tuple: (total_stats, category_stats)，结构与 ItemCategory.calculate_price_stats 一致
+    """
+    # 买入价格（购买价格+运费）与卖出价格
+    item_total_price = numeric_column(df, 'purchase_price') + numeric_column(df, 'shipping_fee')
+    sold_price = numeric_column(df, 'sold_price')
+    sold = sold_price != 0
+
+    frame = pd.DataFrame({
+        'purchase_price': item_total_price,
+        'purchase_price_existing': item_total_price.where(~sold, 0.0),
+        'purchase_price_sold': item_total_price.where(sold, 0.0),
+        'sold_price': sold_price.where(sold, 0.0),
+        'count': 1,
+        'existing_count': (~sold).astype(int),
+        'sold_count': sold.astype(int)
+    }, index=df.index)
+    totals = frame.sum()
+
+    total_stats = {
+        "total_purchase_price": float(totals['purchase_price']),                     # 所有物品的购买总价
+        "total_purchase_price_existing": float(totals['purchase_price_existing']),   # 持有物品的购买总价
+        "total_purchase_price_sold": float(totals['purchase_price_sold']),           # 已售物品的购买总价
+        "total_sold_price": float(totals['sold_price']),                             # 所有物品的卖出总价
+        "total_count": len(df),                                                      # 物品总数
+        "existing_count": int(totals['existing_count']),                             # 持有物品数
+        "sold_count": int(totals['sold_count'])                                      # 已售物品数
+    }
+
+    # 按子类别计算价格统计，没有物品的类别保持为0
+    category_stats = {}
+    if categories:
+        grouped = frame.groupby(df['category']).sum().reindex(categories, fill_value=0)
+        for category, row in grouped.iterrows():
+            category_stats[category] = {
+                'purchase_price': float(row['purchase_price']),
+                'purchase_price_existing': float(row['purchase_price_existing']),
+                'purchase_price_sold': float(row['purchase_price_sold']),
+                'sold_price': float(row['sold_price']),
+                'count': int(row['count']),
+                'existing_count': int(row['existing_count']),
+                'sold_count': int(row['sold_count'])
+            }
+
+    return total_stats, category_stats
+
+
+def _empty_stats():
+    """
+    生成全为0的统计字典
+    """
+    return {field: 0 for field in STAT_FIELDS}
+
+
+def _valid_category(category):
+    """
+    判断子类别是否有效（非空字符串）
+    """
+    return isinstance(category, str) and bool(category)
+
+
+def _source(fields):
+    """
+    提取并规范化影响统计的字段
+
+    返回:
+        tuple: (子类别, 购买价格, 运费, 卖出价格)
+    """
+    category = fields.get('category')
+    return (
+        category if _valid_category(category) else None,
+        number(fields.get('purchase_price')),
+        number(fields.get('shipping_fee')),
+        number(fields.get('sold_price'))
+    )
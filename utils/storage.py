@@ -0,0 +1,433 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/storage.py
+Description: 物品数据存储引擎，列式快照 + 追加写入的变更日志
+'''
+
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from .columnar import DATE_FIELDS, read_snapshot, to_dates, write_snapshot
+from .metrics import span
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，仅使用进程内锁
+    fcntl = None
+
+# 需要按数值解析的字段，与 read_csv 的类型推断保持一致
+NUMERIC_FIELDS = ('id', 'purchase_price', 'shipping_fee', 'sold_price', 'version')
+
+
+class CategoryStorage:
+    """
+    单个物品类别的存储引擎
+
+    数据由两部分组成：
+        - 列式快照（data/<type>.cols），固定列类型的二进制文件，读取时内存映射，见 columnar
+        - 变更日志（data/<type>.journal），每次写入追加一行JSON
+
+    CSV（data/<type>.csv）只作为导入格式：快照不存在或CSV在快照生成后被修改（手动编辑、
+    导出覆盖）时，从CSV重新生成快照，之后不再写回CSV，需要CSV时使用 bulk_io 导出。
+
+    写入只追加日志，耗时与数据量无关；日志超过阈值后合并到新快照，
+    合并使用临时文件+重命名保证原子性。写入期间持有进程内锁和文件锁，
+    多个 gunicorn worker 并发写入也不会丢失更新。
+    """
+
+    def __init__(self, csv_path, compact_bytes=256 * 1024):
+        """
+        初始化存储引擎
+
+        参数:
+            csv_path (str): 导入用的CSV路径，快照和变更日志保存在同一目录
+            compact_bytes (int): 变更日志超过该大小后自动合并
+        """
+        self.csv_path = csv_path
+        base_path = os.path.splitext(csv_path)[0]
+        self.snapshot_path = base_path + '.cols'
+        self.journal_path = base_path + '.journal'
+        self.lock_path = base_path + '.lock'
+        self.rollup_path = base_path + '.rollup.json'
+        self.compact_bytes = compact_bytes
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+
+    @contextmanager
+    def write_lock(self):
+        """
+        获取该类别的写锁（进程内锁 + 文件锁），同一线程可重入
+        """
+        with self._lock:
+            self._lock_depth += 1
+            try:
+                # 文件锁按打开的文件计，重入时不能再次加锁
+                if fcntl is None or self._lock_depth > 1:
+                    yield
+                    return
+                os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+                with open(self.lock_path, 'a') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+            finally:
+                self._lock_depth -= 1
+
+    def signature(self):
+        """
+        获取存储签名，快照、变更日志或CSV变化时签名随之变化
+
+        返回:
+            tuple: ((快照修改时间, 快照大小), (日志修改时间, 日志大小), (CSV修改时间, CSV大小))
+        """
+        return (
+            _stat_signature(self.snapshot_path),
+            _stat_signature(self.journal_path),
+            _stat_signature(self.csv_path)
+        )
+
+    def loaded_signature(self, signature):
+        """
+        获取加载完成后数据对应的签名
+
+        首次加载或CSV被重新导入后，加载时会从CSV生成快照，签名中的快照部分随之变化，但数据内容不变；
+        变更日志和CSV都与加载前一致时返回当前签名，否则返回加载前的签名，之后按过期处理
+
+        参数:
+            signature (tuple): 加载前的存储签名
+
+        返回:
+            tuple: 存储签名
+        """
+        current = self.signature()
+        return current if current[1:] == signature[1:] else signature
+
+    def load_frame(self):
+        """
+        读取列式快照并重放变更日志
+
+        返回:
+            DataFrame: 按文件原始顺序排列的完整数据
+        """
+        df = self._load_snapshot()
+        with span('storage.replay'):
+            return self._replay(df, self._read_journal())
+
+    def _load_snapshot(self):
+        """
+        读取列式快照，快照不存在或CSV在快照生成后被修改时先从CSV重新生成
+
+        返回:
+            DataFrame: 快照数据
+        """
+        snapshot = self._read_current_snapshot()
+        if snapshot is not None:
+            return snapshot
+        with self.write_lock():
+            # 等待锁期间可能已被其他进程生成
+            snapshot = self._read_current_snapshot()
+            if snapshot is not None:
+                return snapshot
+            csv_signature = _stat_signature(self.csv_path)
+            if csv_signature is None:
+                return pd.DataFrame()
+            try:
+                with span('storage.read_csv'):
+                    df = pd.read_csv(self.csv_path)
+            except pd.errors.EmptyDataError as e:
+                print(f"加载数据文件失败: {e}")
+                df = pd.DataFrame()
+            with span('storage.write_snapshot'):
+                write_snapshot(self.snapshot_path, df, source=csv_signature)
+            # 重新读取，保证列类型与之后的冷启动一致
+            return read_snapshot(self.snapshot_path)[0]
+
+    def _read_current_snapshot(self):
+        """
+        读取快照，快照不存在或已落后于CSV时返回None
+        """
+        csv_signature = _stat_signature(self.csv_path)
+        try:
+            with span('storage.read_snapshot'):
+                df, source = read_snapshot(self.snapshot_path)
+        except FileNotFoundError:
+            return pd.DataFrame() if csv_signature is None else None
+        except ValueError as e:
+            print(f"快照文件无效，将从CSV重新生成: {e}")
+            return None
+        if csv_signature is None or source == csv_signature:
+            return df
+        return None
+
+    def append(self, op, item_id, fields):
+        """
+        追加一条变更记录，调用方需持有 write_lock
+
+        参数:
+            op (str): 操作类型，'create' 或 'update'
+            item_id (int): 物品ID
+            fields (dict): 变更的字段
+        """
+        self.append_many([(op, item_id, fields)])
+
+    def append_many(self, changes, compact=True):
+        """
+        一次写入追加多条变更记录，调用方需持有 write_lock
+
+        参数:
+            changes (list): (操作类型, 物品ID, 变更的字段) 列表
+            compact (bool): 日志超过阈值时是否自动合并，批量导入时关闭，全部导入后再合并一次
+        """
+        lines = ''.join(
+            json.dumps({'op': op, 'id': item_id, 'fields': fields}, ensure_ascii=False, default=str) + '\n'
+            for op, item_id, fields in changes
+        )
+        os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+        with span('storage.append'), open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if compact and os.path.getsize(self.journal_path) >= self.compact_bytes:
+            self.compact()
+
+    def compact(self):
+        """
+        将变更日志合并到新的列式快照，调用方需持有 write_lock
+
+        新快照沿用当前CSV的签名作为来源，CSV本身不会被改写
+        """
+        if not os.path.exists(self.journal_path):
+            return
+        with span('storage.compact'):
+            df = self.load_frame()
+            write_snapshot(self.snapshot_path, df, source=_stat_signature(self.csv_path))
+            os.remove(self.journal_path)
+
+    def journal_since(self, signature):
+        """
+        读取某个存储签名之后追加的变更记录，调用方需持有 write_lock
+
+        其他进程只追加了变更日志时，据此增量更新派生数据，不需要重新加载全部数据
+
+        参数:
+            signature (tuple): 之前的存储签名
+
+        返回:
+            list: 之后追加的变更记录；快照或CSV已变化（合并、重新导入）而无法只读取新增部分时返回None
+        """
+        current = self.signature()
+        if signature[0] != current[0] or signature[2] != current[2]:
+            return None
+        offset = signature[1][1] if signature[1] else 0
+        size = current[1][1] if current[1] else 0
+        if size == offset and signature[1] == current[1]:
+            return []
+        if size <= offset:
+            return None
+        return self._read_journal(offset)
+
+    def data_version(self, signature=None):
+        """
+        获取数据版本，供客户端增量同步
+
+        由快照和CSV签名的摘要加变更日志的字节数组成：日志只追加，两个版本之间的变更就是日志中
+        两个位置之间的记录；日志合并或CSV重新导入后摘要变化，之前的版本随之失效
+
+        参数:
+            signature (tuple): 存储签名，默认为当前签名
+
+        返回:
+            str: 数据版本，如 '3f2a9c01b7d4.5120'
+        """
+        signature = signature or self.signature()
+        return f'{_version_base(signature)}.{signature[1][1] if signature[1] else 0}'
+
+    def changed_since(self, version, signature=None):
+        """
+        获取某个数据版本之后新增或修改的物品
+
+        参数:
+            version (str): 客户端持有的数据版本，见 data_version
+            signature (tuple): 与返回结果对应的存储签名，默认为当前签名
+
+        返回:
+            set: 物品的ID键；版本无效或已失效（日志已合并、CSV重新导入）时返回None
+        """
+        signature = signature or self.signature()
+        base, _, offset = (version or '').partition('.')
+        if base != _version_base(signature) or not offset.isdigit():
+            return None
+        offset = int(offset)
+        size = signature[1][1] if signature[1] else 0
+        if offset > size:
+            return None
+        if offset == size:
+            return set()
+        keys = {id_key(entry['id']) for entry in self._read_journal(offset)}
+        # 读取期间日志被合并时，之前的记录可能已不在日志中
+        if self.signature()[0] != signature[0]:
+            return None
+        return keys
+
+    def _read_journal(self, offset=0):
+        """
+        读取变更日志
+
+        参数:
+            offset (int): 起始字节位置，需位于行首
+
+        返回:
+            list: 变更记录列表，忽略写入中断导致的不完整行；格式无效的记录（如字段值为列表或对象）
+                跳过，不影响重放其他记录
+        """
+        entries = []
+        try:
+            # 按字节定位，逐行解析 UTF-8
+            with open(self.journal_path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        continue
+                    if _is_valid_entry(entry):
+                        entries.append(entry)
+                    else:
+                        print(f"跳过无效的变更记录: {line!r}")
+        except FileNotFoundError:
+            pass
+        return entries
+
+    @staticmethod
+    def _replay(df, entries):
+        """
+        将变更记录应用到DataFrame
+
+        新建记录如果ID已存在则按更新处理，因此合并过程中断后重放也不会产生重复行
+
+        参数:
+            df (DataFrame): CSV快照数据
+            entries (list): 变更记录列表
+
+        返回:
+            DataFrame: 应用变更后的数据
+        """
+        if not entries:
+            return df
+
+        row_index = {}
+        if 'id' in df.columns:
+            row_index = {id_key(value): label for label, value in df['id'].items()}
+
+        updates = {}
+        created = {}
+        for entry in entries:
+            key = id_key(entry['id'])
+            fields = {field: _coerce(field, value) for field, value in entry['fields'].items()}
+            if entry['op'] == 'create' and key not in row_index:
+                created.setdefault(key, {'id': int(entry['id'])}).update(fields)
+            elif key in created:
+                created[key].update(fields)
+            elif key in row_index:
+                updates.setdefault(key, {}).update(fields)
+
+        if updates:
+            df = df.copy()
+            for key, fields in updates.items():
+                for field, value in fields.items():
+                    if field not in df.columns:
+                        df[field] = None
+                    # 预先放宽列类型，避免 pandas 隐式向上转换
+                    column = df[field]
+                    if isinstance(column.dtype, pd.CategoricalDtype):
+                        if value is not None and value not in column.cat.categories:
+                            df[field] = column.cat.add_categories([value])
+                    elif isinstance(value, str):
+                        if column.dtype != object:
+                            df[field] = column.astype(object)
+                    elif column.dtype.kind in 'iub':
+                        df[field] = column.astype(float)
+                    df.loc[row_index[key], field] = value
+
+        if created:
+            new_df = pd.DataFrame(list(created.values()))
+            df = new_df if df.empty else pd.concat([df, new_df], ignore_index=True)
+        return df
+
+
+def _stat_signature(path):
+    """
+    获取文件的(修改时间纳秒, 大小)，文件不存在时返回None
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _is_valid_entry(entry):
+    """
+    变更记录是否可以重放：操作类型、整数ID，字段值均为标量
+    """
+    if not isinstance(entry, dict) or entry.get('op') not in ('create', 'update'):
+        return False
+    fields = entry.get('fields')
+    if not isinstance(fields, dict):
+        return False
+    try:
+        int(entry.get('id'))
+    except (TypeError, ValueError):
+        return False
+    return all(value is None or isinstance(value, (str, int, float, bool)) for value in fields.values())
+
+
+def _version_base(signature):
+    """
+    快照和CSV签名的摘要，作为数据版本的前缀
+    """
+    return hashlib.sha1(repr((signature[0], signature[2])).encode()).hexdigest()[:12]
+
+
+def id_key(item_id):
+    """
+    将物品ID统一为字符串键
+
+    参数:
+        item_id: 物品ID，可以是int、float或str
+
+    返回:
+        str: 规范化后的ID字符串，如 1、1.0、'1' 均返回 '1'
+    """
+    try:
+        return str(int(float(item_id)))
+    except (TypeError, ValueError):
+        return str(item_id)
+
+
+def _coerce(field, value):
+    """
+    按快照的列类型转换日志中的字段值：空字符串视为缺失，数值字段转为数字，日期字段转为Timestamp
+    """
+    if value is None or value == '':
+        return None
+    if field in DATE_FIELDS:
+        date = to_dates(value)
+        return None if pd.isna(date) else date
+    if field in NUMERIC_FIELDS and isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
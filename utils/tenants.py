@@ -0,0 +1,415 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/tenants.py
+Description: 多收藏托管，每个收藏使用独立的数据目录和类别定义，已加载的收藏按LRU和内存预算移出内存
+'''
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+from . import metrics
+
+# 默认收藏，数据目录为 data/，即原来单一家庭的数据
+DEFAULT_TENANT = 'default'
+# 收藏配置文件名，位于收藏的数据目录下
+CONFIG_NAME = 'collection.json'
+
+# 内置类别，各自使用 templates/<类型>/ 下的模板；自定义类别使用 templates/collection/ 下的通用模板
+BUILTIN_CATEGORIES = {
+    'figures': {'label': '手办', 'main_category': '手办', 'icon': 'fa-trophy', 'color': 'success'},
+    'clothing': {'label': '衣服', 'main_category': '衣服', 'icon': 'fa-tshirt', 'color': 'info'},
+    'goods': {'label': '好物', 'main_category': '好物', 'icon': 'fa-gift', 'color': 'warning'}
+}
+# 自定义类别未指定图标或配色时使用
+DEFAULT_ICON = 'fa-box'
+DEFAULT_COLOR = 'secondary'
+COLORS = ('primary', 'secondary', 'success', 'danger', 'warning', 'info', 'dark')
+
+# 类别类型是页面URL的第一段，不能与其他路由重名
+RESERVED_TYPES = frozenset((
+    'api', 'collection', 'create_item', 'dashboard', 'healthz', 'image_status', 'images',
+    'metrics', 'new', 'readyz', 'search', 'static', 'update_properties'
+))
+
+_TENANT_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+_TYPE_PATTERN = re.compile(r'^[a-z][a-z0-9_]{0,31}$')
+_ICON_PATTERN = re.compile(r'^fa-[a-z0-9-]+$')
+
+
+def is_valid_tenant(tenant_id):
+    """
+    收藏ID是否有效：小写字母、数字、'-'、'_'，不超过64个字符
+    """
+    return isinstance(tenant_id, str) and bool(_TENANT_PATTERN.match(tenant_id))
+
+
+def load_collection(data_dir):
+    """
+    读取收藏配置
+
+    配置文件格式：
+        {"name": "收藏名称", "categories": [{"type": "books", "label": "书籍", "icon": "fa-book"}, ...]}
+    categories 中的项也可以只写类别类型；内置类别的名称、主类别、图标和配色可以省略或覆盖，
+    自定义类别的名称默认为类别类型，主类别默认为名称
+
+    参数:
+        data_dir (str): 收藏的数据目录
+
+    返回:
+        tuple: (收藏名称, {类别类型: 类别定义})，类别定义包含 type、label、main_category、icon、color，
+               按配置中的顺序排列；没有配置文件或未配置类别时为内置类别
+
+    异常:
+        ValueError: 配置文件格式错误或类别类型无效时抛出
+    """
+    path = os.path.join(data_dir, CONFIG_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+    except json.JSONDecodeError as e:
+        raise ValueError(f'收藏配置无效: {path}: {e}') from None
+    if not isinstance(config, dict):
+        raise ValueError(f'收藏配置无效: {path}')
+
+    return str(config.get('name') or '家庭物品管理'), parse_categories(config.get('categories'))
+
+
+def parse_categories(entries):
+    """
+    解析类别定义，格式见 load_collection
+
+    参数:
+        entries (list): 配置中的 categories，为空时使用内置类别
+
+    返回:
+        dict: 类别类型 -> 类别定义
+
+    异常:
+        ValueError: 类别类型无效或重复时抛出
+    """
+    categories = {}
+    for entry in entries or list(BUILTIN_CATEGORIES):
+        if isinstance(entry, str):
+            entry = {'type': entry}
+        item_type = entry.get('type') if isinstance(entry, dict) else None
+        if not isinstance(item_type, str) or not _TYPE_PATTERN.match(item_type) or item_type in RESERVED_TYPES:
+            raise ValueError(f'无效的类别类型: {item_type}')
+        if item_type in categories:
+            raise ValueError(f'类别类型重复: {item_type}')
+        definition = dict(BUILTIN_CATEGORIES.get(item_type, {}))
+        definition.update({key: str(entry[key]) for key in ('label', 'main_category') if entry.get(key)})
+        if _ICON_PATTERN.match(str(entry.get('icon', ''))):
+            definition['icon'] = entry['icon']
+        if entry.get('color') in COLORS:
+            definition['color'] = entry['color']
+        definition.setdefault('label', item_type)
+        definition.setdefault('main_category', definition['label'])
+        definition.setdefault('icon', DEFAULT_ICON)
+        definition.setdefault('color', DEFAULT_COLOR)
+        definition['type'] = item_type
+        categories[item_type] = definition
+    return categories
+
+
+def create_collection(root, tenant_id, categories=None, name=None):
+    """
+    创建收藏：数据目录及配置文件
+
+    参数:
+        root (str): 收藏根目录
+        tenant_id (str): 收藏ID
+        categories (list): 类别定义列表，格式同配置文件，为None时使用内置类别
+        name (str): 收藏名称，可选
+
+    返回:
+        str: 收藏的数据目录
+
+    异常:
+        ValueError: 收藏ID或类别无效，或收藏已存在时抛出
+    """
+    if not is_valid_tenant(tenant_id) or tenant_id == DEFAULT_TENANT:
+        raise ValueError(f'无效的收藏ID: {tenant_id}')
+    parse_categories(categories)
+    data_dir = os.path.join(root, tenant_id)
+    config = {'name': name or tenant_id, 'categories': categories or list(BUILTIN_CATEGORIES)}
+    os.makedirs(data_dir, exist_ok=True)
+    try:
+        with open(os.path.join(data_dir, CONFIG_NAME), 'x', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+    except FileExistsError:
+        raise ValueError(f'收藏已存在: {tenant_id}') from None
+    return data_dir
+
+
+class Tenant:
+    """
+    单个收藏：数据目录、类别定义，以及各类别的管理器和跨类别的搜索索引
+
+    属性:
+        id (str): 收藏ID
+        data_dir (str): 数据目录，类别数据为 <data_dir>/<类型>.csv 等，见 CategoryStorage
+        name (str): 收藏名称
+        definitions (dict): 类别类型 -> 类别定义，见 load_collection
+        categories (dict): 类别类型 -> ItemCategory
+        search_index (SearchIndex): 搜索索引
+    """
+
+    def __init__(self, tenant_id, data_dir, app=None, image_jobs=None):
+        """
+        读取收藏配置并创建类别管理器，不加载数据
+
+        参数:
+            tenant_id (str): 收藏ID
+            data_dir (str): 数据目录
+            app (Flask): Flask应用实例，传给类别管理器
+            image_jobs (ImageJobQueue): 后台图片转换队列，传给类别管理器
+
+        异常:
+            ValueError: 收藏配置无效时抛出
+        """
+        from .item_manager import ItemCategory
+        from .search_index import SearchIndex
+
+        self.id = tenant_id
+        self.data_dir = data_dir
+        self.name, self.definitions = load_collection(data_dir)
+        self.categories = {
+            item_type: ItemCategory(item_type, app, image_jobs, data_dir=data_dir,
+                                    main_category=definition['main_category'])
+            for item_type, definition in self.definitions.items()
+        }
+        # 跨类别的全文搜索索引，随物品创建、更新增量维护
+        self.search_index = SearchIndex(self.categories)
+
+    def labels(self):
+        """
+        获取类别名称
+
+        返回:
+            dict: 类别类型 -> 名称
+        """
+        return {item_type: definition['label'] for item_type, definition in self.definitions.items()}
+
+    def memory_usage(self):
+        """
+        获取已加载数据和搜索索引的估算内存占用
+
+        返回:
+            int: 字节数
+        """
+        return (sum(category.memory_usage() for category in self.categories.values())
+                + self.search_index.memory_usage())
+
+    def release(self):
+        """
+        释放全部内存中的数据，之后的请求按需重新加载
+        """
+        for category in self.categories.values():
+            category.release()
+        self.search_index.clear()
+
+
+class TenantRegistry:
+    """
+    收藏注册表
+
+    默认收藏使用 data/ 目录，常驻内存；其他收藏位于 <root>/<收藏ID>/，目录下有 collection.json
+    即视为存在，首次访问时加载，按最近使用顺序保存在LRU中。每个请求结束后调用 trim，
+    已加载的收藏数超过上限或估算内存超过预算时，从最久未使用的开始移出并释放数据
+    （最近使用的一个总是保留），因此内存与托管的收藏数无关。
+
+    移出的收藏仍在处理中的请求可以继续使用，之后的请求重新创建；同一收藏的两个实例
+    之间与多个 worker 进程相同，通过文件锁和存储签名保持一致。
+    """
+
+    def __init__(self, root, app=None, image_jobs=None, memory_budget=256 * 1024 * 1024,
+                 max_tenants=32, default_dir='data'):
+        """
+        参数:
+            root (str): 收藏根目录
+            app (Flask): Flask应用实例，传给类别管理器
+            image_jobs (ImageJobQueue): 后台图片转换队列，传给类别管理器
+            memory_budget (int): 默认收藏以外的已加载收藏的估算内存上限（字节）
+            max_tenants (int): 默认收藏以外同时加载的收藏数上限
+            default_dir (str): 默认收藏的数据目录
+        """
+        self.root = root
+        self.app = app
+        self.image_jobs = image_jobs
+        self.memory_budget = memory_budget
+        self.max_tenants = max(1, max_tenants)
+        self.default = Tenant(DEFAULT_TENANT, default_dir, app, image_jobs)
+        self._tenants = OrderedDict()
+        self._lock = threading.Lock()
+
+    def tenant_dir(self, tenant_id):
+        """
+        获取收藏的数据目录
+        """
+        if tenant_id == DEFAULT_TENANT:
+            return self.default.data_dir
+        return os.path.join(self.root, tenant_id)
+
+    def get(self, tenant_id=None):
+        """
+        获取收藏，未加载时读取配置并加入LRU
+
+        参数:
+            tenant_id (str): 收藏ID，为空时返回默认收藏
+
+        返回:
+            Tenant: 收藏，ID无效或收藏不存在时返回None
+
+        异常:
+            ValueError: 收藏配置无效时抛出
+        """
+        if not tenant_id or tenant_id == DEFAULT_TENANT:
+            return self.default
+        if not is_valid_tenant(tenant_id):
+            return None
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+            if tenant is not None:
+                self._tenants.move_to_end(tenant_id)
+                metrics.count_cache('tenant', True)
+                return tenant
+            data_dir = self.tenant_dir(tenant_id)
+            if not os.path.isfile(os.path.join(data_dir, CONFIG_NAME)):
+                return None
+            metrics.count_cache('tenant', False)
+            tenant = Tenant(tenant_id, data_dir, self.app, self.image_jobs)
+            self._tenants[tenant_id] = tenant
+            return tenant
+
+    def trim(self):
+        """
+        按收藏数上限和内存预算移出最久未使用的收藏，最近使用的一个总是保留
+
+        返回:
+            list: 移出的收藏ID
+        """
+        with self._lock:
+            tenants = list(self._tenants.values())
+        usage = {tenant.id: tenant.memory_usage() for tenant in tenants}
+        total = sum(usage.values())
+
+        evicted = []
+        with self._lock:
+            for tenant_id in list(self._tenants)[:-1]:
+                if len(self._tenants) <= self.max_tenants and total <= self.memory_budget:
+                    break
+                evicted.append(self._tenants.pop(tenant_id))
+                total -= usage.get(tenant_id, 0)
+        for tenant in evicted:
+            tenant.release()
+            metrics.inc('tenant_evictions_total')
+        return [tenant.id for tenant in evicted]
+
+    def status(self):
+        """
+        获取已加载的收藏及估算内存占用
+
+        返回:
+            dict: {loaded: [{id, memory}, ...]（按最近使用顺序）, memory, memory_budget, max_tenants}
+        """
+        with self._lock:
+            tenants = list(self._tenants.values())
+        loaded = [{'id': tenant.id, 'memory': tenant.memory_usage()} for tenant in reversed(tenants)]
+        return {
+            'loaded': loaded,
+            'memory': sum(entry['memory'] for entry in loaded),
+            'memory_budget': self.memory_budget,
+            'max_tenants': self.max_tenants
+        }
+
+
+def list_collections(root):
+    """
+    列出收藏根目录下的全部收藏ID
+    """
+    try:
+        names = sorted(os.listdir(root))
+    except FileNotFoundError:
+        return []
+    return [name for name in names
+            if is_valid_tenant(name) and os.path.isfile(os.path.join(root, name, CONFIG_NAME))]
+
+
+def collection_item_types(root, default_dir='data'):
+    """
+    列出默认收藏和收藏根目录下全部收藏的类别类型，各收藏的图片都保存在 static/images/<类型>/ 下，
+    供图片目录监视和核对使用；配置无效的收藏跳过
+
+    参数:
+        root (str): 收藏根目录
+        default_dir (str): 默认收藏的数据目录
+
+    返回:
+        list: 类别类型，按首次出现的顺序排列，不重复
+    """
+    item_types = {}
+    for data_dir in [default_dir] + [os.path.join(root, tenant_id) for tenant_id in list_collections(root)]:
+        try:
+            _, categories = load_collection(data_dir)
+        except ValueError as e:
+            print(f"跳过收藏: {e}")
+            continue
+        item_types.update(dict.fromkeys(categories))
+    return list(item_types)
+
+
+def _parse_category(value):
+    """
+    解析命令行中的类别：类型[:名称[:图标]]，如 books:书籍:fa-book
+    """
+    item_type, _, rest = value.partition(':')
+    label, _, icon = rest.partition(':')
+    entry = {'type': item_type}
+    if label:
+        entry['label'] = label
+    if icon:
+        entry['icon'] = icon
+    return entry
+
+
+def main(argv=None):
+    """
+    命令行入口：创建或列出收藏，数据导入导出见 bulk_io 的 --collection 参数
+    """
+    parser = argparse.ArgumentParser(description='收藏管理')
+    parser.add_argument('--root', default=os.path.join('data', 'collections'), help='收藏根目录')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    create = subparsers.add_parser('create', help='创建收藏')
+    create.add_argument('tenant_id')
+    create.add_argument('--name', help='收藏名称')
+    create.add_argument('--category', action='append', type=_parse_category,
+                        help='类别，格式为 类型[:名称[:图标]]，可重复，默认为内置的手办、衣服、好物')
+    subparsers.add_parser('list', help='列出收藏')
+    args = parser.parse_args(argv)
+
+    if args.action == 'list':
+        for tenant_id in list_collections(args.root):
+            name, categories = load_collection(os.path.join(args.root, tenant_id))
+            print(f"{tenant_id}\t{name}\t{','.join(categories)}")
+        return 0
+    try:
+        data_dir = create_collection(args.root, args.tenant_id, args.category, args.name)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(data_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
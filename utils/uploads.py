@@ -0,0 +1,276 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/uploads.py
+Description: 分块、可续传的图片上传，边接收边写入和计算哈希，完成后存入内容寻址目录
+'''
+
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+
+from . import image_store
+from .metrics import span
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，仅使用进程内锁
+    fcntl = None
+
+_READ_SIZE = 64 * 1024
+
+# 会话ID为随机十六进制字符串，用于拼接文件路径前需要校验
+_ID_LENGTH = 32
+
+
+class UploadError(ValueError):
+    """
+    上传请求无效，status 为对应的HTTP状态码
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadStore:
+    """
+    上传会话存储
+
+    每个会话在上传目录中对应 <id>.part（已接收的数据）和 <id>.json（文件名、总大小等），
+    已接收的字节数就是 .part 的文件大小，因此任意 worker 都能续传，进程重启后也能续传。
+    本进程接收过的会话会保留哈希计算的中间状态，续传时不需要重新读取已接收的部分；
+    换到其他 worker 或重启后，在收到第一块时从 .part 重新计算一次。
+    """
+
+    def __init__(self, upload_dir, static_folder, max_size, expiry=24 * 3600):
+        """
+        参数:
+            upload_dir (str): 上传会话目录，需与静态文件目录在同一文件系统，完成时直接重命名
+            static_folder (str): 静态文件目录
+            max_size (int): 单个图片的最大字节数
+            expiry (int): 会话过期秒数，过期未完成的会话在创建新会话时清理
+        """
+        self.upload_dir = upload_dir
+        self.static_folder = static_folder
+        self.max_size = max_size
+        self.expiry = expiry
+        self._hashers = {}  # 会话ID -> (已计算的字节数, sha256 对象)
+        self._lock = threading.Lock()
+
+    def _paths(self, upload_id):
+        if len(upload_id) != _ID_LENGTH or not all(c in '0123456789abcdef' for c in upload_id):
+            raise UploadError('上传会话不存在', 404)
+        base = os.path.join(self.upload_dir, upload_id)
+        return base + '.part', base + '.json'
+
+    def _read_meta(self, upload_id):
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            meta['offset'] = os.path.getsize(part_path)
+        except FileNotFoundError:
+            raise UploadError('上传会话不存在或已过期', 404) from None
+        return meta
+
+    def create(self, filename, size):
+        """
+        创建上传会话，格式或大小不符合要求时在传输数据之前拒绝
+
+        参数:
+            filename (str): 原始文件名
+            size (int): 文件总字节数
+
+        返回:
+            dict: 会话状态，见 status
+
+        异常:
+            UploadError: 格式不支持(415)或文件过大(413)时抛出
+        """
+        try:
+            ext = image_store.upload_extension(filename)
+        except ValueError as e:
+            raise UploadError(str(e), 415) from None
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError('文件大小无效')
+        if size > self.max_size:
+            raise UploadError(f'图片不能超过 {self.max_size // (1024 * 1024)}MB', 413)
+
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self.cleanup()
+        upload_id = secrets.token_hex(_ID_LENGTH // 2)
+        part_path, meta_path = self._paths(upload_id)
+        open(part_path, 'xb').close()
+        meta = {'filename': filename, 'ext': ext, 'size': size, 'created': time.time()}
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        with self._lock:
+            self._hashers[upload_id] = (0, hashlib.sha256())
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        """
+        查询上传会话
+
+        返回:
+            dict: 包含 upload_id、size、offset（已接收字节数，续传从这里开始）
+
+        异常:
+            UploadError: 会话不存在时抛出(404)
+        """
+        meta = self._read_meta(upload_id)
+        return {'upload_id': upload_id, 'size': meta['size'], 'offset': meta['offset']}
+
+    def append(self, upload_id, offset, stream, length):
+        """
+        从请求体流式写入一块数据，最后一块写完后校验并存入内容寻址目录
+
+        参数:
+            upload_id (str): 会话ID
+            offset (int): 客户端认为的当前偏移量，与服务端不一致时拒绝，客户端应先查询偏移量
+            stream: 请求体流
+            length (int): 本块字节数
+
+        返回:
+            dict: 会话状态；上传完成时额外包含 image（哈希文件名）
+
+        异常:
+            UploadError: 会话不存在(404)、偏移量不一致或会话正被写入(409)、缺少长度(411)、
+                超出声明的大小(413)、文件内容不是图片(415)时抛出
+        """
+        meta = self._read_meta(upload_id)
+        part_path, _ = self._paths(upload_id)
+        if offset != meta['offset']:
+            raise UploadError('偏移量不一致', 409)
+        if length is None:
+            raise UploadError('分块需要 Content-Length', 411)
+        if offset + length > meta['size']:
+            raise UploadError('数据超出文件大小', 413)
+
+        with open(part_path, 'ab') as f:
+            # 同一会话同时只允许一个请求写入，重试的请求直接拒绝，客户端查询偏移量后再续传
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    raise UploadError('该上传正在写入', 409) from None
+            if f.tell() != offset:
+                raise UploadError('偏移量不一致', 409)
+            hasher = self._take_hasher(upload_id, part_path, offset)
+            try:
+                with span('upload.chunk'):
+                    received = self._copy(stream, f, hasher, length)
+                    f.flush()
+            except Exception:
+                # 写入中断时哈希状态可能与文件不一致，下次从文件重新计算
+                hasher = None
+                raise
+            finally:
+                if hasher is not None:
+                    with self._lock:
+                        self._hashers[upload_id] = (offset + received, hasher)
+
+            offset += received
+            # 收到文件头后立即检查，不是图片时不再接收后续数据
+            if not meta.get('checked') and offset >= min(image_store.SIGNATURE_SIZE, meta['size']):
+                self._check_header(upload_id, meta, part_path)
+            if offset < meta['size']:
+                return {'upload_id': upload_id, 'size': meta['size'], 'offset': offset}
+            return self._complete(upload_id, meta, hasher, offset)
+
+    def _take_hasher(self, upload_id, part_path, offset):
+        """
+        取出会话的哈希状态，本进程没有或已过期时从 .part 重新计算
+        """
+        with self._lock:
+            state = self._hashers.pop(upload_id, None)
+        if state is not None and state[0] == offset:
+            return state[1]
+        hasher = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_READ_SIZE), b''):
+                hasher.update(chunk)
+        return hasher
+
+    @staticmethod
+    def _copy(stream, f, hasher, length):
+        """
+        边读边写，读取的字节数以 length 为上限
+
+        返回:
+            int: 实际写入的字节数
+        """
+        received = 0
+        while received < length:
+            chunk = stream.read(min(_READ_SIZE, length - received))
+            if not chunk:
+                break
+            f.write(chunk)
+            hasher.update(chunk)
+            received += len(chunk)
+        return received
+
+    def _check_header(self, upload_id, meta, part_path):
+        """
+        检查文件头，不是图片时删除会话，通过后记入会话信息，之后不再检查
+        """
+        with open(part_path, 'rb') as f:
+            head = f.read(image_store.SIGNATURE_SIZE)
+        try:
+            image_store.check_image_header(meta['ext'], head)
+        except ValueError as e:
+            self.delete(upload_id)
+            raise UploadError(str(e), 415) from None
+        meta['checked'] = True
+        _, meta_path = self._paths(upload_id)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({k: v for k, v in meta.items() if k != 'offset'}, f, ensure_ascii=False)
+
+    def _complete(self, upload_id, meta, hasher, offset):
+        """
+        将完整的文件移入内容寻址目录，并删除会话
+        """
+        part_path, meta_path = self._paths(upload_id)
+        os.makedirs(image_store.get_store_dir(self.static_folder), exist_ok=True)
+        filename = image_store.store_file(part_path, hasher.hexdigest(), meta['ext'], self.static_folder)
+        os.remove(meta_path)
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+        return {'upload_id': upload_id, 'size': meta['size'], 'offset': offset, 'image': filename}
+
+    def delete(self, upload_id):
+        """
+        取消上传，删除会话文件
+        """
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def cleanup(self):
+        """
+        删除过期未完成的会话
+        """
+        deadline = time.time() - self.expiry
+        try:
+            entries = list(os.scandir(self.upload_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            upload_id, ext = os.path.splitext(entry.name)
+            if ext in ('.part', '.json') and entry.stat().st_mtime < deadline:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+                with self._lock:
+                    self._hashers.pop(upload_id, None)
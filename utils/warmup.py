@@ -0,0 +1,143 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/utils/warmup.py
+Description: 启动预热，在后台线程中创建服务实例并预先加载数据缓存、索引和图片清单，记录各步骤进度供就绪检查使用
+'''
+
+import threading
+import time
+import traceback
+
+
+class WarmUp:
+    """
+    启动预热
+
+    先执行初始化函数（导入数据相关模块并创建类别管理器等服务实例），完成后请求即可正常处理；
+    再依次执行各预热步骤，全部完成后视为就绪。
+    预热步骤只是提前构建缓存，失败时记录错误并继续，缓存会在首次请求时重新构建；
+    初始化失败时服务不可用，就绪检查一直返回失败，由进程管理器重启
+    """
+
+    def __init__(self, init, steps=()):
+        """
+        参数:
+            init (callable): 初始化函数，无参数
+            steps (list): (步骤名, 无参数函数) 列表，按顺序执行
+        """
+        self.init = init
+        self.steps = list(steps)
+        self.initialized = threading.Event()
+        self.ready = threading.Event()
+        self._settled = threading.Event()  # 初始化成功或失败
+        self._lock = threading.Lock()
+        self._thread = None
+        self._started = None
+        self._current = None
+        self._finished = None
+        self._error = None
+        self._results = []
+
+    def start(self):
+        """
+        在后台线程中执行预热
+        """
+        self._thread = threading.Thread(target=self.run, name='warm-up', daemon=True)
+        self._thread.start()
+
+    def run(self):
+        """
+        执行初始化和各预热步骤
+
+        返回:
+            bool: 是否初始化成功
+        """
+        with self._lock:
+            self._started = time.time()
+        if not self._run_step('init', self.init):
+            with self._lock:
+                self._finished = time.time()
+                self._current = None
+            self._settled.set()
+            return False
+        self.initialized.set()
+        self._settled.set()
+
+        for name, func in self.steps:
+            self._run_step(name, func)
+        with self._lock:
+            self._finished = time.time()
+            self._current = None
+        self.ready.set()
+        return True
+
+    def _run_step(self, name, func):
+        """
+        执行单个步骤并记录耗时，返回是否成功
+        """
+        with self._lock:
+            self._current = name
+        started = time.perf_counter()
+        error = None
+        try:
+            func()
+        except Exception as e:
+            traceback.print_exc()
+            error = f'{type(e).__name__}: {e}'
+        result = {'name': name, 'seconds': round(time.perf_counter() - started, 4)}
+        if error:
+            result['error'] = error
+        with self._lock:
+            self._results.append(result)
+            if name == 'init' and error:
+                self._error = error
+        return error is None
+
+    def wait(self, timeout=None):
+        """
+        等待初始化完成
+
+        参数:
+            timeout (float): 最长等待秒数，为None时一直等待
+
+        返回:
+            bool: 是否已初始化，初始化失败时返回False
+        """
+        self._settled.wait(timeout)
+        return self.initialized.is_set()
+
+    def status(self):
+        """
+        获取预热进度
+
+        返回:
+            dict:
+                state (str): pending（未开始）、initializing（初始化中）、warming（预热中）、
+                    ready（就绪）、failed（初始化失败）
+                current (str): 正在执行的步骤
+                steps (list): 已完成的步骤，包含 name、seconds，失败时包含 error
+                elapsed (float): 已用或总耗时秒数
+        """
+        with self._lock:
+            if self._error is not None:
+                state = 'failed'
+            elif self.ready.is_set():
+                state = 'ready'
+            elif self.initialized.is_set():
+                state = 'warming'
+            elif self._started is not None:
+                state = 'initializing'
+            else:
+                state = 'pending'
+            elapsed = None
+            if self._started is not None:
+                elapsed = round((self._finished or time.time()) - self._started, 4)
+            return {
+                'state': state,
+                'current': self._current,
+                'steps': list(self._results),
+                'elapsed': elapsed
+            }
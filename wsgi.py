@@ -0,0 +1,12 @@
+'''
+Author: Leili
+Date: 2025-07-02 11:19:22
+LastEditors: Leili
+LastEditTime: 2025-07-02 11:19:22
+FilePath: /StorageManagement/wsgi.py
+Description: WSGI 入口，供不支持应用工厂写法的服务器使用，如 waitress-serve wsgi:app
+'''
+
+from app import create_app
+
+app = create_app()